@@ -0,0 +1,144 @@
+"""
+Bulk analysis of many URLs at once.
+
+Pasted text (or a text file) is split into URLs that are analysed
+concurrently with a bounded number of yt-dlp processes. Videos are
+collapsed by id across every URL, including the entries of playlists,
+and each result is streamed to a callback as soon as it is ready so the
+combined view fills progressively instead of waiting for the slowest link.
+"""
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import urlnorm
+
+logger = logging.getLogger(__name__)
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+', re.IGNORECASE)
+
+
+def parse_urls(text):
+    """Extracts URLs from free text (one per line, comma or space separated), keeping order."""
+    urls = []
+    for match in URL_RE.finditer(text or ''):
+        url = match.group(0).rstrip('.,;)]')
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def url_key(url):
+    """Key known before fetching ('youtube:<id>', 'youtube:playlist:<id>'), or None."""
+    canonical = urlnorm.canonicalize(url)
+    return f"{canonical[0]}:{canonical[1]}" if canonical else None
+
+
+def entry_key(entry):
+    """Video key of an info dict or flat playlist entry, e.g. 'youtube:<id>'."""
+    vid = entry.get('id')
+    if not vid:
+        return entry.get('url') or entry.get('webpage_url')
+    extractor = entry.get('ie_key') or entry.get('extractor_key') or entry.get('extractor') or ''
+    return f"{extractor.lower()}:{vid}"
+
+
+class BulkAnalyzer:
+    def __init__(self, service, max_workers=4):
+        """
+        service: YtDlpService (uses get_cached / fetch_info)
+        max_workers: max URLs analysed at the same time
+        """
+        self.service = service
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._seen = set()  # Video keys already reported
+        self._executor = None
+        self._cancelled = False
+        self.total = 0
+        self.completed = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    def start(self, urls, on_result, on_finished=None):
+        """
+        Analyses `urls` in the background. For every URL, in completion order:
+        on_result(url, entries, error) with the new (not yet seen) video
+        entries, or error set to a message. on_finished() runs at the end.
+        Callbacks are serialised and run on worker threads.
+        """
+        self.total = len(urls)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        def run():
+            pending = []
+            for url in urls:
+                if self._cancelled:
+                    break
+                key = url_key(url)
+                with self._lock:
+                    if key and key in self._seen:
+                        self.duplicates += 1
+                        self.completed += 1
+                        continue
+                    if key:
+                        self._seen.add(key)  # Claimed before fetching
+                try:
+                    pending.append(self._executor.submit(self._analyse, url, key, on_result))
+                except RuntimeError:
+                    break  # Cancelled while submitting
+            for future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    pass  # Cancelled
+            self._executor.shutdown(wait=False)
+            if on_finished and not self._cancelled:
+                on_finished()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def cancel(self):
+        """Drops URLs not yet analysed and suppresses further callbacks."""
+        self._cancelled = True
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _analyse(self, url, key, on_result):
+        if self._cancelled:
+            return
+        info = self.service.get_cached(url)
+        error = None
+        if info is None:
+            info, error = self.service.fetch_info(url)
+        if info is None:
+            error = error or "Não foi possível carregar o link"
+
+        with self._lock:
+            if self._cancelled:
+                return
+            self.completed += 1
+            if info is None:
+                self.errors += 1
+                logger.error(f"Bulk analysis failed for {url}: {error}")
+                on_result(url, [], error)
+                return
+
+            if info.get('_type') == 'playlist' or info.get('entries'):
+                candidates = [e for e in info.get('entries') or [] if e]
+            else:
+                # Full single-video info: keep a page URL for the download
+                candidates = [dict(info, url=info.get('webpage_url') or url)]
+
+            entries = []
+            for entry in candidates:
+                k = entry_key(entry)
+                if k in self._seen and k != key:
+                    self.duplicates += 1
+                    continue
+                if k:
+                    self._seen.add(k)
+                entries.append(entry)
+            on_result(url, entries, None)
@@ -0,0 +1,219 @@
+"""
+Index of finished downloads, for reuse across playlists.
+
+Overlapping playlists (a compilation and the channel's uploads) list the
+same videos, and every run downloaded them again. Each finished file is
+recorded with the job that produced it (video key + format) and a fast
+content fingerprint: size plus a hash of its first, middle and last chunk
+(xxhash if installed, else blake2b). Before a download starts, the live
+files of the same job are reused, as a set (a section job writes one file
+per section; a set missing a file is downloaded again): they are the
+download if they are already in the destination, otherwise each is
+hard-linked (or copied, across drives) to the same path relative to it, so
+template subfolders are kept. After a download, a file with the same
+content as an indexed one is replaced by a hard link to it, so identical
+videos use the disk once. Lookups go through key and fingerprint maps, not
+a scan of the index.
+"""
+import filecmp
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import output_paths
+
+try:
+    import xxhash
+except ImportError:  # Optional: blake2b is slower but always available
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_BYTES = 1024 * 1024  # Hashed at the start, middle and end of each file
+
+
+def fingerprint(path):
+    """'size:hash' of a file from three sampled chunks (whole file if smaller than three)."""
+    size = os.path.getsize(path)
+    h = xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= 3 * SAMPLE_BYTES:
+            h.update(f.read())
+        else:
+            for offset in (0, (size - SAMPLE_BYTES) // 2, size - SAMPLE_BYTES):
+                f.seek(offset)
+                h.update(f.read(SAMPLE_BYTES))
+    return f"{size}:{h.hexdigest()}"
+
+
+def job_key(url_key, quality, codec, is_audio, sections=None, normalize=False, transcode=False):
+    """Index key of a download: the same video (or sections of it) in the same format, whatever the folder or file name."""
+    key = (f"{url_key}|{'audio' if is_audio else 'video'}|{quality}|{codec}" + ("|loudnorm" if normalize else "")
+           + ("|transcode" if transcode else ""))
+    return f"{key}|{','.join(sections)}" if sections else key
+
+
+def link_or_copy(src, dst):
+    """Places src at dst (a free variant of it) as a hard link, or a copy where links are unsupported."""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    final = output_paths.reserve_path(dst)
+    tmp = os.path.join(os.path.dirname(final), f".{os.path.basename(final)}.linking")
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)  # Other drive / FAT
+        os.replace(tmp, final)
+    except OSError:
+        for path in (tmp, final):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return final
+
+
+class DedupIndex:
+    def __init__(self, index_path):
+        self._path = index_path
+        self._lock = threading.Lock()
+        self._files = self._load()  # abs path -> {'key', 'fp', 'size', 'mtime', 'root', 'count'}
+        self._keys = {}  # job key -> {abs paths}
+        self._fps = {}  # fingerprint -> {abs paths}
+        for path, entry in self._files.items():
+            self._keys.setdefault(entry['key'], set()).add(path)
+            self._fps.setdefault(entry['fp'], set()).add(path)
+
+    def find(self, key):
+        """A live indexed file for this job key, else None (stale entries are dropped)."""
+        found = self.find_all(key)
+        return next(iter(found.values()))[0] if found else None
+
+    def find_all(self, key):
+        """
+        Complete sets of live files for this job key, as {destination folder: [paths]}.
+        A job can write several files (one per section); a set missing any of them is
+        left out, so it is downloaded again rather than reused in part.
+        """
+        groups = {}
+        with self._lock:
+            dropped = False
+            for path in sorted(self._keys.get(key, ())):
+                entry = self._files[path]
+                if not self._live(path, entry):
+                    dropped = True
+                    continue
+                if 'count' in entry:  # Indexed before sets were recorded: size of its set unknown
+                    groups.setdefault(entry['root'], []).append(path)
+            if dropped:
+                self._save()
+            return {root: paths for root, paths in groups.items() if len(paths) == self._files[paths[0]]['count']}
+
+    def reuse(self, key, output_path):
+        """
+        Makes the files of a previous identical download available in
+        output_path, at the same paths relative to it (template subfolders).
+        Returns their paths there, or None if there is no complete set.
+        """
+        found = self.find_all(key)
+        if not found:
+            return None
+        folder = os.path.abspath(output_path)
+        if folder in found:
+            logger.info(f"Already downloaded: {found[folder]}")
+            return found[folder]
+        root, existing = next(iter(found.items()))
+        placed = []
+        try:
+            for path in existing:
+                placed.append(link_or_copy(path, os.path.join(folder, os.path.relpath(path, root))))
+        except OSError as e:
+            logger.warning(f"Could not reuse {existing}: {e}")
+            for path in placed:
+                os.remove(path)
+            return None
+        logger.info(f"Reused {existing} -> {placed}")
+        self.record(key, placed, folder)
+        return placed
+
+    def record(self, key, paths, root=None):
+        """
+        Indexes the freshly finished files of one job, written into the
+        `root` folder (default: each file's own folder). A file whose content
+        is already indexed under another path becomes a hard link to it.
+        Returns the paths.
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        entries = {}
+        for path in paths:
+            try:
+                fp = fingerprint(path)
+            except OSError as e:
+                logger.warning(f"Could not index {path}: {e}")
+                continue
+            with self._lock:
+                twin = next((p for p in sorted(self._fps.get(fp, ())) if p != path and self._live(p, self._files[p])),
+                            None)
+            if twin and not os.path.samefile(twin, path) and filecmp.cmp(twin, path, shallow=False):
+                tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.linking")
+                try:
+                    os.link(twin, tmp)
+                    os.replace(tmp, path)
+                    logger.info(f"{path} has the same content as {twin}, hard-linked")
+                except OSError:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)  # Other drive / FAT: keep both copies
+            stat = os.stat(path)
+            entries[path] = {'key': key, 'fp': fp, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                             'root': os.path.abspath(root) if root else os.path.dirname(path)}
+        with self._lock:
+            # The new set replaces an older one of the same job in the same folder
+            roots = {entry['root'] for entry in entries.values()}
+            for path in list(self._keys.get(key, ())):
+                if self._files[path].get('root') in roots:
+                    self._forget(path)
+            for path, entry in entries.items():
+                entry['count'] = len(paths)  # A file that could not be indexed leaves the set incomplete
+                self._forget(path)
+                self._files[path] = entry
+                self._keys.setdefault(key, set()).add(path)
+                self._fps.setdefault(entry['fp'], set()).add(path)
+            if entries:
+                self._save()
+        return paths
+
+    def _live(self, path, entry):
+        """Still there and unchanged (size and mtime as indexed); stale entries are dropped (caller saves)."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat and stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            return True
+        self._forget(path)
+        return False
+
+    def _forget(self, path):
+        entry = self._files.pop(path, None)
+        if entry:
+            self._keys.get(entry['key'], set()).discard(path)
+            self._fps.get(entry['fp'], set()).discard(path)
+
+    def _load(self):
+        try:
+            with open(self._path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp = self._path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._files, f)
+            os.replace(tmp, self._path)
+        except OSError as e:
+            logger.error(f"Failed to save download index: {e}")
@@ -0,0 +1,322 @@
+"""
+Page-independent download manager.
+
+Owns one worker pool, one priority queue and one bandwidth budget for the
+whole application. Single videos and playlists from any analysis are
+submitted as tasks; screens subscribe to task updates instead of owning
+the download threads, so analysing a new link never disturbs running jobs.
+"""
+import itertools
+import logging
+import threading
+import time
+
+from download_queue import DownloadQueue
+from logging_setup import job_context
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadTask:
+    QUEUED = 'queued'
+    DOWNLOADING = 'downloading'
+    PROCESSING = 'processing'
+    RETRYING = 'retrying'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+    def __init__(self, task_id, url, output_path, quality, codec, is_audio, title='', group=None, **options):
+        self.id = task_id
+        self.url = url
+        self.output_path = output_path
+        self.quality = quality
+        self.codec = codec
+        self.is_audio = is_audio
+        # Keyword options for service.download (template, sections, format_id, ...; see ytdlp_service.DownloadJob)
+        self.options = options
+        self.conversion = None  # How the output was made once done: 'direct', 'remux' or 'transcode'
+        self.title = title or url
+        self.group = group
+        self.status = DownloadTask.QUEUED
+        self.progress = 0.0  # 0..1 of the current attempt
+        self.percent_str = ''
+        self.speed_str = ''
+        self.total_str = ''
+        self.message = ''
+        self.attempts = 0
+        self.job_id = None
+        self.submitted_at = time.monotonic()
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in DownloadTask.FINISHED
+
+    def __repr__(self):
+        return f"DownloadTask({self.id}, {self.status}, {self.title!r})"
+
+
+class DownloadManager:
+    def __init__(self, service, max_workers=3, bandwidth_limit=None, max_retries=3, retry_base_delay=2.0, metrics=None):
+        """
+        service: YtDlpService used for the actual downloads
+        max_workers: size of the shared worker pool
+        bandwidth_limit: total bytes/s shared by all workers (None = unlimited)
+        metrics: MetricsRegistry for queue wait, retries and utilisation (metrics.REGISTRY by default)
+        """
+        self.service = service
+        self.max_workers = max_workers
+        self.bandwidth_limit = bandwidth_limit
+        self.metrics = metrics or REGISTRY
+
+        self._queue = DownloadQueue(max_retries=max_retries, base_delay=retry_base_delay)
+        self._lock = threading.RLock()
+        self._tasks = {}  # task_id -> DownloadTask (submission order)
+        self._ids = itertools.count(1)
+        self._listeners = []
+        self._running = 0  # Live worker threads
+        self._busy = 0  # Workers currently downloading
+        self._report_utilisation()
+
+    # --- Configuration ---
+
+    def set_max_workers(self, n):
+        with self._lock:
+            self.max_workers = max(1, int(n))
+            self._report_utilisation()
+            self._ensure_workers()
+
+    def set_bandwidth_limit(self, bytes_per_sec):
+        """Applies to downloads started after the change."""
+        self.bandwidth_limit = bytes_per_sec or None
+
+    def per_task_rate_limit(self):
+        """Each worker gets an equal share, so the total never exceeds the budget."""
+        if not self.bandwidth_limit:
+            return None
+        return max(1, int(self.bandwidth_limit / self.max_workers))
+
+    # --- Listeners ---
+
+    def subscribe(self, listener):
+        """listener(task) is called on a worker thread for every task change."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, task):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(task)
+            except Exception as e:
+                logger.error(f"Download listener failed: {e}")
+
+    # --- Submission & control ---
+
+    def submit(self, url, output_path, quality, codec, is_audio, title='', group=None, priority=None, **options):
+        """
+        Queues a download. options: keyword options passed on to service.download
+        (see ytdlp_service.DownloadJob); the rate limit is the manager's (bandwidth_limit).
+        """
+        if 'rate_limit' in options:
+            raise TypeError("rate_limit is set by the manager (bandwidth_limit)")
+        with self._lock:
+            task = DownloadTask(next(self._ids), url, output_path, quality, codec, is_audio, title, group, **options)
+            self._tasks[task.id] = task
+            # Default priority keeps submission order across all screens
+            job = self._queue.push(task, priority=task.id if priority is None else priority)
+            task.job_id = job.id
+            self._ensure_workers()
+        self._notify(task)
+        return task
+
+    def move_to_front(self, task):
+        return self._queue.move_to_front(task.job_id)
+
+    def pause(self):
+        self._queue.pause()
+
+    def resume(self):
+        self._queue.resume()
+        with self._lock:
+            self._ensure_workers()
+
+    def is_paused(self):
+        return self._queue.is_paused()
+
+    def cancel(self, task):
+        """Cancels a queued or running task."""
+        if task.finished:
+            return
+        if self._queue.remove(task.job_id):
+            # Never started (or waiting for a retry)
+            task.cancel_event.set()
+            task.status = DownloadTask.CANCELLED
+            task.message = "Cancelado pelo usuário"
+            self._notify(task)
+        else:
+            # Running: kill its process; the worker reports the cancel
+            self.service.terminate(task.cancel_event)
+
+    def cancel_group(self, group):
+        for task in self.tasks(group):
+            self.cancel(task)
+
+    def cancel_all(self):
+        for task in self.tasks():
+            self.cancel(task)
+
+    def clear_finished(self):
+        with self._lock:
+            finished = [t for t in self._tasks.values() if t.finished]
+            for task in finished:
+                del self._tasks[task.id]
+        for task in finished:
+            self._queue.forget(task.job_id)  # The app runs for days: finished jobs must not pile up
+
+    # --- Queries ---
+
+    def tasks(self, group=None):
+        with self._lock:
+            return [t for t in self._tasks.values() if group is None or t.group == group]
+
+    def groups(self):
+        """Group names in submission order."""
+        with self._lock:
+            return list(dict.fromkeys(t.group for t in self._tasks.values()))
+
+    def group_summary(self, group):
+        """Returns dict(total, done, failed, cancelled, active, progress)."""
+        tasks = self.tasks(group)
+        summary = {'total': len(tasks), 'done': 0, 'failed': 0, 'cancelled': 0, 'active': 0, 'progress': 0.0}
+        progress = 0.0
+        for t in tasks:
+            if t.status == DownloadTask.DONE:
+                summary['done'] += 1
+                progress += 1
+            elif t.status == DownloadTask.FAILED:
+                summary['failed'] += 1
+                progress += 1
+            elif t.status == DownloadTask.CANCELLED:
+                summary['cancelled'] += 1
+                progress += 1
+            else:
+                summary['active'] += 1
+                progress += t.progress
+        summary['progress'] = progress / len(tasks) if tasks else 0.0
+        return summary
+
+    def utilisation(self):
+        """(busy workers, pool size)."""
+        with self._lock:
+            return self._busy, self.max_workers
+
+    def _report_utilisation(self):
+        self.metrics.set_gauge('workers_busy', self._busy)
+        self.metrics.set_gauge('workers_max', self.max_workers)
+
+    # --- Workers ---
+
+    def _ensure_workers(self):
+        while self._running < self.max_workers and self._running < len(self._queue):
+            self._running += 1
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if self._running > self.max_workers:
+                    # Pool was shrunk
+                    self._running -= 1
+                    return
+            job = self._queue.get(timeout=1.0)
+            if job is None:
+                with self._lock:
+                    if len(self._queue) == 0:
+                        self._running -= 1
+                        return
+                continue  # Paused or waiting for a retry
+            with self._lock:
+                self._busy += 1
+                self._report_utilisation()
+            try:
+                with job_context(job.payload.id):
+                    self._run(job)
+            except Exception as e:
+                logger.error(f"Download worker exception: {e}")
+                self._queue.mark_failed(job, str(e), transient=False)
+                # Finish the task too: listeners wait for every task of a group to finish
+                task = job.payload
+                task.status = DownloadTask.FAILED
+                task.message = str(e)
+                task.speed_str = ''
+                self._notify(task)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._report_utilisation()
+
+    def _run(self, job):
+        task = job.payload
+        if task.cancel_event.is_set():
+            self._queue.mark_failed(job, "Cancelado pelo usuário", transient=False)
+            task.status = DownloadTask.CANCELLED
+            self._notify(task)
+            return
+
+        task.attempts = job.attempts
+        if job.attempts == 1:
+            self.metrics.observe('queue_wait_seconds', time.monotonic() - task.submitted_at)
+            self.metrics.job_field('url', task.url)
+        self.metrics.job_field('attempts', job.attempts)
+        task.status = DownloadTask.DOWNLOADING
+        task.progress = 0.0
+        self._notify(task)
+
+        def hook(d):
+            if d.get('status') == 'downloading':
+                p = d.get('_percent_str', '').replace('%', '')
+                try:
+                    task.progress = float(p) / 100 if p else task.progress
+                except ValueError:
+                    pass
+                task.percent_str = p
+                task.speed_str = d.get('_speed_str', '')
+                task.total_str = d.get('_total_bytes_str', '')
+            elif d.get('status') == 'processing':
+                task.status = DownloadTask.PROCESSING
+                task.conversion = d.get('conversion', task.conversion)
+            self._notify(task)
+
+        success, msg = self.service.download(
+            task.url, task.output_path, task.quality, task.codec, task.is_audio, hook,
+            cancel_event=task.cancel_event, rate_limit=self.per_task_rate_limit(), **task.options
+        )
+        task.message = msg
+        task.speed_str = ''
+
+        if success:
+            self._queue.mark_done(job)
+            task.status = DownloadTask.DONE
+            task.progress = 1.0
+        elif task.cancel_event.is_set():
+            self._queue.mark_failed(job, msg, transient=False)
+            task.status = DownloadTask.CANCELLED
+        elif self._queue.mark_failed(job, msg):
+            task.status = DownloadTask.RETRYING
+            self.metrics.inc('retries_total')
+            logger.info(f"Task {task.id} failed (attempt {job.attempts}), retrying: {msg}")
+        else:
+            task.status = DownloadTask.FAILED
+            logger.error(f"Task {task.id} failed after {job.attempts} attempt(s): {msg}")
+        self._notify(task)
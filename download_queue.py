@@ -0,0 +1,276 @@
+"""
+Priority job queue for downloads.
+
+Jobs are handed to worker threads by priority (lower first, FIFO among
+equals). The queue can be paused, jobs can be reprioritised or moved to
+the front, and transient failures are retried with exponential backoff
+and jitter. All queue operations are O(log n): reprioritising pushes a
+new heap item and the stale one is skipped when popped.
+"""
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+
+# Errors worth retrying (network hiccups, throttling, server errors)
+TRANSIENT_ERROR_RE = re.compile(
+    r'timed? ?out|connection (reset|refused|aborted)|temporary failure|network is unreachable'
+    r'|http error (403|429|5\d\d)|too many requests|remote end closed|incomplete ?read|unable to download'
+    r'|download travado',  # Stalled even after restarts (see ytdlp_service.StallWatchdog)
+    re.IGNORECASE
+)
+# Errors that will fail again no matter how often we retry
+PERMANENT_ERROR_RE = re.compile(
+    r'private video|video unavailable|not available|has been removed|copyright|sign in to confirm your age'
+    r'|unsupported url|http error (400|401|404|410)|cancelado',
+    re.IGNORECASE
+)
+
+
+def is_transient(error):
+    """Classifies a failure message as worth retrying or not."""
+    if not error or PERMANENT_ERROR_RE.search(error):
+        return False
+    return bool(TRANSIENT_ERROR_RE.search(error))
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    WAITING_RETRY = 'waiting_retry'
+    DONE = 'done'
+    FAILED = 'failed'
+    REMOVED = 'removed'
+
+    def __init__(self, job_id, payload, priority):
+        self.id = job_id
+        self.payload = payload
+        self.priority = priority
+        self.state = Job.QUEUED
+        self.attempts = 0
+        self.last_error = None
+        self.retry_at = None
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.state}, priority={self.priority}, attempts={self.attempts})"
+
+
+class DownloadQueue:
+    def __init__(self, max_retries=3, base_delay=2.0, max_delay=60.0):
+        """
+        max_retries: retries per job after the first attempt
+        base_delay / max_delay: backoff bounds in seconds
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._ready = []  # (priority, seq, job_id)
+        self._delayed = []  # (retry_at, seq, job_id)
+        self._jobs = {}  # job_id -> Job
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._front = itertools.count(-1, -1)  # Priorities for move_to_front
+        self._paused = False
+        self._closed = False
+        self._unfinished = 0  # Queued, running or waiting for a retry
+
+    # --- Producer side ---
+
+    def push(self, payload, priority=0):
+        with self._cond:
+            job = Job(next(self._ids), payload, priority)
+            self._jobs[job.id] = job
+            self._unfinished += 1
+            self._push_ready(job)
+            self._cond.notify()
+            return job
+
+    def set_priority(self, job_id, priority):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state != Job.QUEUED:
+                return False
+            job.priority = priority
+            self._push_ready(job)
+            return True
+
+    def move_to_front(self, job_id):
+        """Makes a queued job the next one handed out."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state not in (Job.QUEUED, Job.WAITING_RETRY):
+                return False
+            job.priority = next(self._front)
+            if job.state == Job.WAITING_RETRY:
+                job.state = Job.QUEUED  # Skip the remaining backoff
+                job.retry_at = None
+            self._push_ready(job)
+            self._cond.notify()
+            return True
+
+    def remove(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state not in (Job.QUEUED, Job.WAITING_RETRY):
+                return False
+            job.state = Job.REMOVED
+            self._finish_one()
+            return True
+
+    def forget(self, job_id):
+        """Drops a finished (done, failed or removed) job from the queue's records. Returns True if dropped."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state not in (Job.DONE, Job.FAILED, Job.REMOVED):
+                return False
+            del self._jobs[job_id]  # Stale heap items of it are skipped when popped
+            return True
+
+    def pause(self):
+        """Stops handing out jobs; running jobs are not affected."""
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def is_paused(self):
+        return self._paused
+
+    def close(self):
+        """Drops pending jobs and releases blocked workers."""
+        with self._cond:
+            self._closed = True
+            for job in self._jobs.values():
+                if job.state in (Job.QUEUED, Job.WAITING_RETRY):
+                    job.state = Job.REMOVED
+                    self._finish_one()
+            self._ready.clear()
+            self._delayed.clear()
+            self._cond.notify_all()
+
+    # --- Worker side ---
+
+    def get(self, timeout=None):
+        """
+        Blocks until a job is ready and returns it (state RUNNING).
+        Returns None when the queue is closed, drained, or on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                self._promote_due()
+                if not self._paused:
+                    job = self._pop_ready()
+                    if job:
+                        job.state = Job.RUNNING
+                        job.attempts += 1
+                        return job
+                if self._unfinished == 0:
+                    return None
+
+                # Sleep until something changes or the next retry is due
+                wait = None
+                if self._delayed and not self._paused:
+                    wait = max(0, self._delayed[0][0] - time.monotonic())
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def mark_done(self, job):
+        with self._cond:
+            job.state = Job.DONE
+            job.last_error = None
+            self._finish_one()
+
+    def mark_failed(self, job, error, transient=None):
+        """
+        Records a failed attempt. Transient failures are re-queued with
+        backoff until max_retries is reached. Returns True if retried.
+        """
+        if transient is None:
+            transient = is_transient(error)
+        with self._cond:
+            job.last_error = error
+            if self._closed or not transient or job.attempts > self.max_retries:
+                job.state = Job.FAILED
+                self._finish_one()
+                return False
+            delay = self.backoff(job.attempts)
+            job.state = Job.WAITING_RETRY
+            job.retry_at = time.monotonic() + delay
+            heapq.heappush(self._delayed, (job.retry_at, next(self._seq), job.id))
+            self._cond.notify()
+            return True
+
+    def backoff(self, attempt):
+        """Exponential backoff for attempt n (1-based), jittered between half and the full delay."""
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(cap / 2, cap)
+
+    def join(self, timeout=None):
+        """Waits until every job is done, failed or removed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._unfinished > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    # --- Reporting ---
+
+    def failures(self):
+        """Jobs that failed permanently, in submission order."""
+        with self._cond:
+            return [j for j in self._jobs.values() if j.state == Job.FAILED]
+
+    def stats(self):
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+            return counts
+
+    def __len__(self):
+        return self._unfinished
+
+    # --- Internals (call with the condition held) ---
+
+    def _push_ready(self, job):
+        heapq.heappush(self._ready, (job.priority, next(self._seq), job.id))
+
+    def _pop_ready(self):
+        while self._ready:
+            priority, _, job_id = heapq.heappop(self._ready)
+            job = self._jobs.get(job_id)
+            # Skip stale items (reprioritised, removed, already running, forgotten)
+            if job and job.state == Job.QUEUED and job.priority == priority:
+                return job
+        return None
+
+    def _promote_due(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            retry_at, _, job_id = heapq.heappop(self._delayed)
+            job = self._jobs.get(job_id)
+            if job and job.state == Job.WAITING_RETRY and job.retry_at == retry_at:
+                job.state = Job.QUEUED
+                job.retry_at = None
+                self._push_ready(job)
+
+    def _finish_one(self):
+        self._unfinished -= 1
+        self._cond.notify_all()
@@ -0,0 +1,178 @@
+"""
+Background metadata enrichment for flat playlist entries.
+
+`--flat-playlist` entries lack formats, thumbnails and sometimes durations.
+MetadataEnricher resolves them in batches (one yt-dlp process per batch),
+with a global concurrency cap and a minimum interval between requests to
+the same host. Pending URLs live in a priority queue so the rows the user
+is looking at are resolved first.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+def host_of(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+class MetadataEnricher:
+    def __init__(self, service, max_workers=4, batch_size=8, host_interval=1.0, coalesce=0.05):
+        """
+        service: YtDlpService (uses get_cached / get_info_batch)
+        max_workers: max concurrent batches (yt-dlp processes)
+        batch_size: max URLs resolved by one yt-dlp process
+        host_interval: min seconds between batch starts on the same host
+        coalesce: min wait before building a batch, so requests queued in
+                  quick succession share one process
+        """
+        self.service = service
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.host_interval = host_interval
+        self.coalesce = coalesce
+
+        self._lock = threading.Lock()
+        self._heap = []  # (priority, seq, url)
+        self._priority = {}  # url -> current priority (stale heap items are skipped)
+        self._callbacks = {}  # url -> [callback(url, info)]
+        self._seq = itertools.count()
+        self._front = itertools.count(-1, -1)  # Decreasing priorities for prioritize()
+        self._next_slot = {}  # host -> earliest start time of next batch
+        self._running = 0  # Live worker threads
+        self._stopped = False
+
+    # --- Public API ---
+
+    def request(self, url, callback, priority=0):
+        """Queues `url` for enrichment. callback(url, info) runs on a worker thread (info may be None)."""
+        cached = self.service.get_cached(url)
+        if cached is not None:
+            callback(url, cached)
+            return
+
+        with self._lock:
+            self._callbacks.setdefault(url, []).append(callback)
+            if url not in self._priority or priority < self._priority[url]:
+                self._push(url, priority)
+            self._ensure_workers()
+
+    def prioritize(self, urls):
+        """Moves pending `urls` to the front of the queue, keeping their order."""
+        with self._lock:
+            front = [next(self._front) for _ in urls]
+            for url, priority in zip(urls, sorted(front)):
+                if url in self._priority:
+                    self._push(url, priority)
+
+    def clear(self):
+        """Drops all pending requests (in-flight batches still complete)."""
+        with self._lock:
+            self._heap.clear()
+            self._priority.clear()
+            self._callbacks.clear()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._heap.clear()
+            self._priority.clear()
+            self._callbacks.clear()
+
+    def pending(self):
+        with self._lock:
+            return len(self._priority)
+
+    # --- Internals (call with lock held) ---
+
+    def _push(self, url, priority):
+        self._priority[url] = priority
+        heapq.heappush(self._heap, (priority, next(self._seq), url))
+
+    def _pop(self):
+        """Pops the best live (url, priority), skipping stale heap items."""
+        while self._heap:
+            priority, _, url = heapq.heappop(self._heap)
+            if self._priority.get(url) == priority:
+                del self._priority[url]
+                return url, priority
+        return None, None
+
+    def _ensure_workers(self):
+        while self._running < self.max_workers and self._running < len(self._priority):
+            self._running += 1
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _peek(self):
+        """Returns the best live URL without removing it."""
+        while self._heap:
+            priority, _, url = self._heap[0]
+            if self._priority.get(url) == priority:
+                return url
+            heapq.heappop(self._heap)
+        return None
+
+    def _next_batch(self, host):
+        """Pops up to batch_size queued URLs of `host`, in priority order."""
+        batch = []
+        skipped = []
+        while len(batch) < self.batch_size:
+            url, priority = self._pop()
+            if url is None:
+                break
+            if host_of(url) == host:
+                batch.append(url)
+            else:
+                skipped.append((url, priority))
+        # Other hosts keep their place in the queue
+        for url, priority in skipped:
+            self._push(url, priority)
+        return batch
+
+    def _reserve_slot(self, host):
+        """Reserves the next politeness slot for `host`; returns the wait in seconds."""
+        now = time.monotonic()
+        start = max(now + self.coalesce, self._next_slot.get(host, 0))
+        self._next_slot[host] = start + self.host_interval
+        return start - now
+
+    # --- Worker ---
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                url = None if self._stopped else self._peek()
+                if url is None:
+                    # Idle workers exit; request() starts new ones on demand
+                    self._running -= 1
+                    return
+                host = host_of(url)
+                wait = self._reserve_slot(host)
+
+            time.sleep(wait)
+
+            # The queue may have been reordered or cleared while waiting
+            with self._lock:
+                batch = self._next_batch(host)
+                callbacks = {url: self._callbacks.pop(url, []) for url in batch}
+            if not batch:
+                continue
+
+            try:
+                results = self.service.get_info_batch(batch)
+            except Exception as e:
+                logger.error(f"Enrichment batch failed ({host}): {e}")
+                results = {}
+
+            for url in batch:
+                info = results.get(url)
+                for cb in callbacks.get(url, []):
+                    try:
+                        cb(url, info)
+                    except Exception as e:
+                        logger.error(f"Enrichment callback failed for {url}: {e}")
@@ -0,0 +1,114 @@
+"""
+Download size estimation based on real yt-dlp format metadata.
+
+Mirrors the format selectors used by YtDlpService.download so the
+estimate reflects the streams that will actually be fetched.
+"""
+import re
+
+# Max video height per quality level (None = unlimited)
+VIDEO_MAX_HEIGHT = {'high': None, 'medium': 720, 'low': 480}
+
+# Fallback bitrates (kbps) when a source has no usable format data
+FALLBACK_AUDIO_KBPS = {'high': 320, 'medium': 192, 'low': 128}
+FALLBACK_VIDEO_KBPS = {'high': 4500 + 128, 'medium': 2500 + 128, 'low': 1000 + 128}
+
+# Extra room required on disk (merges briefly keep both streams + output)
+DISK_SAFETY_MARGIN = 1.1
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none')
+
+
+def _has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def format_bytes(fmt, duration=None):
+    """Size in bytes of a single format, or None if it can't be determined."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    # tbr is in kbps; fall back to vbr + abr when only the parts are known
+    tbr = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * float(duration))
+    return None
+
+
+def pick_formats(formats, is_audio, quality, prefer=None):
+    """
+    Picks the formats yt-dlp would select for our quality selectors.
+    yt-dlp lists formats from worst to best, so the last match wins.
+    prefer: (vcodec, acodec) patterns of the codec-aware presets (format_plan.preferred), tried first
+    """
+    if not formats:
+        return []
+
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    combined = [f for f in formats if _has_audio(f) and _has_video(f)]
+    if prefer:
+        audio_pref = [f for f in audio_only if codec_matches(prefer[1], f.get('acodec'))]
+
+    if is_audio:
+        # bestaudio[acodec~=...]/bestaudio/best
+        if prefer and audio_pref:
+            return [audio_pref[-1]]
+        if audio_only:
+            return [audio_only[-1]]
+        return [combined[-1]] if combined else []
+
+    # bestvideo[height<=N]+bestaudio/best
+    max_h = VIDEO_MAX_HEIGHT.get(quality)
+    video_only = [
+        f for f in formats
+        if _has_video(f) and not _has_audio(f)
+        and (max_h is None or (f.get('height') or 0) <= max_h)
+    ]
+    if prefer:
+        # bestvideo[vcodec~=...]+bestaudio[acodec~=...], before the plain selector
+        video_pref = [f for f in video_only if codec_matches(prefer[0], f.get('vcodec'))]
+        if video_pref and audio_pref:
+            return [video_pref[-1], audio_pref[-1]]
+    if video_only and audio_only:
+        return [video_only[-1], audio_only[-1]]
+    return [combined[-1]] if combined else []
+
+
+def codec_matches(pattern, codec):
+    """True if a yt-dlp vcodec / acodec ('avc1.64001F') starts with one of pattern's alternatives."""
+    return bool(codec) and re.match(f"(?:{pattern})", codec, re.IGNORECASE) is not None
+
+
+def fallback_bytes(duration, is_audio, quality):
+    """Rough size from assumed bitrates. Returns 0 without a duration."""
+    if not duration:
+        return 0
+    table = FALLBACK_AUDIO_KBPS if is_audio else FALLBACK_VIDEO_KBPS
+    rate = table.get(quality, table['low'])
+    return int(rate * 1000 / 8 * float(duration))
+
+
+def estimate_bytes(info, is_audio, quality, prefer=None):
+    """
+    Estimates the download size of an info dict.
+    Returns (bytes, exact) where exact is False when the value came from
+    the bitrate fallback (e.g. flat playlist entries without formats).
+    prefer: codec preference of the preset, as in pick_formats
+    """
+    duration = info.get('duration')
+    chosen = pick_formats(info.get('formats'), is_audio, quality, prefer)
+    if chosen:
+        sizes = [format_bytes(f, duration) for f in chosen]
+        if all(s is not None for s in sizes):
+            return sum(sizes), True
+    return fallback_bytes(duration, is_audio, quality), False
+
+
+def has_format_data(info):
+    return bool(info.get('formats'))
+
+
+def mb(num_bytes):
+    return (num_bytes or 0) / (1024 * 1024)
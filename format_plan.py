@@ -0,0 +1,164 @@
+"""
+Format plans: the concrete formats a download will fetch.
+
+Every playlist item used to hand yt-dlp the same selector (e.g.
+'bestvideo[height<=720]+bestaudio/best'), and each process evaluated it again
+against the formats it had just extracted. The playlist screen already
+fetches full metadata for its rows in batches (MetadataEnricher), so the
+choice is made here once per item, before the download starts: the row shows
+exactly what will be fetched, and the worker receives explicit format ids.
+
+The selector stays behind the ids as a fallback ('137+140/<selector>'), so a
+format that disappeared since the metadata was fetched does not fail the job.
+
+Presets are codec-aware: yt-dlp merges by copying the streams, so the pair it
+picks decides whether the output is a remux into the chosen container or
+needs an encode. By default the selectors prefer streams the container holds
+as they are (H.264 + AAC for mp4, VP9/AV1 + Opus for webm/mkv; AAC for m4a)
+and fall back to the plain quality selector. transcode=True is the opt-in
+"max quality" mode: the best streams whatever their codec, re-encoded to the
+container when they do not fit it.
+"""
+import os
+
+import estimator
+
+AUDIO_SELECTOR = "bestaudio/best"
+VIDEO_HEIGHTS = {'high': '', 'medium': '[height<=720]', 'low': '[height<=480]'}
+# -f per quality (estimator.pick_formats mirrors these)
+VIDEO_SELECTORS = {quality: f"bestvideo{height}+bestaudio/best" for quality, height in VIDEO_HEIGHTS.items()}
+# Streams each container holds without re-encoding: (vcodec, acodec) patterns, matched at the start
+CONTAINER_CODECS = {
+    'mp4': ('avc1|avc3|h264', 'mp4a|aac'),
+    'webm': ('vp0?9|av01', 'opus|vorbis'),
+    'mkv': ('vp0?9|av01', 'opus|vorbis'),  # Holds anything; prefers the same open codecs as webm
+}
+AUDIO_CODECS = {'m4a': 'mp4a|aac', 'mp3': 'mp3'}  # wav is always decoded to PCM
+# File extensions whose audio is already AAC (yt-dlp copies it into .m4a instead of encoding)
+AAC_EXTS = ('m4a', 'mp4', 'aac')
+
+# Short codec names for the rows (prefix of yt-dlp's vcodec / acodec)
+CODEC_NAMES = {
+    'avc1': 'H.264', 'avc3': 'H.264', 'h264': 'H.264', 'hev1': 'H.265', 'hvc1': 'H.265', 'vp09': 'VP9', 'vp9': 'VP9',
+    'vp8': 'VP8', 'av01': 'AV1', 'mp4a': 'AAC', 'aac': 'AAC', 'opus': 'Opus', 'vorbis': 'Vorbis', 'mp3': 'MP3',
+}
+
+
+def preferred(codec, is_audio, transcode=False):
+    """(vcodec, acodec) patterns the presets prefer for this output codec, or None (no preference)."""
+    if transcode:
+        return None
+    if is_audio:
+        return (None, AUDIO_CODECS[codec]) if codec in AUDIO_CODECS else None
+    return CONTAINER_CODECS.get(codec)
+
+
+def fits(codec, is_audio, vcodec, acodec):
+    """True if these streams go into the output codec / container without an encode."""
+    if is_audio:
+        return codec in AUDIO_CODECS and estimator.codec_matches(AUDIO_CODECS[codec], acodec)
+    if codec == 'mkv':
+        return True
+    patterns = CONTAINER_CODECS.get(codec)
+    if not patterns:
+        return False
+    return ((not vcodec or estimator.codec_matches(patterns[0], vcodec))
+            and (not acodec or estimator.codec_matches(patterns[1], acodec)))
+
+
+def video_selector(quality, codec, transcode=False):
+    """-f for a video quality: container-compatible streams first, then any (None for an unknown quality)."""
+    if quality not in VIDEO_SELECTORS:
+        return None
+    prefer = preferred(codec, False, transcode)
+    if not prefer:
+        return VIDEO_SELECTORS[quality]
+    return (f"bestvideo{VIDEO_HEIGHTS[quality]}[vcodec~='^({prefer[0]})']+bestaudio[acodec~='^({prefer[1]})']"
+            f"/{VIDEO_SELECTORS[quality]}")
+
+
+def audio_selector(codec, transcode=False):
+    """-f for audio: a stream already in the target codec first, then the best one."""
+    prefer = preferred(codec, True, transcode)
+    return f"bestaudio[acodec~='^({prefer[1]})']/{AUDIO_SELECTOR}" if prefer else AUDIO_SELECTOR
+
+
+def plan(info, is_audio, quality, codec=None, transcode=False):
+    """
+    The formats yt-dlp would pick for this quality, from the item's metadata.
+    codec / transcode: output codec and mode, as for the selectors (codec=None: no codec preference).
+    Returns dict(format_id, height, vcodec, acodec, bytes, conversion), or None without format data;
+    conversion is the expected 'remux' or 'transcode' (None without a codec).
+    """
+    prefer = preferred(codec, is_audio, transcode) if codec else None
+    chosen = estimator.pick_formats(info.get('formats'), is_audio, quality, prefer)
+    if not chosen or any(not f.get('format_id') for f in chosen):
+        return None
+    video = next((f for f in chosen if f.get('vcodec') not in (None, 'none')), None)
+    audio = next((f for f in chosen if f.get('acodec') not in (None, 'none')), None)
+    sizes = [estimator.format_bytes(f, info.get('duration')) for f in chosen]
+    vcodec = video.get('vcodec') if video else None
+    acodec = audio.get('acodec') if audio else None
+    conversion = None
+    if codec:
+        # Without transcode, video is merged by copying even into a container that does not fit
+        copied = fits(codec, is_audio, vcodec, acodec) or (not is_audio and not transcode)
+        conversion = 'remux' if copied else 'transcode'
+    return {
+        'format_id': '+'.join(f['format_id'] for f in chosen),
+        'height': video.get('height') if video else None,
+        'vcodec': vcodec,
+        'acodec': acodec,
+        'bytes': sum(sizes) if all(s is not None for s in sizes) else None,
+        'conversion': conversion,
+    }
+
+
+def codec_name(codec):
+    """'avc1.64001F' -> 'H.264'; unknown codecs keep their first component."""
+    if not codec or codec == 'none':
+        return None
+    short = codec.split('.')[0].lower()
+    return CODEC_NAMES.get(short, short)
+
+
+def describe(p):
+    """Row label, e.g. '720p · H.264 + AAC · 45 MB'."""
+    parts = []
+    if p.get('height'):
+        parts.append(f"{p['height']}p")
+    codecs = [name for name in (codec_name(p.get('vcodec')), codec_name(p.get('acodec'))) if name]
+    if codecs:
+        parts.append(' + '.join(codecs))
+    if p.get('bytes'):
+        parts.append(f"{estimator.mb(p['bytes']):.0f} MB")
+    if p.get('conversion') == 'transcode':
+        parts.append("recodifica")
+    return ' · '.join(parts)
+
+
+def selector(format_id, fallback):
+    """yt-dlp -f value: the planned ids first, the quality selector if they are gone."""
+    return f"{format_id}/{fallback}" if format_id else fallback
+
+
+def conversion_event(line, source=None):
+    """
+    'remux' / 'transcode' for a yt-dlp post-processing line that tells how the output was made, else None.
+    source: the last file yt-dlp downloaded; [ExtractAudio] prints the same line whether it copies the
+    stream (AAC into .m4a, MP3 into .mp3) or encodes, so the extensions decide.
+    """
+    if line.startswith(('[Merger] Merging formats into', '[VideoRemuxer] Remuxing', '[ExtractAudio] Not converting')):
+        return 'remux'
+    if line.startswith('[VideoConvertor] Converting'):
+        return 'transcode'
+    if line.startswith('[ExtractAudio] Destination:'):
+        target = _ext(line[len('[ExtractAudio] Destination:'):])
+        src = _ext(source or '')
+        copied = src == target or (target == 'm4a' and src in AAC_EXTS)
+        return 'remux' if copied else 'transcode'
+    return None
+
+
+def _ext(path):
+    return os.path.splitext(path.strip())[1].lstrip('.').lower()
@@ -0,0 +1,151 @@
+"""
+Per-host limits for yt-dlp processes.
+
+Every yt-dlp process re-runs the extractor's page and API requests, so five
+workers on one playlist look like five clients hammering the same site and
+earn HTTP 429. HostLimiter is shared by every job a service launches and
+limits, per host: process starts per second, concurrent downloads, and,
+after a 429/403, a backoff that doubles on each new throttle and winds down
+again as requests succeed.
+"""
+import contextlib
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import urlnorm
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp output that means the site is throttling us
+THROTTLE_RE = re.compile(r'HTTP Error (?:429|403)|Too Many Requests|rate.?limit', re.IGNORECASE)
+POLL_INTERVAL = 0.5  # Max sleep between checks of a cancel event
+
+
+def host_key(url):
+    """Budget a URL counts against: its extractor (youtu.be and youtube.com share one), else its host."""
+    canonical = urlnorm.canonicalize(url)
+    if canonical:
+        return canonical[0].split(':')[0]  # 'youtube:playlist' -> 'youtube'
+    host = (urlsplit(url).hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host
+
+
+def is_throttled(output):
+    return bool(output and THROTTLE_RE.search(output))
+
+
+class _HostState:
+    def __init__(self):
+        self.active = 0  # Downloads holding a connection slot
+        self.next_start = 0.0  # Earliest start of the next process (rate limit)
+        self.blocked_until = 0.0  # Backoff after a throttle
+        self.level = 0  # Consecutive throttles (backoff exponent)
+
+
+class HostLimiter:
+    def __init__(self, max_connections=3, rate=1.0, backoff_base=30.0, backoff_max=600.0):
+        """
+        max_connections: concurrent downloads per host
+        rate: yt-dlp process starts per second per host (downloads and metadata)
+        backoff_base: pause after the first 429/403, doubled for each one that follows
+        """
+        self.max_connections = max_connections
+        self.rate = rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+        return state
+
+    # --- Slots ---
+
+    def try_acquire(self, url, connection=True):
+        """
+        Non-blocking: takes a start (and a connection slot if `connection`)
+        for url's host. Returns (acquired, seconds to wait before retrying).
+        """
+        with self._cond:
+            state = self._state(host_key(url))
+            now = time.monotonic()
+            ready_at = max(state.next_start, state.blocked_until)
+            if connection and state.active >= self.max_connections:
+                return False, POLL_INTERVAL  # Woken by release()
+            if now < ready_at:
+                return False, ready_at - now
+            state.next_start = now + (1.0 / self.rate if self.rate else 0)
+            if connection:
+                state.active += 1
+            return True, 0.0
+
+    def acquire(self, url, connection=True, cancel_event=None):
+        """Blocks until a slot is free. Returns False if cancel_event was set while waiting."""
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            acquired, wait = self.try_acquire(url, connection)
+            if acquired:
+                return True
+            with self._cond:
+                self._cond.wait(min(wait, POLL_INTERVAL))
+
+    def release(self, url):
+        with self._cond:
+            state = self._state(host_key(url))
+            state.active = max(0, state.active - 1)
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, url, connection=True, cancel_event=None):
+        """with limiter.slot(url) as acquired: ... (acquired is False if cancelled)."""
+        acquired = self.acquire(url, connection, cancel_event)
+        try:
+            yield acquired
+        finally:
+            if acquired and connection:
+                self.release(url)
+
+    # --- Feedback ---
+
+    def report(self, url, output, success):
+        """Feeds a finished process back: backs off on a throttle, recovers on success."""
+        if not success and is_throttled(output):
+            return self.throttled(url)
+        if success:
+            self.succeeded(url)
+        return 0.0
+
+    def throttled(self, url):
+        """Pauses new starts on url's host; returns the pause in seconds."""
+        with self._cond:
+            host = host_key(url)
+            state = self._state(host)
+            state.level += 1
+            delay = min(self.backoff_base * 2 ** (state.level - 1), self.backoff_max)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        logger.warning(f"Host {host} is throttling us, pausing new requests for {delay:g}s")
+        return delay
+
+    def succeeded(self, url):
+        with self._cond:
+            state = self._state(host_key(url))
+            state.level = max(0, state.level - 1)
+
+    def snapshot(self):
+        """{host: dict(active, level, blocked_for)} for hosts seen so far."""
+        with self._cond:
+            now = time.monotonic()
+            return {
+                host: {'active': s.active, 'level': s.level, 'blocked_for': max(0.0, s.blocked_until - now)}
+                for host, s in self._hosts.items()
+            }
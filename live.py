@@ -0,0 +1,285 @@
+"""
+Recording of live streams and premieres.
+
+A live URL has no end, so the VOD path either fails or grows one file until
+the user cancels, and cancelling deletes it. LiveRecorder runs yt-dlp with
+the stream on stdout (MPEG-TS, `-o -`) and cuts it into time-boxed segment
+files: memory is one read buffer, and each closed segment is moved to the
+destination right away, so a crash loses at most the open one. When yt-dlp
+exits while the stream is still live (network drop, stalled edge) it is
+restarted from the live edge into a new segment. stop() ends the recording:
+the open segment is closed and kept, like every other.
+"""
+import io
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from yt_dlp.utils import sanitize_filename
+
+import output_paths
+import urlnorm
+from ytdlp_service import (CREATION_FLAGS, FFMPEG_DIR, USER_AGENT, StallWatchdog, StderrTail, default_ytdlp_cmd,
+                           drain, session_ytdlp)
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SECONDS = 10 * 60
+SEGMENT_EXT = 'ts'
+TS_PACKET = 188  # Segments are cut on packet boundaries, so every file is a valid transport stream
+READ_CHUNK = 64 * 1024
+LIVE_STALL_TIMEOUT = 60  # Seconds without stream data before the capture is restarted
+WAIT_FOR_VIDEO = 30  # Seconds between checks while a premiere / scheduled stream has not started
+MAX_RECONNECTS = 20
+RECONNECT_DELAY = 2.0  # Seconds, doubled per consecutive failure (capped at 60)
+UPDATE_INTERVAL = 0.5  # Min seconds between on_update calls while recording
+# Single-file formats can be piped; a DASH-only stream (e.g. recorded from the start) is merged by ffmpeg
+LIVE_FORMATS = {
+    'high': 'best/bv*+ba',
+    'medium': 'best[height<=720]/bv*[height<=720]+ba/best',
+    'low': 'best[height<=480]/bv*[height<=480]+ba/best',
+}
+
+
+def is_live(info):
+    """True for a stream that is live or scheduled (premiere / upcoming)."""
+    return bool(info) and (bool(info.get('is_live')) or info.get('live_status') in ('is_live', 'is_upcoming'))
+
+
+def live_cmd(url, quality, is_audio, from_start=False, ytdlp=None):
+    """yt-dlp command writing the stream to stdout as MPEG-TS."""
+    cmd = [
+        *(ytdlp or default_ytdlp_cmd()),
+        "--no-playlist",
+        "--socket-timeout", "15",
+        "--user-agent", USER_AGENT,
+        "--ffmpeg-location", FFMPEG_DIR,
+        "--hls-use-mpegts",
+        "--wait-for-video", str(WAIT_FOR_VIDEO),
+        "-f", 'bestaudio/best' if is_audio else LIVE_FORMATS.get(quality, LIVE_FORMATS['high']),
+        "-o", "-",
+    ]
+    if from_start:
+        cmd.append("--live-from-start")  # Sites that keep the whole stream (YouTube)
+    cmd.append(url)
+    return cmd
+
+
+class LiveRecorder:
+    WAITING = 'waiting'  # Started, no data yet (premiere not begun, extracting)
+    RECORDING = 'recording'
+    RECONNECTING = 'reconnecting'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+    def __init__(self, service, url, output_path, title=None, quality='high', is_audio=False, from_start=False,
+                 segment_seconds=SEGMENT_SECONDS, stall_timeout=LIVE_STALL_TIMEOUT, on_update=None):
+        """
+        service: YtDlpService (yt-dlp command, session, metrics; re-checks the stream after a drop)
+        from_start: record from the start of the stream where the site allows it, else from now
+        segment_seconds: length of each segment file
+        on_update: callable(recorder) on status changes and, throttled, while recording
+        """
+        self.service = service
+        self.url = url
+        self.output_path = output_path
+        self.quality = quality
+        self.is_audio = is_audio
+        self.from_start = from_start
+        self.segment_seconds = segment_seconds
+        self.stall_timeout = stall_timeout
+        self.on_update = on_update
+        self.metrics = service.metrics
+        self.stem = sanitize_filename(title or 'live', restricted=True) or 'live'
+
+        self.status = LiveRecorder.WAITING
+        self.message = ''
+        self.segments = []  # Final paths of closed segments
+        self.bytes_written = 0
+        self.reconnects = 0
+        self.started_at = None  # time.time() of the first byte
+        self.ended_at = None
+
+        self.work_dir = output_paths.job_dir(output_path, ('live', urlnorm.cache_key(url, no_playlist=True), time.time()))
+        self._stop = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+        self._segment = None  # Open file of the current segment
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._segment_started = 0.0  # Monotonic
+        self._segment_wall = 0.0
+        self._count = 0
+        self._last_update = 0.0
+        self._thread = None
+
+    # --- Control ---
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="live-recorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Ends the recording; the open segment is finalized, not deleted."""
+        self._stop.set()
+        with self._lock:
+            process = self._process
+        if process and process.poll() is None:
+            try:
+                process.terminate()
+            except OSError:
+                pass
+
+    def wait(self, timeout=None):
+        """Blocks until the recording has finished. Returns False on timeout."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    @property
+    def finished(self):
+        return self.status in (LiveRecorder.FINISHED, LiveRecorder.FAILED)
+
+    def elapsed(self):
+        return (self.ended_at or time.time()) - self.started_at if self.started_at else 0.0
+
+    # --- Capture loop ---
+
+    def _run(self):
+        output_paths.claim_job(self.work_dir, url=self.url, output_path=os.path.abspath(self.output_path), live=True)
+        failures = 0
+        try:
+            while True:
+                received, error = self._capture(from_start=self.from_start and not self.reconnects)
+                self._close_segment()
+                if self._stop.is_set():
+                    break
+                if not self._still_live():
+                    break  # The stream ended
+                failures = 0 if received else failures + 1
+                if self.reconnects >= MAX_RECONNECTS:
+                    self._set_status(LiveRecorder.FAILED, f"Conexão perdida: {error or 'sem dados'}")
+                    return
+                self.reconnects += 1
+                self.metrics.inc('live_reconnects_total')
+                logger.warning(f"Live capture interrupted ({error or 'no data'}), reconnecting "
+                               f"({self.reconnects}/{MAX_RECONNECTS}): {self.url}")
+                self._set_status(LiveRecorder.RECONNECTING, error or '')
+                if self._stop.wait(min(60.0, RECONNECT_DELAY * 2 ** failures) if failures else 0):
+                    break
+            self._set_status(LiveRecorder.FINISHED, f"{len(self.segments)} segmento(s) gravado(s)")
+        except Exception as e:
+            logger.error(f"Live recording failed: {e}")
+            self._close_segment()
+            self._set_status(LiveRecorder.FAILED, str(e))
+        finally:
+            output_paths.release_job(self.work_dir)  # Closed segments were moved out already
+
+    def _capture(self, from_start):
+        """Runs one yt-dlp process until it exits or stop(). Returns (received data, last error)."""
+        received = False
+        tail = StderrTail()
+        with session_ytdlp(self.service.ytdlp_cmd, self.service.session) as ytdlp:
+            cmd = live_cmd(self.url, self.quality, self.is_audio, from_start, ytdlp)
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       creationflags=CREATION_FLAGS)
+            with self._lock:
+                self._process = process
+            if self._stop.is_set():
+                process.terminate()  # stop() came before the process existed
+            stderr_thread = threading.Thread(target=drain, args=(io.TextIOWrapper(process.stderr, 'utf-8'), tail), daemon=True)
+            stderr_thread.start()
+            watchdog = None
+            try:
+                while True:
+                    chunk = process.stdout.read1(READ_CHUNK)
+                    if not chunk:
+                        break
+                    if watchdog is None:
+                        # Armed by the first byte: a premiere may wait for hours before it
+                        watchdog = StallWatchdog(process, self.stall_timeout)
+                        watchdog.start()
+                    watchdog.activity()
+                    received = True
+                    self._write(chunk)
+                process.wait()
+                stderr_thread.join(timeout=5)
+            finally:
+                if watchdog:
+                    watchdog.stop()
+                with self._lock:
+                    self._process = None
+        return received, tail.last_error()
+
+    def _still_live(self):
+        """Re-checks the stream after yt-dlp exited on its own."""
+        info, error = self.service.fetch_info(self.url)
+        if info is None:
+            logger.warning(f"Could not re-check live stream: {error}")
+            return True  # Offline for now; the reconnect loop retries
+        return is_live(info)
+
+    # --- Segments ---
+
+    def _write(self, chunk):
+        now = time.monotonic()
+        if self._segment is not None and now - self._segment_started >= self.segment_seconds:
+            # Finish the current packet in the old segment, the rest starts the next one
+            cut = (-self._segment_bytes) % TS_PACKET
+            if cut <= len(chunk):
+                self._append(chunk[:cut])
+                chunk = chunk[cut:]
+                self._close_segment()
+        if chunk:
+            if self._segment is None:
+                self._open_segment(now)
+            self._append(chunk)
+        if now - self._last_update >= UPDATE_INTERVAL:
+            self._last_update = now
+            self._set_status(LiveRecorder.RECORDING)
+
+    def _append(self, data):
+        self._segment.write(data)
+        self._segment_bytes += len(data)
+        self.bytes_written += len(data)
+
+    def _open_segment(self, now):
+        self._count += 1
+        if self.started_at is None:
+            self.started_at = time.time()
+        self._segment_started = now
+        self._segment_wall = time.time()
+        self._segment_bytes = 0
+        self._segment_path = os.path.join(self.work_dir, f"{self._count:04d}.{SEGMENT_EXT}")
+        self._segment = open(self._segment_path, 'wb')
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.close()
+        self._segment = None
+        if not self._segment_bytes:
+            os.remove(self._segment_path)
+            return
+        stamp = time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(self._segment_wall))
+        final = output_paths.promote(self._segment_path,
+                                     os.path.join(self.output_path, f"{self.stem}_{stamp}.{SEGMENT_EXT}"))
+        self.segments.append(final)
+        self.metrics.inc('live_segments_total')
+        logger.info(f"Live segment saved: {final} ({self._segment_bytes} bytes)")
+        self._set_status(self.status)
+
+    def _set_status(self, status, message=None):
+        self.status = status
+        if self.finished and self.ended_at is None:
+            self.ended_at = time.time()
+        if message is not None:
+            self.message = message
+        if self.on_update:
+            try:
+                self.on_update(self)
+            except Exception as e:
+                logger.error(f"Live recorder listener failed: {e}")
+
@@ -0,0 +1,114 @@
+"""
+Application logging pipeline.
+
+Every logger hands its records to a QueueHandler, so logging from a
+download thread is a queue put instead of a disk write. A QueueListener
+thread formats them into a size-rotated JSON-lines file (one object per
+record, easy to parse with tools) and a plain console stream. Records
+carry the id of the job they belong to, set with job_context().
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+DEFAULT_LOG_FILE = 'app_log.txt'
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+LEVEL_ENV = 'VIDEO_DOWNLOADER_LOG_LEVEL'  # e.g. DEBUG, INFO, WARNING
+
+# Job id of the code running in this thread / asyncio task
+_job_id = contextvars.ContextVar('job_id', default=None)
+
+
+@contextlib.contextmanager
+def job_context(job_id):
+    """Tags every record logged inside the block with job_id."""
+    token = _job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _job_id.reset(token)
+
+
+def current_job_id():
+    """Job id set by the innermost job_context, else None."""
+    return _job_id.get()
+
+
+class JobIdFilter(logging.Filter):
+    """Copies the current job id onto the record, in the thread that logged it."""
+
+    def filter(self, record):
+        if not hasattr(record, 'job_id'):
+            record.job_id = _job_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'job_id': getattr(record, 'job_id', None),
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def resolve_level(level=None):
+    """Level from the argument, then the environment, defaulting to INFO."""
+    level = level or os.environ.get(LEVEL_ENV) or 'INFO'
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    return value if isinstance(value, int) else logging.INFO
+
+
+def setup_logging(path=DEFAULT_LOG_FILE, level=None, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS, console=True):
+    """
+    Installs the queue-based pipeline on the root logger and starts its
+    listener thread. Returns the QueueListener (stopped at exit).
+    """
+    level = resolve_level(level)
+    log_queue = queue.Queue(-1)
+
+    handlers = []
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(JobIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener):
+    """Flushes queued records and stops the listener thread (safe to call twice)."""
+    if getattr(listener, '_thread', None) is not None:
+        listener.stop()
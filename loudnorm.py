@@ -0,0 +1,173 @@
+"""
+Audio batch mode: loudness normalization fused with the final encode.
+
+Without it an audio playlist runs yt-dlp's --extract-audio per item (decode
++ encode) and any loudness fix is a second tool decoding and encoding every
+file again. In batch mode yt-dlp only downloads the best audio stream as it
+is (network-bound, parallel in the download pool), and the Normalizer runs
+EBU R128 two-pass loudnorm on a pool sized to the CPU count: pass 1 measures
+the file, pass 2 applies the measured, linear gain and encodes to the target
+codec in the same ffmpeg run. Every track of the batch ends up at the same
+target loudness, and each file goes through one lossy encode only.
+"""
+import json
+import logging
+import math
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import output_paths
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TARGET_I = -16.0  # Integrated loudness (LUFS), the usual streaming target
+TARGET_TP = -1.5  # True peak (dBTP)
+TARGET_LRA = 11.0  # Loudness range (LU)
+SAMPLE_RATE = 48000  # loudnorm resamples to 192 kHz internally; pinned for the output
+ENCODE_TIMEOUT = 30 * 60  # Seconds per ffmpeg run
+# Same bitrates as the extract-audio path (--audio-quality)
+BITRATES = {'high': '320k', 'medium': '192k', 'low': '128k'}
+CODEC_ARGS = {
+    'mp3': ['-c:a', 'libmp3lame'],
+    'm4a': ['-c:a', 'aac', '-movflags', '+faststart'],
+    'wav': ['-c:a', 'pcm_s16le'],  # Lossless: no bitrate
+}
+STATS_KEYS = ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')
+CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+
+
+def default_ffmpeg_cmd():
+    """The app's local ffmpeg (setup_ffmpeg), else the one on PATH."""
+    local = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+    return [local if os.path.exists(local) else shutil.which('ffmpeg') or 'ffmpeg']
+
+
+def _target():
+    return f"I={TARGET_I:g}:TP={TARGET_TP:g}:LRA={TARGET_LRA:g}"
+
+
+def analyze_cmd(src, ffmpeg=None):
+    """Pass 1: decode and measure only (loudnorm prints its stats as JSON on stderr)."""
+    return [*(ffmpeg or default_ffmpeg_cmd()), '-hide_banner', '-nostats', '-i', src, '-vn',
+            '-af', f"loudnorm={_target()}:print_format=json", '-f', 'null', '-']
+
+
+def encode_cmd(src, dst, codec, quality, stats=None, ffmpeg=None):
+    """Pass 2: linear gain from the pass-1 stats and the encode, in one run. stats=None: encode only."""
+    cmd = [*(ffmpeg or default_ffmpeg_cmd()), '-hide_banner', '-nostats', '-y', '-i', src, '-vn', '-map_metadata', '0']
+    if stats:
+        cmd += ['-af', (f"loudnorm={_target()}:measured_I={stats['input_i']}:measured_TP={stats['input_tp']}"
+                        f":measured_LRA={stats['input_lra']}:measured_thresh={stats['input_thresh']}"
+                        f":offset={stats['target_offset']}:linear=true")]
+    cmd += ['-ar', str(SAMPLE_RATE), *CODEC_ARGS[codec]]
+    if codec != 'wav':
+        cmd += ['-b:a', BITRATES.get(quality, BITRATES['high'])]
+    return cmd + [dst]
+
+
+def parse_stats(stderr):
+    """loudnorm's JSON block from ffmpeg's stderr, or None (silence measures -inf: no gain to apply)."""
+    end = stderr.rfind('}')
+    start = stderr.rfind('{', 0, end)
+    if start < 0:
+        return None
+    try:
+        data = json.loads(stderr[start:end + 1])
+        stats = {key: float(data[key]) for key in STATS_KEYS}
+    except (ValueError, KeyError):
+        return None
+    return stats if all(math.isfinite(v) for v in stats.values()) else None
+
+
+class Normalizer:
+    def __init__(self, ffmpeg_cmd=None, max_workers=None, metrics=None):
+        """
+        ffmpeg_cmd: command prefix that runs ffmpeg (see default_ffmpeg_cmd), e.g. a fake for tests
+        max_workers: files processed at once (os.cpu_count() by default; ffmpeg is CPU-bound here)
+        metrics: MetricsRegistry for normalize_seconds (metrics.REGISTRY by default)
+        """
+        self.ffmpeg_cmd = list(ffmpeg_cmd or default_ffmpeg_cmd())
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.metrics = metrics or REGISTRY
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending = 0  # Jobs queued or running
+        self._threads = 0
+
+    def submit(self, work_dir, output_path, codec, quality, on_done=None):
+        """Queues a finished audio job: normalizes and encodes its files, then promotes them (on_done(paths))."""
+        with self._cond:
+            self._pending += 1
+            if self._threads < self.max_workers:
+                self._threads += 1
+                threading.Thread(target=self._worker, name="loudnorm", daemon=True).start()
+        self._queue.put((work_dir, output_path, codec, quality, on_done))
+
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    def wait(self, timeout=None):
+        """Blocks until every queued job is done. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _worker(self):
+        while True:
+            work_dir, output_path, codec, quality, on_done = self._queue.get()
+            try:
+                files = self._process(work_dir, output_path, codec, quality)
+                if on_done:
+                    on_done(files)
+            except Exception as e:
+                # The download itself is fine: keep it as downloaded (not indexed, it is not the requested format)
+                logger.error(f"Normalization of {work_dir} failed, saving the original audio: {e}")
+                try:
+                    output_paths.promote_job(work_dir, output_path)
+                except OSError as move_error:
+                    logger.error(f"Could not save {work_dir}: {move_error}")
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+    def _process(self, work_dir, output_path, codec, quality):
+        for rel in output_paths.finished_files(work_dir):
+            self.normalize_file(os.path.join(work_dir, rel), codec, quality)
+        files = output_paths.promote_job(work_dir, output_path)
+        logger.info(f"Normalized and saved: {files}")
+        return files
+
+    def normalize_file(self, src, codec, quality):
+        """Replaces src (any audio/video file) with stem.<codec> at the target loudness. Returns the new path."""
+        start = time.monotonic()
+        result = self._run(analyze_cmd(src, self.ffmpeg_cmd))
+        stats = parse_stats(result.stderr)
+        if stats is None:
+            logger.warning(f"No loudness measured for {os.path.basename(src)}, encoding without gain")
+        stem = os.path.splitext(src)[0]
+        tmp, dst = f"{stem}.loudnorm.{codec}", f"{stem}.{codec}"
+        try:
+            result = self._run(encode_cmd(src, tmp, codec, quality, stats, self.ffmpeg_cmd))
+            if result.returncode != 0:
+                error = result.stderr.strip().splitlines()[-1:] or ['?']
+                raise RuntimeError(f"ffmpeg falhou ({result.returncode}): {error[0]}")
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        if dst != src:
+            os.remove(src)
+        self.metrics.observe('normalize_seconds', time.monotonic() - start)
+        logger.info(f"Loudness normalized: {os.path.basename(dst)}"
+                    + (f" ({stats['input_i']:g} -> {TARGET_I:g} LUFS)" if stats else ""))
+        return dst
+
+    def _run(self, cmd):
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace',
+                              timeout=ENCODE_TIMEOUT, creationflags=CREATION_FLAGS)
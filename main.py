@@ -1,16 +1,28 @@
 import flet as ft
-import subprocess
-import json
 import os
 import threading
 import time
-import sys
 import logging
-import traceback
 import asyncio
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import defaultdict
+import itertools
+
+import bulk_analysis
+import estimator
+import format_plan
+import live
+import logging_setup
+import metrics
+import output_paths
+import sections
+import storage
+from enrichment import MetadataEnricher
+from thumbnails import ThumbnailCache
+from dedup import DedupIndex
+from download_manager import DownloadManager, DownloadTask
+from host_limiter import HostLimiter
+from loudnorm import Normalizer
+from session_store import SessionStore
+from ytdlp_service import AsyncYtDlpService, YtDlpService
 
 # --- Auto-Setup FFmpeg (First Run) ---
 # This ensures FFmpeg is available before the app starts
@@ -23,21 +35,17 @@ except Exception as e:
 
 
 # --- Logging Setup ---
-logging.basicConfig(
-    filename='app_log.txt',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-console_handler = logging.StreamHandler()
-console_handler.setLevel=logging.DEBUG
-logging.getLogger().addHandler(console_handler)
+# Queue-based: JSON lines in app_log.txt (rotated) plus the console.
+# Level from VIDEO_DOWNLOADER_LOG_LEVEL (default INFO).
+logging_setup.setup_logging('app_log.txt')
+# Optional: Prometheus text on VIDEO_DOWNLOADER_METRICS_PORT, JSONL
+# snapshots appended to VIDEO_DOWNLOADER_METRICS_FILE
+metrics.start_exporters()
 
 def log(msg):
-    print(msg)
     logging.info(msg)
 
 def log_error(msg):
-    print(f"ERROR: {msg}")
     logging.error(msg)
 
 # --- Constants & Theme ---
@@ -48,269 +56,55 @@ PRIMARY_COLOR = ft.Colors.INDIGO
 BG_COLOR = ft.Colors.GREY_50
 SURFACE_COLOR = ft.Colors.WHITE
 
-# --- Backend Logic (Subprocess) ---
-
-class YtDlpService:
-    def __init__(self):
-        self._current_process = None
-        self._cancel_flag = False
-        self._metadata_cache = {}  # Cache: {url: (timestamp, info_dict)}
-        self._cache_ttl = 300  # 5 minutes TTL
-        self._progress_throttle = {}  # Track last update time per download
-        self._progress_regex = re.compile(r'\[download\]\s+(\d+\.?\d*)%')  # Pre-compiled regex
-        self._active_downloads = []  # Track active parallel downloads
-
-    def cancel(self):
-        self._cancel_flag = True
-        # Cancel single process
-        if self._current_process:
-            try:
-                log("Attempting to kill process...")
-                self._current_process.terminate()
-                log("Process termination signal sent.")
-            except Exception as e:
-                log_error(f"Error killing process: {e}")
-        
-        # Cancel all parallel downloads
-        for proc in self._active_downloads:
-            try:
-                if proc and proc.poll() is None:  # Process still running
-                    proc.terminate()
-            except Exception as e:
-                log_error(f"Error killing parallel process: {e}")
-
-    def get_info_cached(self, url, use_cache=True):
-        """Fetches metadata with caching support."""
-        # Check cache first
-        if use_cache and url in self._metadata_cache:
-            timestamp, cached_info = self._metadata_cache[url]
-            if time.time() - timestamp < self._cache_ttl:
-                log(f"Using cached info for: {url}")
-                return cached_info
-        
-        # Fetch fresh data
-        info = self.get_info(url)
-        
-        # Store in cache
-        if info and use_cache:
-            self._metadata_cache[url] = (time.time(), info)
-        
-        return info
-    
-    def get_info(self, url):
-        """Fetches metadata using subprocess. Supports single videos and playlists."""
-        log(f"Fetching info for: {url}")
-        
-        # Build command: python -m yt_dlp -J --flat-playlist --socket-timeout 15 [url]
-        # --flat-playlist: Get playlist metadata without full video info (faster)
-        cmd = [
-            sys.executable, "-m", "yt_dlp",
-            "-J",
-            "--flat-playlist",
-            "--socket-timeout", "30",
-            "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "--source-address", "0.0.0.0", # Force IPv4
-            url
-        ]
-
-        try:
-            # Use Popen/communicate to capture output safely
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            
-            stdout, stderr = process.communicate(timeout=90) # Hard timeout for the process
-            
-            if process.returncode != 0:
-                log_error(f"yt-dlp failed with code {process.returncode}")
-                # Common error: not a valid URL or private video
-                log_error(f"Stderr: {stderr}")
-                return None
-            
-            info = json.loads(stdout)
-            
-            # Basic validation
-            if 'title' not in info and 'id' not in info and '_type' not in info:
-                 log(f"Warning: Unexpected info format: {info.keys()}")
-
-            log(f"Info extracted: {info.get('title', 'Unknown')} | Type: {info.get('_type', 'video')}")
-            return info
-
-        except subprocess.TimeoutExpired:
-            log_error("Timeout expired while fetching info.")
-            process.kill()
-            return None
-        except Exception as e:
-            log_error(f"Exception in get_info: {e}")
-            log_error(traceback.format_exc())
-            return None
-
-    def download(self, url, output_path, quality, codec, is_audio, progress_hook):
-        """Downloads using subprocess and parses progress."""
-        self._cancel_flag = False
-        log(f"Starting download: {url} -> {output_path}")
-
-        # Construct Output Template
-        out_tmpl = os.path.join(output_path, '%(title)s.%(ext)s')
-
-        # Base Command
-        cmd = [
-            sys.executable, "-m", "yt_dlp",
-            "--no-playlist",
-            "--socket-timeout", "15",
-            "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "--source-address", "0.0.0.0",
-            "--restrict-filenames",
-            "--newline", # Important for progress parsing
-            "--progress",
-            "--ffmpeg-location", os.path.dirname(os.path.abspath(__file__)), # Force local ffmpeg
-            "-o", out_tmpl,
-            url
-        ]
-
-        # Format/Quality Setup
-        if is_audio:
-            cmd.extend(["-f", "bestaudio/best"])
-            cmd.extend(["--extract-audio", "--audio-format", codec])
-            
-            # Simple fallback: let yt-dlp handle it.
-            if quality == 'low': cmd.extend(["--audio-quality", "128K"])
-            elif quality == 'high': cmd.extend(["--audio-quality", "320K"]) 
-            
-        else:
-            # Video
-            if quality == 'high':
-                cmd.extend(["-f", f"bestvideo+bestaudio/best"])
-            elif quality == 'medium':
-                cmd.extend(["-f", f"bestvideo[height<=720]+bestaudio/best"])
-            elif quality == 'low':
-                cmd.extend(["-f", f"bestvideo[height<=480]+bestaudio/best"])
-            
-            cmd.extend(["--merge-output-format", codec])
-
-        current_file = None # Track file for cleanup
-        tracked_files = set() # Track all potential temp files
-
-        try:
-            self._current_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
-                bufsize=1,            # Line buffered
-                universal_newlines=True
-            )
-
-            # Read stdout line by line
-            for line in self._current_process.stdout:
-                line = line.strip()
-                if not line: continue
-
-                # Check cancel
-                if self._cancel_flag:
-                    self._current_process.terminate()
-                    # Wait briefly for termination
-                    try:
-                         self._current_process.wait(timeout=2)
-                    except: 
-                         self._current_process.kill()
-                    return False, "Cancelado pelo usuário"
-                
-                # Capture destination filenames (including intermediates for merges)
-                # [download] Destination: D:\...\file.f137.mp4
-                if line.startswith('[download] Destination:'):
-                    f = line.replace('[download] Destination:', '').strip()
-                    tracked_files.add(f)
-                    log(f"Tracking temp file: {f}")
-                
-                # [download] file.mp4 has already been downloaded
-                elif line.startswith('[download]') and 'has already been downloaded' in line:
-                    parts = line.split()
-                    if len(parts) > 1:
-                        f = parts[1]
-                        tracked_files.add(f)
-
-                # [Merger] Merging formats into "D:\...\file.mp4"
-                elif line.startswith('[Merger] Merging formats into'):
-                    # output is usually: [Merger] Merging formats into "filename"
-                    # We need to extract the filename from quotes
-                    try:
-                        f = line.split('"')[1]
-                        tracked_files.add(f)
-                        log(f"Tracking merge target: {f}")
-                    except:
-                        pass
-
-                # Optimized progress parsing with throttling
-                # [download]  23.5% of ...
-                if line.startswith('[download]'):
-                    # Throttle updates: max 2 per second
-                    current_time = time.time()
-                    download_id = url  # Use URL as unique identifier
-                    last_update = self._progress_throttle.get(download_id, 0)
-                    
-                    if current_time - last_update < 0.5:  # 500ms throttle
-                        continue
-                    
-                    self._progress_throttle[download_id] = current_time
-                    
-                    parts = line.split()
-                    data = {'status': 'downloading'}
-                    for i, part in enumerate(parts):
-                        if '%' in part:
-                            data['_percent_str'] = part
-                        if 'of' in parts and i < len(parts)-1 and parts[i] == 'of':
-                             data['_total_bytes_str'] = parts[i+1]
-                        if '/s' in part:
-                             data['_speed_str'] = part
-                        if 'ETA' in parts and i < len(parts)-1 and parts[i] == 'ETA':
-                             data['_eta_str'] = parts[i+1]
-                    progress_hook(data)
-                
-                # Check for post-processing
-                if '[ExtractAudio]' in line or '[Merger]' in line:
-                     progress_hook({'status': 'processing'})
-
-            self._current_process.wait()
-            
-            if self._current_process.returncode == 0:
-                log("Download finished successfully.")
-                return True, "Download Completo"
-            else:
-                stderr_out = self._current_process.stderr.read()
-                log_error(f"Download failed: {stderr_out}")
-                return False, "Erro no download (Ver log)"
-
-        except Exception as e:
-            log_error(f"Exception during download: {e}")
-            return False, str(e)
-        finally:
-            self._current_process = None
-            # Cleanup on cancel
-            if self._cancel_flag:
-                 log(f"Cleanup initiated. Files to check: {tracked_files}")
-                 for fpath in tracked_files:
-                     try:
-                         # 1. Check exact path
-                         if os.path.exists(fpath):
-                             os.remove(fpath)
-                             log(f"Deleted: {fpath}")
-                         # 2. Check .part
-                         if os.path.exists(fpath + ".part"):
-                             os.remove(fpath + ".part")
-                             log(f"Deleted: {fpath}.part")
-                         # 3. Check .ytdl (sometimes used)
-                         if os.path.exists(fpath + ".ytdl"):
-                             os.remove(fpath + ".ytdl")
-                             log(f"Deleted: {fpath}.ytdl")
-                     except Exception as ex:
-                         log_error(f"Failed to cleanup {fpath}: {ex}")
-
+# Playlist detail fetching (flat entries have no formats)
+DETAIL_FETCH_WORKERS = 4
+DETAIL_BATCH_SIZE = 8  # URLs resolved per yt-dlp process
+DETAIL_HOST_INTERVAL = 1.0  # Min seconds between batches on the same host
+BULK_ANALYSIS_WORKERS = 4  # Links analysed at the same time in bulk mode
+PLAYLIST_ROW_HEIGHT = 80  # Approximate height of a playlist row (px)
+PLAYLIST_LIST_HEIGHT = 350  # Height of the playlist list (px)
+PLAYLIST_PREFETCH_ROWS = 8  # Rows resolved beyond the visible area
+
+# Download manager (shared by every screen)
+DEFAULT_PARALLEL_DOWNLOADS = 3
+QUEUE_PANEL_REFRESH = 0.5  # Min seconds between queue panel redraws
+
+# Download queue retries (transient failures only)
+DOWNLOAD_MAX_RETRIES = 3
+DOWNLOAD_RETRY_BASE_DELAY = 2.0  # Seconds, doubled per attempt (with jitter)
+HOST_MAX_CONNECTIONS = 3  # Downloads at once on the same site, whatever the worker count
+HOST_STARTS_PER_SEC = 1.0  # yt-dlp processes started per second on the same site
+HOST_BACKOFF_BASE = 30.0  # Pause after an HTTP 429/403, doubled while it repeats
+
+# File naming (output_paths.TEMPLATES keys); same-name files get a _2, _3... suffix
+NAME_OPTIONS = [
+    ("title", "Título"),
+    ("title_id", "Título [id]"),
+    ("uploader", "Pasta do canal / Título"),
+    ("date", "Pasta do mês / Título"),
+]
+PLAYLIST_NAME_OPTIONS = NAME_OPTIONS + [("playlist", "Pasta da playlist / Nº - Título")]
+
+# Local thumbnail cache (downscaled images, size-capped)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+THUMB_CACHE_MAX_BYTES = 50 * 1024 * 1024
+# Fast local folder for downloads whose destination drive is slow (USB / network);
+# finished files are moved over in the background
+SCRATCH_DIR = os.environ.get("VIDEO_DOWNLOADER_SCRATCH") or os.path.join(CACHE_DIR, "scratch")
+ROW_THUMB_SIZE = (80, 45)
+CARD_THUMB_SIZE = (180, 100)
+# Live recording: segment length choices (seconds, label)
+LIVE_SEGMENT_OPTIONS = [(300, "5 minutos"), (600, "10 minutos"), (1800, "30 minutos"), (3600, "1 hora")]
+# How a finished job's file was made (DownloadTask.conversion)
+CONVERSION_LABELS = {
+    'direct': "arquivo original, sem conversão",
+    'remux': "remux, sem recodificar",
+    'transcode': "recodificado",
+}
+TRANSCODE_LABEL = "Qualidade máxima: aceita recodificar"
+TRANSCODE_TOOLTIP = ("Baixa os melhores fluxos em qualquer codec (ex.: VP9/AV1 em 4K) e recodifica para o formato "
+                     "escolhido se ele não os comportar. Desligado: prefere fluxos compatíveis (H.264 + AAC no MP4, "
+                     "VP9/AV1 + Opus no WebM/MKV), que só são remuxados")
 
 # --- UI (Flet) ---
 
@@ -337,7 +131,50 @@ def main(page: ft.Page):
         visual_density=ft.VisualDensity.COMFORTABLE,
     )
     
-    service = YtDlpService()
+    # One per-host budget for every yt-dlp process the app starts
+    host_limiter = HostLimiter(
+        max_connections=HOST_MAX_CONNECTIONS,
+        rate=HOST_STARTS_PER_SEC,
+        backoff_base=HOST_BACKOFF_BASE,
+    )
+    # Cookies and yt-dlp's extractor cache (player code, tokens) carried from job to job
+    session = SessionStore(os.path.join(CACHE_DIR, "session"))
+    session.sweep()
+    staging = storage.Staging(SCRATCH_DIR)
+    staging.recover()  # Moves interrupted by the last exit
+    # Partial downloads of crashed runs (destinations are swept by their first job)
+    threading.Thread(target=output_paths.sweep, args=(SCRATCH_DIR,), name="orphan-sweep", daemon=True).start()
+    dedup_index = DedupIndex(os.path.join(CACHE_DIR, "dedup.json"))  # Finished files, reused by later jobs
+    normalizer = Normalizer()  # Audio batch mode: loudness + encode on a CPU-sized pool
+    service = YtDlpService(host_limiter=host_limiter, session=session, staging=staging, dedup=dedup_index,
+                           normalizer=normalizer)
+    # Asyncio API for the async handlers, sharing the metadata cache, host limits, session, staging and index
+    aservice = AsyncYtDlpService(max_concurrency=BULK_ANALYSIS_WORKERS, cache=service.cache, host_limiter=host_limiter,
+                                 session=session, staging=staging, dedup=dedup_index)
+    enricher = MetadataEnricher(
+        service,
+        max_workers=DETAIL_FETCH_WORKERS,
+        batch_size=DETAIL_BATCH_SIZE,
+        host_interval=DETAIL_HOST_INTERVAL,
+    )
+    thumb_cache = ThumbnailCache(os.path.join(CACHE_DIR, "thumbnails"), max_bytes=THUMB_CACHE_MAX_BYTES)
+
+    # One download manager for the whole app: downloads survive new analyses
+    manager = DownloadManager(
+        service,
+        max_workers=DEFAULT_PARALLEL_DOWNLOADS,
+        max_retries=DOWNLOAD_MAX_RETRIES,
+        retry_base_delay=DOWNLOAD_RETRY_BASE_DELAY,
+    )
+    group_labels = {}  # group key -> label shown in the queue panel
+    group_counter = itertools.count(1)
+    # Single video on screen: its title and the link analysed (the field may hold several lines)
+    current_video = {'title': None, 'url': None}
+
+    def new_group(label):
+        key = f"g{next(group_counter)}"
+        group_labels[key] = label
+        return key
     
     # --- Components Helpers ---
     
@@ -366,7 +203,7 @@ def main(page: ft.Page):
     
     url_tf = ft.TextField(
         label="URL da Mídia",
-        hint_text="Cole o link do YouTube aqui...",
+        hint_text="Cole um ou vários links do YouTube aqui...",
         expand=True,
         text_size=15,
         border_radius=BORDER_RADIUS,
@@ -374,7 +211,9 @@ def main(page: ft.Page):
         border_color=ft.Colors.TRANSPARENT,
         focused_border_color=PRIMARY_COLOR,
         content_padding=15,
-        height=BUTTON_HEIGHT,
+        multiline=True,  # One link per line for bulk analysis
+        min_lines=1,
+        max_lines=5,
         prefix_icon=ft.Icons.LINK,
     )
 
@@ -398,8 +237,31 @@ def main(page: ft.Page):
         on_click=paste_action
     )
 
+    def on_url_file(e):
+        """Loads a text file of links into the URL field."""
+        if not e.files:
+            return
+        try:
+            with open(e.files[0].path, 'r', encoding='utf-8', errors='replace') as f:
+                url_tf.value = f.read()
+            url_tf.update()
+        except OSError as ex:
+            log_error(f"Failed to read URL list: {ex}")
+            page.show_snack_bar(ft.SnackBar(ft.Text("Não foi possível ler o arquivo.")))
+
+    url_file_picker = ft.FilePicker(on_result=on_url_file)
+    page.overlay.append(url_file_picker)
+
+    file_btn = ft.IconButton(
+        icon=ft.Icons.UPLOAD_FILE_ROUNDED,
+        icon_color=PRIMARY_COLOR,
+        tooltip="Carregar lista de links (.txt)",
+        height=BUTTON_HEIGHT,
+        on_click=lambda _: url_file_picker.pick_files(allowed_extensions=["txt"], allow_multiple=False)
+    )
+
     input_row = ft.Container(
-        content=ft.Row([url_tf, paste_btn], spacing=10, vertical_alignment=ft.CrossAxisAlignment.START),
+        content=ft.Row([url_tf, paste_btn, file_btn], spacing=10, vertical_alignment=ft.CrossAxisAlignment.START),
         padding=ft.padding.symmetric(vertical=20)
     )
 
@@ -416,15 +278,28 @@ def main(page: ft.Page):
         elevation=4
     )
 
+    # Bulk analysis of several links (the running analyzer, if any)
+    bulk_state = {'analyzer': None}
+
     # --- Content Container ---
     content_container = ft.Column(spacing=25, expand=False, horizontal_alignment=ft.CrossAxisAlignment.CENTER) 
 
     async def analyze_action(e):
-        url = url_tf.value
+        if bulk_state['analyzer']:
+            bulk_state['analyzer'].cancel()  # A new analysis replaces the screen
+            bulk_state['analyzer'] = None
+        url = (url_tf.value or '').strip()
         if not url:
             page.show_snack_bar(ft.SnackBar(ft.Text("Por favor, insira uma URL.")))
             return
 
+        urls = bulk_analysis.parse_urls(url)
+        if len(urls) > 1:
+            show_bulk_analysis(urls)
+            return
+        if urls:
+            url = urls[0]
+
         # Show Loading
         content_container.controls.clear()
         loading = ft.Column([
@@ -435,14 +310,10 @@ def main(page: ft.Page):
         content_container.controls.append(ft.Container(content=loading, alignment=ft.alignment.center, padding=50))
         page.update()
 
-        # Run fetch in executor to avoid blocking and allow clean async wait
-        loop = asyncio.get_running_loop()
+        # Awaits the yt-dlp child on the event loop (no executor thread)
         try:
             # Use wait_for to enforce UI side timeout as well
-            info = await asyncio.wait_for(
-                loop.run_in_executor(None, service.get_info, url),
-                timeout=100.0
-            )
+            info = await asyncio.wait_for(aservice.get_info(url), timeout=100.0)
         except asyncio.TimeoutError:
              log_error("UI Timeout on analysis.")
              info = None
@@ -468,7 +339,7 @@ def main(page: ft.Page):
         if info.get('_type') == 'playlist' or ('entries' in info and len(info.get('entries', [])) > 0):
              show_playlist_options(info)
         else:
-             show_options(info)
+             show_options(info, url)
     
     analyze_btn.on_click = analyze_action
 
@@ -476,8 +347,13 @@ def main(page: ft.Page):
     download_type_ref = ft.Ref[ft.Tabs]()
     quality_video_ref = ft.Ref[ft.Dropdown]()
     format_video_ref = ft.Ref[ft.Dropdown]()
+    transcode_ref = ft.Ref[ft.Switch]()
     quality_audio_ref = ft.Ref[ft.Dropdown]()
     format_audio_ref = ft.Ref[ft.Dropdown]()
+    name_template_ref = ft.Ref[ft.Dropdown]()
+    sections_ref = ft.Ref[ft.TextField]()
+    live_from_ref = ft.Ref[ft.Dropdown]()
+    live_segment_ref = ft.Ref[ft.Dropdown]()
     download_btn = ft.Ref[ft.ElevatedButton]()
     cancel_btn = ft.Ref[ft.ElevatedButton]()
     path_text = ft.Ref[ft.Text]()
@@ -489,12 +365,32 @@ def main(page: ft.Page):
     file_picker = ft.FilePicker(on_result=lambda e: (path_text.current.__setattr__("value", e.path), path_text.current.update(), download_btn.current.__setattr__("disabled", False), download_btn.current.update()) if e.path else None)
     page.overlay.append(file_picker)
 
-    def show_options(info):
+    def show_options(info, url):
+        enricher.clear()
+        thumb_cache.cancel_pending()
         content_container.controls.clear()
         
         title = info.get('title', 'Unknown Title')
-        thumb = info.get('thumbnail', '')
+        current_video.update(title=title, url=url)
+        thumbs = info.get('thumbnails') or info.get('thumbnail', '')
         duration = info.get('duration_string', 'N/A')
+        is_live = live.is_live(info)
+
+        # Thumbnail is filled in from the local cache once resolved
+        thumb_box = ft.Container(
+            content=ft.Icon(ft.Icons.VIDEO_FILE, color=PRIMARY_COLOR, size=48),
+            width=CARD_THUMB_SIZE[0], height=CARD_THUMB_SIZE[1],
+            alignment=ft.alignment.center, bgcolor=ft.Colors.GREY_100, border_radius=BORDER_RADIUS,
+        )
+
+        def set_thumb(b64):
+            if not b64:
+                return
+            thumb_box.content = ft.Image(src_base64=b64, width=CARD_THUMB_SIZE[0], height=CARD_THUMB_SIZE[1], border_radius=BORDER_RADIUS, fit=ft.ImageFit.COVER)
+            try:
+                thumb_box.update()
+            except:
+                pass
         
         # 1. Metadata Card
         meta_card = ft.Card(
@@ -503,14 +399,18 @@ def main(page: ft.Page):
             color=SURFACE_COLOR,
             content=ft.Container(
                 content=ft.Row([
-                    ft.Image(src=thumb, width=180, height=100, border_radius=BORDER_RADIUS, fit=ft.ImageFit.COVER),
+                    thumb_box,
                     ft.Column([
                         ft.Text(title, size=16, weight=ft.FontWeight.BOLD, max_lines=2, overflow=ft.TextOverflow.ELLIPSIS, width=400, color=ft.Colors.GREY_900),
                         ft.Container(
                             content=ft.Row([
                                 ft.Icon(ft.Icons.TIMER, size=14, color=ft.Colors.GREY_500),
                                 ft.Text(f"{duration}", size=13, color=ft.Colors.GREY_600),
-                            ], spacing=5),
+                            ], spacing=5) if not is_live else ft.Container(
+                                content=ft.Text("AO VIVO" if info.get('live_status') != 'is_upcoming' else "AGENDADO",
+                                                size=11, color=ft.Colors.WHITE, weight=ft.FontWeight.BOLD),
+                                bgcolor=ft.Colors.RED_600, padding=ft.padding.symmetric(2, 8), border_radius=6,
+                            ),
                             margin=ft.margin.only(top=5)
                         )
                     ], alignment=ft.MainAxisAlignment.CENTER, spacing=2)
@@ -543,7 +443,8 @@ def main(page: ft.Page):
                  ft.dropdown.Option("mp4", "MP4 - Compatível"),
                  ft.dropdown.Option("mkv", "MKV - Moderno"),
                  ft.dropdown.Option("webm", "WebM - Web"),
-            ], "mp4")
+            ], "mp4"),
+            ft.Switch(ref=transcode_ref, label=TRANSCODE_LABEL, value=False, tooltip=TRANSCODE_TOOLTIP),
         ], spacing=20)
 
         tabs = ft.Tabs(
@@ -564,7 +465,7 @@ def main(page: ft.Page):
             bgcolor=SURFACE_COLOR,
             border=ft.border.all(1, ft.Colors.GREY_200),
             border_radius=BORDER_RADIUS,
-            content=ft.Container(content=tabs, height=280) 
+            content=ft.Container(content=tabs, height=320) 
         )
 
         # 3. Path
@@ -595,20 +496,20 @@ def main(page: ft.Page):
 
         # 4. Buttons
         btn_start = ft.ElevatedButton(
-            "INICIAR DOWNLOAD",
+            "GRAVAR" if is_live else "INICIAR DOWNLOAD",
             ref=download_btn,
-            icon=ft.Icons.DOWNLOAD_ROUNDED,
+            icon=ft.Icons.FIBER_MANUAL_RECORD if is_live else ft.Icons.DOWNLOAD_ROUNDED,
             bgcolor=PRIMARY_COLOR,
             color=ft.Colors.WHITE,
             height=55,
             width=280,
             style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=30), elevation=4),
             disabled=True,
-            on_click=start_download_wrapper
+            on_click=start_live_recording if is_live else start_download_wrapper
         )
         
         btn_cancel = ft.ElevatedButton(
-            "CANCELAR",
+            "PARAR GRAVAÇÃO" if is_live else "CANCELAR",
             ref=cancel_btn,
             icon=ft.Icons.CLOSE_ROUNDED,
             bgcolor=ft.Colors.RED_500,
@@ -617,7 +518,6 @@ def main(page: ft.Page):
             width=200,
             visible=False,
             style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=30)),
-            on_click=lambda _: service.cancel()
         )
         
         btn_open = ft.ElevatedButton(
@@ -633,9 +533,61 @@ def main(page: ft.Page):
             on_click=lambda _: os.startfile(path_text.current.value)
         )
 
+        name_dropdown = ft.Container(
+            content=create_dropdown(name_template_ref, "Nome do arquivo",
+                                    [ft.dropdown.Option(k, v) for k, v in NAME_OPTIONS], "title"),
+            width=600,
+        )
+
+        # Partial download: only the fragments of these ranges / chapters are fetched
+        sections_field = ft.TextField(
+            ref=sections_ref,
+            label="Trecho (opcional)",
+            hint_text="Ex.: 1:02:00-1:05:30, -2:00 ou nome do capítulo",
+            border_radius=10,
+            text_size=14,
+            expand=True,
+        )
+        chapters = [c.get('title') for c in info.get('chapters') or [] if c.get('title')]
+
+        def add_chapter(e):
+            current = (sections_field.value or '').strip()
+            sections_field.value = f"{current}, {e.control.value}" if current else e.control.value
+            e.control.value = None
+            page.update()
+
+        sections_row = ft.Container(
+            content=ft.Row([sections_field] + ([ft.Dropdown(
+                label="Capítulo",
+                width=200,
+                border_radius=10,
+                text_size=14,
+                options=[ft.dropdown.Option(c) for c in chapters],
+                on_change=add_chapter,
+            )] if chapters else []), spacing=10),
+            width=600,
+        )
+
+        # A live stream has no end: it is recorded into segment files until stopped
+        live_row = ft.Container(
+            content=ft.Row([
+                ft.Dropdown(ref=live_from_ref, label="Gravar desde", expand=True, border_radius=10, text_size=14,
+                            value="now", options=[ft.dropdown.Option("now", "Agora"),
+                                                  ft.dropdown.Option("start", "Início da transmissão")]),
+                ft.Dropdown(ref=live_segment_ref, label="Dividir a cada", expand=True, border_radius=10, text_size=14,
+                            value=str(live.SEGMENT_SECONDS),
+                            options=[ft.dropdown.Option(str(k), v) for k, v in LIVE_SEGMENT_OPTIONS]),
+            ], spacing=10),
+            width=600,
+        )
+
         actions_column = ft.Column([
             path_display,
             ft.Container(height=10),
+            live_row if is_live else name_dropdown,
+            ft.Container(height=10),
+            *([] if is_live else [sections_row]),
+            ft.Container(height=10),
             ft.ProgressBar(ref=progress_bar, width=600, height=8, border_radius=4, value=0, visible=False, color=PRIMARY_COLOR, bgcolor=ft.Colors.GREY_200),
             ft.Text("", ref=status_text, size=13, color=ft.Colors.GREY_700, weight=ft.FontWeight.W_500),
             ft.Container(height=10),
@@ -648,17 +600,34 @@ def main(page: ft.Page):
             actions_column
         ])
         page.update()
+        thumb_cache.get_async(thumbs, *CARD_THUMB_SIZE, set_thumb)
 
     async def start_download_wrapper(e):
         dl_path = path_text.current.value
-        url = url_tf.value
-        
-        download_btn.current.visible = False
-        cancel_btn.current.visible = True
-        open_folder_btn.current.visible = False
-        progress_bar.current.visible = True
-        progress_bar.current.value = None
-        status_text.current.value = "Iniciando download..."
+        url = current_video['url']  # Resolved by analyze_action, not the raw field
+
+        # Bind this screen's widgets: the refs move on when another link is analysed
+        pb = progress_bar.current
+        status = status_text.current
+        btn_dl = download_btn.current
+        btn_cancel = cancel_btn.current
+        btn_open = open_folder_btn.current
+
+        try:
+            selected_sections = sections.parse(sections_ref.current.value)
+        except ValueError as ex:
+            sections_ref.current.error_text = str(ex)
+            page.update()
+            return
+        sections_ref.current.error_text = None
+
+        btn_dl.visible = False
+        btn_cancel.visible = True
+        btn_open.visible = False
+        pb.visible = True
+        pb.value = None
+        pb.color = PRIMARY_COLOR
+        status.value = "Iniciando download..."
         page.update()
 
         current_tab_idx = download_type_ref.current.selected_index
@@ -670,46 +639,121 @@ def main(page: ft.Page):
             qual = quality_video_ref.current.value
             codec = format_video_ref.current.value
 
-        def progress_hook(d):
-            if d.get('status') == 'downloading':
-                try:
-                    p = d.get('_percent_str', '').replace('%','')
-                    total = d.get('_total_bytes_str', 'N/A')
-                    speed = d.get('_speed_str', 'N/A')
-                    if p and p != 'N/A':
-                        val = float(p) / 100
-                        progress_bar.current.value = val
-                    status_text.current.value = f"Baixando: {p}% de {total} ({speed})"
-                    page.update()
-                except Exception as ex:
-                    log_error(f"Error parse progress: {ex}")
-            elif d.get('status') == 'finished':
-                status_text.current.value = "Processando arquivo final..."
-                progress_bar.current.value = None
+        def safe_update():
+            try:
                 page.update()
-
-        def do_download():
-            success, msg = service.download(url, dl_path, qual, codec, is_audio, progress_hook)
-            if success:
-                status_text.current.value = "Download e conversão concluídos!"
-                progress_bar.current.value = 1
-                progress_bar.current.color = ft.Colors.GREEN
-                open_folder_btn.current.visible = True
-                download_btn.current.visible = True
-                download_btn.current.text = "BAIXAR OUTRO"
+            except Exception:
+                pass  # Screen replaced while downloading; the queue panel keeps tracking
+
+        label = current_video['title'] or url
+        group = new_group(f"{label} [{sections.describe(selected_sections)}]" if selected_sections else label)
+
+        def on_task(t):
+            if t.group != group:
+                return
+            if t.status == DownloadTask.QUEUED:
+                status.value = "Na fila..."
+            elif t.status == DownloadTask.DOWNLOADING:
+                if t.percent_str and t.percent_str != 'N/A':
+                    pb.value = t.progress
+                status.value = f"Baixando: {t.percent_str or 0}% de {t.total_str or 'N/A'} ({t.speed_str or 'N/A'})"
+            elif t.status == DownloadTask.PROCESSING:
+                status.value = "Processando arquivo final..."
+                pb.value = None
+            elif t.status == DownloadTask.RETRYING:
+                status.value = f"Falha temporária, nova tentativa em breve... ({t.message})"
+            elif t.status == DownloadTask.DONE:
+                status.value = (f"Download concluído! ({CONVERSION_LABELS[t.conversion]})" if t.conversion
+                                else "Download e conversão concluídos!")
+                pb.value = 1
+                pb.color = ft.Colors.GREEN
+                btn_open.visible = True
+                btn_dl.visible = True
+                btn_dl.text = "BAIXAR OUTRO"
             else:
-                status_text.current.value = f"Erro: {msg}"
-                progress_bar.current.color = ft.Colors.RED if "Cancelado" not in msg else ft.Colors.ORANGE
-                progress_bar.current.value = 1
-                download_btn.current.visible = True
-            
-            cancel_btn.current.visible = False
-            download_btn.current.disabled = False
+                status.value = f"Erro: {t.message}"
+                pb.color = ft.Colors.RED if t.status == DownloadTask.FAILED else ft.Colors.ORANGE
+                pb.value = 1
+                btn_dl.visible = True
+            if t.finished:
+                btn_cancel.visible = False
+                btn_dl.disabled = False
+                manager.unsubscribe(on_task)
+            safe_update()
+
+        manager.subscribe(on_task)
+        task = manager.submit(url, dl_path, qual, codec, is_audio, title=group_labels[group], group=group,
+                              template=name_template_ref.current.value, sections=selected_sections,
+                              transcode=not is_audio and bool(transcode_ref.current.value))
+        btn_cancel.on_click = lambda _: manager.cancel(task)
+        # No loop wait here, just fire and forget, UI updates via the manager
+
+    async def start_live_recording(e):
+        dl_path = path_text.current.value
+        url = current_video['url']  # Resolved by analyze_action, not the raw field
+        pb = progress_bar.current
+        status = status_text.current
+        btn_rec = download_btn.current
+        btn_stop = cancel_btn.current
+        btn_open = open_folder_btn.current
+
+        is_audio = download_type_ref.current.selected_index == 1
+        quality = (quality_audio_ref if is_audio else quality_video_ref).current.value
+
+        def on_update(rec):
+            mb = rec.bytes_written / (1024 * 1024)
+            parts = f"{format_seconds(rec.elapsed()) if rec.elapsed() >= 1 else '0:00'} | {mb:.1f} MB | {len(rec.segments)} segmento(s) salvo(s)"
+            if rec.status == live.LiveRecorder.WAITING:
+                status.value = "Aguardando a transmissão..."
+            elif rec.status == live.LiveRecorder.RECORDING:
+                status.value = f"Gravando: {parts}"
+            elif rec.status == live.LiveRecorder.RECONNECTING:
+                status.value = f"Reconectando ({rec.reconnects})... {parts}"
+            elif rec.status == live.LiveRecorder.FINISHED:
+                status.value = f"Gravação finalizada: {parts}"
+                pb.value = 1
+                pb.color = ft.Colors.GREEN
+            else:
+                status.value = f"Erro: {rec.message} ({len(rec.segments)} segmento(s) salvo(s))"
+                pb.value = 1
+                pb.color = ft.Colors.RED
+            if rec.finished:
+                btn_stop.visible = False
+                btn_rec.visible = True
+                btn_rec.disabled = False
+                btn_open.visible = bool(rec.segments)
+            try:
+                page.update()
+            except Exception:
+                pass  # Screen replaced while recording
+
+        recorder = live.LiveRecorder(
+            service, url, dl_path,
+            title=current_video['title'],
+            quality=quality,
+            is_audio=is_audio,
+            from_start=live_from_ref.current.value == "start",
+            segment_seconds=int(live_segment_ref.current.value),
+            on_update=on_update,
+        )
+        btn_rec.visible = False
+        btn_stop.visible = True
+        btn_stop.disabled = False
+        btn_open.visible = False
+        pb.visible = True
+        pb.value = None
+        pb.color = ft.Colors.RED_600
+        status.value = "Conectando à transmissão..."
+        page.update()
+
+        def stop(_):
+            btn_stop.disabled = True
+            status.value = "Finalizando gravação..."
             page.update()
+            recorder.stop()
 
-        t = threading.Thread(target=do_download)
-        t.start()
-        # No loop wait here, just fire and forget, UI updates via callback
+        btn_stop.on_click = stop
+        recorder.start()
 
     # --- Playlist UI Support ---
 
@@ -725,40 +769,88 @@ def main(page: ft.Page):
         except:
             return "N/A"
 
-    def estimate_size(duration_sec, is_audio, quality):
-        if not duration_sec: return 0
-        # Bitrate assumptions (approximate)
-        # Audio: High=320kbps, Med=192kbps, Low=128kbps
-        # Video: High(1080p)=4500kbps, Med(720p)=2500kbps, Low(480p)=1000kbps
-        # Size (MB) = (kbps * duration) / 8 / 1024
-        
-        rate = 0
-        if is_audio:
-            if quality == "high": rate = 320
-            elif quality == "medium": rate = 192
-            else: rate = 128
-        else:
-            # Video includes audio, so add ~128kbps
-            if quality == "high": rate = 4500 + 128
-            elif quality == "medium": rate = 2500 + 128
-            else: rate = 1000 + 128
-            
-        mb = (rate * duration_sec) / 8192 # 8 * 1024
-        return mb
-
     class PlaylistEntry:
-        def __init__(self, entry_data, index):
+        def __init__(self, entry_data, index, on_change=None, on_move_front=None):
             self.data = entry_data
             self.index = index
+            self.on_change = on_change
+            self.on_move_front = on_move_front
+            self.task = None  # DownloadTask once submitted
             self.ref_quality = ft.Ref[ft.Dropdown]()
             self.ref_format = ft.Ref[ft.Dropdown]()
+            self.ref_sections = ft.Ref[ft.TextField]()
             self.ref_type_icon = ft.Ref[ft.Icon]()
             self.ref_status = ft.Ref[ft.Text]()
+            self.ref_duration = ft.Ref[ft.Text]()
+            self.ref_visual = ft.Ref[ft.Container]()
+            self.row_control = None
             self.is_audio = False # Default to video logic initially
+            self.details_requested = False
+            self.thumb_wanted = False  # Row came into view: show its thumbnail once one is known
+            self.thumb_requested = False  # Asked the thumbnail cache (once per row)
             
             # Setup initial values
             self.quality_val = "high"
             self.format_val = "mp4"
+            self.sections = ()  # Section specs (see sections.parse), () = whole video
+            self.plan = None  # Formats resolved from the metadata (see format_plan), None until it arrives
+            self.transcode = False  # "Max quality" mode of the Controle Universal (video only)
+
+        def get_url(self):
+            vid_url = self.data.get('url')
+            if not vid_url and self.data.get('id'):
+                vid_url = f"https://www.youtube.com/watch?v={self.data.get('id')}"
+            return vid_url
+
+        def estimate(self):
+            """Returns (bytes, exact) for the current selection (scaled to the selected sections)."""
+            size, exact = estimator.estimate_bytes(self.data, self.is_audio, self.quality_val,
+                                                   format_plan.preferred(self.format_val, self.is_audio, self.transcode))
+            share = sections.fraction(self.sections, self.data)
+            if share is None:
+                return size, False
+            return int(size * share), exact
+
+        def apply_details(self, details):
+            """Merges full metadata (formats, duration) into a flat entry."""
+            for key in ('formats', 'duration', 'duration_string', 'thumbnails', 'chapters'):
+                if details.get(key):
+                    self.data[key] = details[key]
+            self.refresh_plan()
+            if self.thumb_wanted:
+                self.load_thumbnail()  # In view before its thumbnail was known
+
+        def refresh_plan(self):
+            """Resolves the formats of the current selection and shows them under the title."""
+            self.plan = format_plan.plan(self.data, self.is_audio, self.quality_val, self.format_val, self.transcode)
+            if self.ref_duration.current:
+                duration = self.data.get('duration_string') or format_seconds(self.data.get('duration'))
+                label = format_plan.describe(self.plan) if self.plan else ''
+                self.ref_duration.current.value = f"Duração: {duration}" + (f" · {label}" if label else "")
+
+        def load_thumbnail(self):
+            # Called for rows in view (see load_visible_thumbnails), at most one fetch per row.
+            # --flat-playlist entries often have a 'thumbnails' list or none (then apply_details retries).
+            # The cache picks the smallest variant that covers the row size.
+            self.thumb_wanted = True
+            thumbs = self.data.get('thumbnails') or self.data.get('thumbnail')
+            if thumbs and not self.thumb_requested:
+                self.thumb_requested = True
+                thumb_cache.get_async(thumbs, *ROW_THUMB_SIZE, self.set_thumbnail)
+
+        def set_thumbnail(self, b64):
+            if not b64 or not self.ref_visual.current:
+                return
+            w, h = ROW_THUMB_SIZE
+            self.ref_visual.current.content = ft.Image(src_base64=b64, width=w, height=h, fit=ft.ImageFit.COVER, border_radius=4)
+            try:
+                self.ref_visual.current.update()
+            except:
+                pass
+
+        def get_visual(self):
+            # Placeholder until the cached thumbnail arrives
+            return ft.Icon(ft.Icons.VIDEO_FILE, color=PRIMARY_COLOR, size=40)
 
         def get_control(self):
             title = self.data.get('title', 'Unknown')
@@ -766,25 +858,14 @@ def main(page: ft.Page):
             if not duration:
                  sec = self.data.get('duration')
                  duration = format_seconds(sec)
-            
-            # Try to get thumbnail. --flat-playlist entries often have 'thumbnails' list or none.
-            thumb_src = ""
-            if self.data.get('thumbnails') and len(self.data['thumbnails']) > 0:
-                 # Get the first one (usually smallest) or last (largest). Let's try last for best quality.
-                 thumb_src = self.data['thumbnails'][-1].get('url', '')
-            
-            # Visual Content: Image or Icon
-            visual_content = ft.Icon(ft.Icons.VIDEO_FILE, color=PRIMARY_COLOR, size=40)
-            if thumb_src:
-                visual_content = ft.Image(src=thumb_src, width=80, height=45, fit=ft.ImageFit.COVER, border_radius=4)
 
-            return ft.Container(
+            self.row_control = ft.Container(
                 content=ft.Row([
                     ft.Text(f"{self.index}.", weight=ft.FontWeight.BOLD, color=ft.Colors.GREY_500, width=30),
-                    visual_content,
+                    ft.Container(content=self.get_visual(), ref=self.ref_visual, width=80, alignment=ft.alignment.center),
                     ft.Column([
                         ft.Text(title, weight=ft.FontWeight.W_600, max_lines=1, overflow=ft.TextOverflow.ELLIPSIS, width=350),
-                        ft.Text(f"Duração: {duration}", size=12, color=ft.Colors.GREY_500)
+                        ft.Text(f"Duração: {duration}", ref=self.ref_duration, size=12, color=ft.Colors.GREY_500)
                     ], spacing=2),
                     ft.VerticalDivider(width=10, color=ft.Colors.TRANSPARENT),
                     # Individual Controls
@@ -816,7 +897,22 @@ def main(page: ft.Page):
                         ],
                         on_change=self.update_state
                     ),
-                    ft.Container(width=10),
+                    ft.TextField(
+                        ref=self.ref_sections,
+                        width=120,
+                        content_padding=10,
+                        text_size=12,
+                        hint_text="Trecho",
+                        tooltip="Só parte do vídeo: 1:00-2:30, -5:00, 1:00:00- ou nome do capítulo",
+                        on_blur=self.update_sections,
+                        on_submit=self.update_sections,
+                    ),
+                    ft.IconButton(
+                        icon=ft.Icons.VERTICAL_ALIGN_TOP,
+                        icon_size=18,
+                        tooltip="Baixar a seguir",
+                        on_click=lambda e: self.on_move_front(self) if self.on_move_front else None
+                    ),
                     ft.Text("", ref=self.ref_status, size=12, color=ft.Colors.GREY_600, width=80, text_align=ft.TextAlign.RIGHT)
                 ], alignment=ft.MainAxisAlignment.START),
                 padding=10,
@@ -824,13 +920,38 @@ def main(page: ft.Page):
                 border_radius=8,
                 bgcolor=SURFACE_COLOR
             )
+            self.refresh_plan()  # Entries analysed with full metadata already have formats
+            return self.row_control
 
         def update_state(self, e):
             self.quality_val = self.ref_quality.current.value
             self.format_val = self.ref_format.current.value
+            self.refresh_plan()
+            try:
+                self.ref_duration.current.update()
+            except:
+                pass
+            if self.on_change:
+                self.on_change()
+
+        def update_sections(self, e):
+            field = self.ref_sections.current
+            try:
+                self.sections = sections.parse(field.value)
+                field.error_text = None
+            except ValueError as ex:
+                self.sections = ()
+                field.error_text = str(ex)
+            try:
+                field.update()
+            except:
+                pass
+            if self.on_change:
+                self.on_change()
 
-        def sync_global(self, is_audio, quality, fmt):
+        def sync_global(self, is_audio, quality, fmt, transcode=False):
             self.is_audio = is_audio
+            self.transcode = transcode and not is_audio
             # Update values
             self.ref_quality.current.value = quality
             self.quality_val = quality
@@ -857,10 +978,14 @@ def main(page: ft.Page):
             else:
                 self.ref_format.current.value = valid_opts[0]
                 self.format_val = valid_opts[0]
+            self.refresh_plan()
 
             # REMOVED: individual .update() calls - batch update handled by parent
 
-    def show_playlist_options(info):
+    def show_playlist_options(info, label="PLAYLIST DETECTADA"):
+        """Builds the playlist screen. Returns add_entries(entries) to stream more rows in."""
+        enricher.clear()  # Drop pending rows of a previous playlist
+        thumb_cache.cancel_pending()
         content_container.controls.clear()
         
         entries = info.get('entries', [])
@@ -869,31 +994,84 @@ def main(page: ft.Page):
         # Refs for Global Controls
         global_type_ref = ft.Ref[ft.Tabs]()
         global_qual_ref = ft.Ref[ft.Dropdown]()
+        audio_batch_ref = ft.Ref[ft.Switch]()
+        max_quality_ref = ft.Ref[ft.Switch]()
         size_est_ref = ft.Ref[ft.Text]()
+        count_ref = ft.Ref[ft.Text]()
         
         playlist_entries = []
         
         # Header
         header_card = ft.Container(
             content=ft.Column([
-                ft.Text("PLAYLIST DETECTADA", size=12, weight=ft.FontWeight.BOLD, color=PRIMARY_COLOR),
+                ft.Text(label, size=12, weight=ft.FontWeight.BOLD, color=PRIMARY_COLOR),
                 ft.Text(title, size=20, weight=ft.FontWeight.W_800),
-                ft.Text(f"{len(entries)} Vídeos encontrados", color=ft.Colors.GREY_600)
+                ft.Text(f"{len(entries)} Vídeos encontrados", ref=count_ref, color=ft.Colors.GREY_600)
             ]),
             padding=10
         )
 
+        def total_estimate():
+             """Returns (total_bytes, pending) where pending counts rows still using the fallback."""
+             total_bytes = 0
+             pending = 0
+             for pe in playlist_entries:
+                 size, exact = pe.estimate()
+                 total_bytes += size
+                 if not exact:
+                     pending += 1
+             return total_bytes, pending
+
+        def size_est_label():
+             total_bytes, pending = total_estimate()
+             label = f"Estimado: ~{int(estimator.mb(total_bytes))} MB"
+             if pending:
+                 label += f" ({len(playlist_entries) - pending}/{len(playlist_entries)} com dados reais)"
+             return label
+
         def update_size_est():
-             is_audio = (global_type_ref.current.selected_index == 1)
-             qual = global_qual_ref.current.value
-             total_sec = 0
-             for e in entries:
-                 if e.get('duration'):
-                     total_sec += float(e['duration'])
-             
-             mb = estimate_size(total_sec, is_audio, qual)
-             size_est_ref.current.value = f"Estimado: ~{int(mb)} MB"
-             size_est_ref.current.update()
+             size_est_ref.current.value = size_est_label()
+             try:
+                 size_est_ref.current.update()
+             except:
+                 pass  # Screen may have been replaced
+
+        # Background enrichment: every flat row is queued in list order,
+        # rows scrolled into view jump to the front of the queue.
+        def on_details(pe, info):
+             if not info:
+                 return
+             pe.apply_details(info)
+             update_size_est()
+             try:
+                 pe.row_control.update()
+             except:
+                 pass
+
+        def request_all_details():
+             for pe in playlist_entries:
+                 if pe.details_requested or estimator.has_format_data(pe.data) or not pe.get_url():
+                     continue
+                 pe.details_requested = True
+                 enricher.request(pe.get_url(), lambda url, info, pe=pe: on_details(pe, info), priority=pe.index)
+
+        # Rows in view (updated on scroll); thumbnails are only fetched for these
+        view = {'first': 0, 'rows': PLAYLIST_LIST_HEIGHT // PLAYLIST_ROW_HEIGHT + 1}
+
+        def visible_entries():
+             first = view['first']
+             return playlist_entries[first:first + view['rows'] + PLAYLIST_PREFETCH_ROWS]
+
+        def load_visible_thumbnails():
+             for pe in visible_entries():
+                 pe.load_thumbnail()
+
+        def on_list_scroll(e):
+             view['first'] = int(e.pixels // PLAYLIST_ROW_HEIGHT)
+             view['rows'] = int(e.viewport_dimension // PLAYLIST_ROW_HEIGHT) + 1
+             visible = visible_entries()
+             enricher.prioritize([pe.get_url() for pe in visible if pe.details_requested])
+             load_visible_thumbnails()
 
         # Global Controls with Debouncing (Threading-based for Flet compatibility)
         debounce_timer = None
@@ -915,8 +1093,11 @@ def main(page: ft.Page):
                 fmt = "mp3" if is_audio else "mp4"
                 
                 # Batch update all entries (no individual .update() calls)
+                transcode = bool(max_quality_ref.current.value)
                 for entry in playlist_entries:
-                    entry.sync_global(is_audio, qual, fmt)
+                    entry.sync_global(is_audio, qual, fmt, transcode)
+                audio_batch_ref.current.disabled = not is_audio
+                max_quality_ref.current.disabled = is_audio
                 
                 update_size_est()
                 page.update()  # Single update for all changes
@@ -945,6 +1126,22 @@ def main(page: ft.Page):
                         ],
                         value="high",
                         on_change=on_global_change
+                    ),
+                    ft.Switch(
+                        ref=audio_batch_ref,
+                        label="Modo lote de áudio: volume normalizado",
+                        value=False,
+                        disabled=True,  # Enabled on the Áudio tab
+                        tooltip="Baixa só as faixas de áudio em paralelo; a normalização de volume (EBU R128, "
+                                "duas passagens) e a conversão são feitas juntas, uma vez por arquivo"
+                    ),
+                    ft.Switch(
+                        ref=max_quality_ref,
+                        label=TRANSCODE_LABEL,
+                        value=False,
+                        disabled=False,  # Disabled on the Áudio tab
+                        tooltip=TRANSCODE_TOOLTIP,
+                        on_change=on_global_change
                     )
                 ], spacing=10),
                 padding=15
@@ -954,15 +1151,20 @@ def main(page: ft.Page):
         )
 
         # List
-        lv = ft.ListView(expand=False, height=350, spacing=10)
-        idx = 1
-        for entry in entries:
-             # Basic filter for valid entries
-             if entry.get('title') == '[Private video]': continue
-             pe = PlaylistEntry(entry, idx)
-             playlist_entries.append(pe)
-             lv.controls.append(pe.get_control())
-             idx += 1
+        lv = ft.ListView(expand=False, height=PLAYLIST_LIST_HEIGHT, spacing=10, on_scroll=on_list_scroll, on_scroll_interval=200)
+
+        def append_rows(new_entries):
+             added = []
+             for entry in new_entries:
+                 # Basic filter for valid entries
+                 if entry.get('title') == '[Private video]': continue
+                 pe = PlaylistEntry(entry, len(playlist_entries) + 1, on_change=update_size_est, on_move_front=lambda pe: move_to_front(pe))
+                 playlist_entries.append(pe)
+                 lv.controls.append(pe.get_control())
+                 added.append(pe)
+             return added
+
+        append_rows(entries)
 
         # Path & Action
         # Re-use path helpers from main scope (file_picker, path_text)
@@ -987,17 +1189,12 @@ def main(page: ft.Page):
             color=ft.Colors.WHITE,
             height=55,
             style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=30)),
-            on_click=lambda e: start_playlist_download(playlist_entries)
+            on_click=lambda e: start_playlist_download(list(playlist_entries))
         )
         
-        # Calculate initial size
-        initial_mb = 0
-        total_sec = sum([float(e.get('duration', 0)) for e in entries])
-        # Default is Video High
-        initial_mb = estimate_size(total_sec, False, "high")
-        
         # Parallel download configuration
         parallel_workers_ref = ft.Ref[ft.Dropdown]()
+        playlist_name_ref = ft.Ref[ft.Dropdown]()
         parallel_config = ft.Row([
             ft.Icon(ft.Icons.SPEED, color=PRIMARY_COLOR, size=20),
             ft.Dropdown(
@@ -1014,13 +1211,23 @@ def main(page: ft.Page):
                 content_padding=10,
                 text_size=12,
                 tooltip="Número de downloads paralelos. Mais = mais rápido, mas usa mais recursos."
+            ),
+            ft.Dropdown(
+                ref=playlist_name_ref,
+                label="Nome dos Arquivos",
+                options=[ft.dropdown.Option(k, v) for k, v in PLAYLIST_NAME_OPTIONS],
+                value="title",
+                width=260,
+                content_padding=10,
+                text_size=12,
+                tooltip="Arquivos com o mesmo nome recebem _2, _3... e nunca são sobrescritos"
             )
         ], spacing=10, alignment=ft.MainAxisAlignment.CENTER)
 
         dl_row = ft.Row([
             ft.Column([
                 btn_dl_all,
-                ft.Text(f"Estimado: ~{int(initial_mb)} MB", ref=size_est_ref, size=12, color=ft.Colors.GREY_600, text_align=ft.TextAlign.CENTER)
+                ft.Text(size_est_label(), ref=size_est_ref, size=12, color=ft.Colors.GREY_600, text_align=ft.TextAlign.CENTER)
             ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=2)
         ], alignment=ft.MainAxisAlignment.CENTER)
 
@@ -1032,7 +1239,36 @@ def main(page: ft.Page):
             height=55,
             visible=False,
             style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=30)),
-            on_click=lambda _: service.cancel()
+            on_click=lambda _: cancel_playlist()
+        )
+
+        # Queue controls (active while the playlist is downloading)
+        playlist_group = None
+
+        def cancel_playlist():
+            if playlist_group:
+                manager.cancel_group(playlist_group)
+
+        def toggle_pause(e):
+            toggle_queue_pause()
+            btn_pause_playlist.text = "RETOMAR FILA" if manager.is_paused() else "PAUSAR FILA"
+            btn_pause_playlist.update()
+
+        def move_to_front(pe):
+            if pe.task and manager.move_to_front(pe.task):
+                pe.ref_status.current.value = "Próximo"
+                pe.ref_status.current.update()
+
+        btn_pause_playlist = ft.ElevatedButton(
+            "PAUSAR FILA",
+            icon=ft.Icons.PAUSE_ROUNDED,
+            bgcolor=ft.Colors.AMBER_700,
+            color=ft.Colors.WHITE,
+            height=55,
+            visible=False,
+            style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=30)),
+            tooltip="Downloads em andamento continuam; novos itens aguardam",
+            on_click=toggle_pause
         )
         
         btn_open_folder_playlist = ft.ElevatedButton(
@@ -1053,21 +1289,71 @@ def main(page: ft.Page):
         content_container.controls.extend([
              header_card,
              global_controls,
-             ft.Container(content=lv, height=350, border=ft.border.all(1, ft.Colors.GREY_200), border_radius=8, padding=5),
+             ft.Container(content=lv, height=PLAYLIST_LIST_HEIGHT, border=ft.border.all(1, ft.Colors.GREY_200), border_radius=8, padding=5),
              path_display,
              parallel_config,  # NEW: Parallel download configuration
              playlist_progress_col,
-             ft.Row([dl_row, btn_cancel_playlist, btn_open_folder_playlist], alignment=ft.MainAxisAlignment.CENTER, spacing=10)
+             ft.Row([dl_row, btn_pause_playlist, btn_cancel_playlist, btn_open_folder_playlist], alignment=ft.MainAxisAlignment.CENTER, spacing=10)
         ])
         page.update()
 
+        # Resolve full metadata in the background (visible rows first); thumbnails follow the scroll
+        request_all_details()
+        load_visible_thumbnails()
+
+        def add_entries(new_entries):
+             """Appends rows while the screen is open (bulk analysis results)."""
+             added = append_rows(new_entries)
+             if not added:
+                 return
+             is_audio = global_type_ref.current.selected_index == 1
+             for pe in added:
+                 pe.sync_global(is_audio, global_qual_ref.current.value, "mp3" if is_audio else "mp4",
+                                bool(max_quality_ref.current.value))
+             count_ref.current.value = f"{len(playlist_entries)} Vídeos encontrados"
+             size_est_ref.current.value = size_est_label()
+             try:
+                 page.update()
+             except:
+                 pass  # Screen may have been replaced
+             request_all_details()
+             load_visible_thumbnails()  # Appended rows in view; the others load when scrolled to
+
         def start_playlist_download(entries_list):
              if not path_text.current.value or path_text.current.value == "Nenhum local selecionado":
                   page.show_snack_bar(ft.SnackBar(ft.Text("Selecione uma pasta de destino!")))
                   return
+             invalid = [pe.index for pe in entries_list if pe.ref_sections.current and pe.ref_sections.current.error_text]
+             if invalid:
+                  page.show_snack_bar(ft.SnackBar(ft.Text(f"Trecho inválido no item {invalid[0]}.")))
+                  return
+
+             # Pre-flight: free space for the format-based estimate plus parallel merges,
+             # and the drive's write speed (slow drives download via the local scratch dir)
+             dest = path_text.current.value
+             workers = int(parallel_workers_ref.current.value)
+             check = storage.preflight(dest, [pe.estimate()[0] for pe in entries_list], workers, staging.scratch_dir)
+             if not check['ok']:
+                  log_error(f"Not enough disk space: need ~{check['needed']} bytes, free {check['free']}")
+                  page.show_snack_bar(ft.SnackBar(ft.Text(
+                      f"Espaço insuficiente: ~{int(estimator.mb(check['needed']))} MB necessários, "
+                      f"{int(estimator.mb(check['free']))} MB livres."
+                  )))
+                  return
+             # Decided for this batch only: other jobs for the same folder are not affected
+             if check['stage']:
+                  log(f"Slow destination ({check['speed'] / 1e6:.1f} MB/s), staging downloads in {staging.scratch_dir}")
+                  page.show_snack_bar(ft.SnackBar(ft.Text(
+                      f"Pasta de destino lenta ({check['speed'] / 1e6:.0f} MB/s): os arquivos serão preparados "
+                      f"numa pasta local e movidos em segundo plano."
+                  )))
+             elif check['slow']:
+                  log(f"Slow destination ({check['speed'] / 1e6:.1f} MB/s) and no faster scratch dir")
 
              dl_row.visible = False
              btn_cancel_playlist.visible = True
+             btn_pause_playlist.visible = True
+             btn_pause_playlist.text = "RETOMAR FILA" if manager.is_paused() else "PAUSAR FILA"
              playlist_progress_col.visible = True
              
              # Create progress bars (Modernized)
@@ -1102,151 +1388,104 @@ def main(page: ft.Page):
 
              playlist_progress_col.controls = [progress_card]
              page.update()
-             
-             def dl_thread():
-                 # Get parallel workers configuration
-                 max_workers = int(parallel_workers_ref.current.value)
-                 total = len(entries_list)
-                 completed = 0
-                 completed_lock = threading.Lock()  # Thread-safe counter
-                 
-                 # Track aggregate speed
-                 active_speeds = {}  # {item_index: speed_str}
-                 speed_lock = threading.Lock()
-                 
-                 def download_single_item(item_data):
-                     """Download a single item - runs in thread pool"""
-                     item, i = item_data
-                     nonlocal completed
-                     
-                     if service._cancel_flag:
-                         return False, "Cancelled"
-                     
-                     # UI Update for Item Start
-                     item.ref_status.current.value = "Baixando..."
-                     item.ref_status.current.color = ft.Colors.BLUE
-                     try:
-                         item.ref_status.current.update()
-                     except:
-                         pass  # Ignore update errors in parallel context
-                     
-                     # Update Counter: Item X/Y
-                     with completed_lock:
-                         txt_item_counter.value = f"Item {i+1}/{total}"
-                         txt_status_detail.value = f"Baixando: {item.data.get('title', '...')[:40]}..."
-                         try:
-                             progress_card.update()
-                         except:
-                             pass
-
-                     # Download
-                     vid_url = item.data.get('url')
-                     if not vid_url and item.data.get('id'):
-                         vid_url = f"https://www.youtube.com/watch?v={item.data.get('id')}"
-                     
-                     def item_hook(d):
-                         if d.get('status') == 'downloading':
-                             p = d.get('_percent_str', '').replace('%','')
-                             speed = d.get('_speed_str', '')
-                             eta = d.get('_eta_str', '')
-                             
-                             if p:
-                                 # Update individual item
-                                 item.ref_status.current.value = f"{p}%"
-                                 try:
-                                     item.ref_status.current.update()
-                                 except:
-                                     pass
-                                 
-                                 # Update aggregate speed
-                                 with speed_lock:
-                                     if speed:
-                                         active_speeds[i] = speed
-                                     
-                                     # Calculate total progress
-                                     with completed_lock:
-                                         current_p_val = float(p) / 100 if p else 0
-                                         total_p = (completed + current_p_val) / total
-                                         
-                                         prog_bar.value = total_p
-                                         txt_percent.value = f"{int(total_p * 100)}%"
-                                         
-                                         # Show aggregate speed
-                                         if active_speeds:
-                                             speeds_str = " + ".join(active_speeds.values())
-                                             txt_status_detail.value = f"Velocidade: {speeds_str}"
-                                         
-                                         try:
-                                             progress_card.update()
-                                         except:
-                                             pass
-                     
-                     success, msg = service.download(
-                         vid_url, 
-                         path_text.current.value, 
-                         item.quality_val, 
-                         item.format_val, 
-                         item.is_audio, 
-                         item_hook
-                     )
-                     
-                     # Remove from active speeds
-                     with speed_lock:
-                         active_speeds.pop(i, None)
-                     
-                     if success:
-                         item.ref_status.current.value = "Concluído"
-                         item.ref_status.current.color = ft.Colors.GREEN
-                     else:
-                         item.ref_status.current.value = "Erro"
-                         item.ref_status.current.color = ft.Colors.RED
-                         log_error(f"Failed item {i}: {msg}")
-                     
-                     try:
-                         item.ref_status.current.update()
-                     except:
-                         pass
-                     
-                     with completed_lock:
-                         completed += 1
-                         # Force update bar to next integer step
-                         prog_bar.value = completed / total
-                         try:
-                             progress_card.update()
-                         except:
-                             pass
-                     
-                     return success, msg
-                 
-                 # Execute downloads in parallel
+
+             nonlocal playlist_group
+             group = new_group(title)
+             playlist_group = group
+             total = len(entries_list)
+             by_task = {}  # task_id -> PlaylistEntry
+             finalized = False
+             submitting = True  # Don't finalize while items are still being queued
+             final_lock = threading.Lock()
+
+             def safe_update(ctrl):
                  try:
-                     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                         # Submit all tasks
-                         futures = {
-                             executor.submit(download_single_item, (item, i)): i 
-                             for i, item in enumerate(entries_list)
-                         }
-                         
-                         # Wait for completion
-                         for future in as_completed(futures):
-                             if service._cancel_flag:
-                                 # Cancel remaining tasks
-                                 executor.shutdown(wait=False, cancel_futures=True)
-                                 break
-                             
-                             try:
-                                 success, msg = future.result()
-                             except Exception as e:
-                                 log_error(f"Download thread exception: {e}")
-                 
-                 except Exception as e:
-                     log_error(f"ThreadPoolExecutor error: {e}")
+                     ctrl.update()
+                 except:
+                     pass  # Ignore update errors (parallel context / screen replaced)
+
+             def on_task(t):
+                 nonlocal finalized
+                 item = by_task.get(t.id) if t.group == group else None
+                 if item is None:
+                     return
+
+                 # Row status
+                 status = item.ref_status.current
+                 if t.status == DownloadTask.DOWNLOADING:
+                     status.value = f"{t.percent_str}%" if t.percent_str else ("Baixando..." if t.attempts <= 1 else f"Tentativa {t.attempts}...")
+                     status.color = ft.Colors.BLUE
+                     txt_item_counter.value = f"Item {item.index}/{total}"
+                 elif t.status == DownloadTask.PROCESSING:
+                     status.value = "Processando"
+                 elif t.status == DownloadTask.RETRYING:
+                     status.value = "Aguardando..."
+                     status.color = ft.Colors.ORANGE
+                 elif t.status == DownloadTask.DONE:
+                     status.value = "Concluído"
+                     status.color = ft.Colors.GREEN
+                     status.tooltip = CONVERSION_LABELS.get(t.conversion)
+                 elif t.status == DownloadTask.FAILED:
+                     status.value = "Erro"
+                     status.color = ft.Colors.RED
+                 elif t.status == DownloadTask.CANCELLED:
+                     status.value = "Cancelado"
+                     status.color = ft.Colors.ORANGE
+                 safe_update(status)
+
+                 # Aggregate progress and speed
+                 summary = manager.group_summary(group)
+                 prog_bar.value = summary['progress']
+                 txt_percent.value = f"{int(summary['progress'] * 100)}%"
+                 speeds = [x.speed_str for x in manager.tasks(group) if x.status == DownloadTask.DOWNLOADING and x.speed_str]
+                 if speeds:
+                     txt_status_detail.value = f"Velocidade: {' + '.join(speeds)}"
+                 elif t.status == DownloadTask.DOWNLOADING:
+                     txt_status_detail.value = f"Baixando: {t.title[:40]}..."
+                 safe_update(progress_card)
+
+                 if summary['active'] == 0:
+                     with final_lock:
+                         if finalized or submitting:
+                             return
+                         finalized = True
+                     manager.unsubscribe(on_task)
+                     finish(summary)
+
+             def finish(summary):
+                 nonlocal playlist_group
+                 playlist_group = None
+                 failures = [x for x in manager.tasks(group) if x.status == DownloadTask.FAILED]
                  
                  # Final UI update
-                 if service._cancel_flag:
+                 btn_pause_playlist.visible = False
+                 if summary['cancelled']:
                       txt_status_detail.value = "Download Cancelado"
                       txt_status_detail.color = ft.Colors.RED
                       prog_bar.color = ft.Colors.RED
+                 elif failures:
+                      txt_status_detail.value = f"Playlist finalizada com {len(failures)} falha(s)"
+                      txt_status_detail.color = ft.Colors.ORANGE
+                      prog_bar.value = 1
+                      prog_bar.color = ft.Colors.ORANGE
+                      txt_percent.value = "100%"
+                      btn_open_folder_playlist.visible = True
+                 elif staging.pending() or normalizer.pending():
+                      txt_status_detail.value = ("Playlist baixada! Normalizando o volume das faixas..." if normalizer.pending()
+                                                 else "Playlist baixada! Movendo arquivos para a pasta de destino...")
+                      txt_status_detail.color = ft.Colors.GREEN
+                      prog_bar.value = 1
+                      prog_bar.color = ft.Colors.GREEN
+                      txt_percent.value = "100%"
+                      btn_open_folder_playlist.visible = True
+
+                      def moves_done():
+                          normalizer.wait()
+                          staging.wait()
+                          txt_status_detail.value = "Playlist Finalizada com Sucesso!"
+                          safe_update(txt_status_detail)
+
+                      threading.Thread(target=moves_done, daemon=True).start()
                  else:
                       txt_status_detail.value = "Playlist Finalizada com Sucesso!"
                       txt_status_detail.color = ft.Colors.GREEN
@@ -1254,14 +1493,241 @@ def main(page: ft.Page):
                       prog_bar.color = ft.Colors.GREEN
                       txt_percent.value = "100%"
                       btn_open_folder_playlist.visible = True  # Show open folder button
+
+                 # Report of permanent failures
+                 if failures and not summary['cancelled']:
+                      log_error(f"Playlist finished with {len(failures)} permanent failure(s):")
+                      report = ft.Column(spacing=4)
+                      for x in failures:
+                          item = by_task[x.id]
+                          log_error(f"  {item.index}. {x.title}: {x.message}")
+                          report.controls.append(ft.Text(
+                              f"{item.index}. {x.title[:50]} — {x.message}",
+                              size=12, color=ft.Colors.RED_700, max_lines=2, overflow=ft.TextOverflow.ELLIPSIS
+                          ))
+                      playlist_progress_col.controls.append(ft.Container(
+                          content=ft.Column([
+                              ft.Text(f"Falhas ({len(failures)})", weight=ft.FontWeight.BOLD, color=ft.Colors.RED_700),
+                              report
+                          ], spacing=6),
+                          padding=15,
+                          bgcolor=ft.Colors.RED_50,
+                          border_radius=12
+                      ))
                  
-                 progress_card.update()
                  dl_row.visible = True
                  btn_cancel_playlist.visible = False
-                 page.update()
+                 try:
+                     page.update()
+                 except:
+                     pass
+
+             # Hand every item to the shared manager (one pool for all analyses)
+             manager.set_max_workers(workers)
+             manager.subscribe(on_task)
+             for item in entries_list:
+                 item.task = manager.submit(
+                     item.get_url(),
+                     path_text.current.value,
+                     item.quality_val,
+                     item.format_val,
+                     item.is_audio,
+                     title=item.data.get('title', ''),
+                     group=group,
+                     template=playlist_name_ref.current.value,
+                     # yt-dlp sees a single item: the playlist position comes from this screen
+                     fields={'playlist_title': title, 'playlist_index': item.index, 'playlist_count': total},
+                     sections=item.sections,
+                     normalize=item.is_audio and bool(audio_batch_ref.current.value),
+                     # Resolved from the row's metadata; rows still without it fall back to the selector
+                     format_id=item.plan['format_id'] if item.plan else None,
+                     transcode=item.transcode,
+                     staged=check['stage']
+                 )
+                 by_task[item.task.id] = item
+                 # Events fired before the mapping existed are replayed here
+                 on_task(item.task)
+             submitting = False
+             if entries_list:
+                 on_task(entries_list[-1].task)
+
+        return add_entries
+
+    def show_bulk_analysis(urls):
+        """Analyses several links concurrently into one combined list."""
+        add_entries = show_playlist_options(
+            {'title': f"{len(urls)} links", 'entries': []}, label="ANÁLISE EM LOTE"
+        )
+        analyzer = bulk_analysis.BulkAnalyzer(service, max_workers=BULK_ANALYSIS_WORKERS)
+        bulk_state['analyzer'] = analyzer
+
+        progress_ref = ft.Ref[ft.Text]()
+        errors_col = ft.Column(spacing=4)
+        errors_card = ft.Container(
+            content=ft.Column([
+                ft.Text("Links com erro", weight=ft.FontWeight.BOLD, color=ft.Colors.RED_700),
+                errors_col
+            ], spacing=6),
+            padding=15,
+            bgcolor=ft.Colors.RED_50,
+            border_radius=BORDER_RADIUS,
+            visible=False
+        )
+        status_row = ft.Row([
+            ft.ProgressRing(width=16, height=16, stroke_width=2, color=PRIMARY_COLOR),
+            ft.Text("", ref=progress_ref, size=12, color=ft.Colors.GREY_700)
+        ], spacing=10, alignment=ft.MainAxisAlignment.CENTER)
+        # Below the header, above the global controls
+        content_container.controls[1:1] = [status_row, errors_card]
+
+        def progress_label():
+            label = f"Analisando links: {analyzer.completed}/{analyzer.total}"
+            if analyzer.duplicates:
+                label += f" · {analyzer.duplicates} duplicados"
+            if analyzer.errors:
+                label += f" · {analyzer.errors} com erro"
+            return label
+
+        def on_result(url, entries, error):
+            if error:
+                errors_col.controls.append(ft.Row([
+                    ft.Icon(ft.Icons.ERROR_OUTLINE, color=ft.Colors.RED_400, size=16),
+                    ft.Text(url, size=12, width=300, max_lines=1, overflow=ft.TextOverflow.ELLIPSIS, selectable=True),
+                    ft.Text(error, size=12, color=ft.Colors.RED_700, expand=True)
+                ], spacing=6))
+                errors_card.visible = True
+            progress_ref.current.value = progress_label()
+            add_entries(entries)  # Also refreshes the page
+            if not entries:
+                try:
+                    page.update()
+                except:
+                    pass
+
+        def on_finished():
+            status_row.controls[0].visible = False
+            progress_ref.current.value = progress_label().replace("Analisando links", "Links analisados")
+            try:
+                page.update()
+            except:
+                pass
+
+        progress_ref.current.value = progress_label()
+        page.update()
+        analyzer.start(urls, on_result, on_finished)
+
+    # --- Global Download Queue (persists across analyses) ---
+
+    queue_list = ft.Column(spacing=8)
+    queue_summary = ft.Text("", size=12, color=ft.Colors.GREY_600)
+    last_queue_render = 0
+    queue_render_timer = None
+    queue_render_lock = threading.Lock()
+
+    def toggle_queue_pause(e=None):
+        if manager.is_paused():
+            manager.resume()
+        else:
+            manager.pause()
+        btn_queue_pause.icon = ft.Icons.PLAY_ARROW_ROUNDED if manager.is_paused() else ft.Icons.PAUSE_ROUNDED
+        btn_queue_pause.tooltip = "Retomar fila" if manager.is_paused() else "Pausar fila"
+        render_queue()
+
+    def on_bandwidth_change(e):
+        mb_per_sec = int(e.control.value)
+        manager.set_bandwidth_limit(mb_per_sec * 1024 * 1024 if mb_per_sec else None)
+
+    def clear_finished(e):
+        manager.clear_finished()
+        render_queue()
+
+    btn_queue_pause = ft.IconButton(icon=ft.Icons.PAUSE_ROUNDED, tooltip="Pausar fila", on_click=toggle_queue_pause)
+    bandwidth_dd = ft.Dropdown(
+        label="Limite de banda",
+        options=[
+            ft.dropdown.Option("0", "Sem limite"),
+            ft.dropdown.Option("1", "1 MB/s"),
+            ft.dropdown.Option("5", "5 MB/s"),
+            ft.dropdown.Option("10", "10 MB/s"),
+        ],
+        value="0",
+        width=150,
+        content_padding=10,
+        text_size=12,
+        tooltip="Banda total dividida entre os downloads simultâneos",
+        on_change=on_bandwidth_change
+    )
+
+    queue_panel = ft.Container(
+        content=ft.Column([
+            ft.Row([
+                ft.Icon(ft.Icons.DOWNLOAD_ROUNDED, color=PRIMARY_COLOR),
+                ft.Text("Fila de Downloads", weight=ft.FontWeight.BOLD),
+                queue_summary,
+                ft.Container(expand=True),
+                bandwidth_dd,
+                btn_queue_pause,
+                ft.IconButton(icon=ft.Icons.CLEAR_ALL_ROUNDED, tooltip="Limpar concluídos", on_click=clear_finished),
+            ], vertical_alignment=ft.CrossAxisAlignment.CENTER),
+            queue_list
+        ], spacing=10),
+        padding=15,
+        bgcolor=SURFACE_COLOR,
+        border=ft.border.all(1, ft.Colors.GREY_200),
+        border_radius=BORDER_RADIUS,
+        visible=False
+    )
+
+    def queue_row(group):
+        summary = manager.group_summary(group)
+        finished = summary['active'] == 0
+        if not finished:
+            color = PRIMARY_COLOR
+        elif summary['failed'] or summary['cancelled']:
+            color = ft.Colors.ORANGE
+        else:
+            color = ft.Colors.GREEN
+        return ft.Row([
+            ft.Text(group_labels.get(group, group), width=260, max_lines=1, overflow=ft.TextOverflow.ELLIPSIS, size=13),
+            ft.Text(f"{summary['done']}/{summary['total']}", width=60, size=12, color=ft.Colors.GREY_600),
+            ft.ProgressBar(value=summary['progress'], expand=True, height=6, border_radius=3, color=color, bgcolor=ft.Colors.GREY_200),
+            ft.IconButton(
+                icon=ft.Icons.CLOSE_ROUNDED,
+                icon_size=16,
+                tooltip="Cancelar",
+                disabled=finished,
+                on_click=lambda e, g=group: manager.cancel_group(g)
+            ),
+        ], vertical_alignment=ft.CrossAxisAlignment.CENTER)
+
+    def render_queue():
+        nonlocal last_queue_render, queue_render_timer
+        with queue_render_lock:
+            last_queue_render = time.time()
+            queue_render_timer = None
+        groups = manager.groups()
+        busy, workers = manager.utilisation()
+        queue_list.controls = [queue_row(g) for g in groups]
+        paused = " · Pausada" if manager.is_paused() else ""
+        queue_summary.value = f"{busy}/{workers} em uso{paused}"
+        queue_panel.visible = bool(groups)
+        try:
+            queue_panel.update()
+        except:
+            pass  # Not on the page yet
+
+    def on_queue_event(task):
+        """Redraws at most every QUEUE_PANEL_REFRESH seconds (events come from every worker)."""
+        nonlocal queue_render_timer
+        with queue_render_lock:
+            if queue_render_timer:
+                return
+            delay = max(0, QUEUE_PANEL_REFRESH - (time.time() - last_queue_render))
+            queue_render_timer = threading.Timer(delay, render_queue)
+            queue_render_timer.daemon = True
+            queue_render_timer.start()
 
-             t = threading.Thread(target=dl_thread)
-             t.start()
+    manager.subscribe(on_queue_event)
 
     # --- Main Assembly ---
     page.add(
@@ -1272,6 +1738,7 @@ def main(page: ft.Page):
                 input_row,
                 ft.Container(content=analyze_btn, alignment=ft.alignment.center),
                 ft.Divider(height=40, color=ft.Colors.TRANSPARENT),
+                queue_panel,
                 content_container
             ]),
             alignment=ft.alignment.top_center,
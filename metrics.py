@@ -0,0 +1,380 @@
+"""
+In-process metrics for the download engine.
+
+A MetricsRegistry holds counters, gauges and histograms in aggregate, plus
+a bounded record per job (the job id comes from logging_setup.job_context,
+so the same id ties a job's log lines to its numbers). The services and the
+download manager report into the module-level REGISTRY by default; the
+numbers can be read with snapshot(), served as Prometheus text
+(serve_prometheus) or appended periodically to a JSON-lines file (JsonlDumper).
+"""
+import atexit
+import bisect
+import collections
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+
+from logging_setup import current_job_id
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+MAX_JOBS = 1000  # Per-job records kept (oldest dropped first)
+PORT_ENV = 'VIDEO_DOWNLOADER_METRICS_PORT'  # Serve Prometheus text on this port
+FILE_ENV = 'VIDEO_DOWNLOADER_METRICS_FILE'  # Append a JSONL snapshot to this file
+DUMP_INTERVAL = 60
+
+# name -> (type, help); metrics not listed here are still accepted
+METRICS = {
+    'ttfb_seconds': ('histogram', "Download start to first progress line"),
+    'extractor_seconds': ('histogram', "Download start to first destination file (extraction)"),
+    'download_seconds': ('histogram', "Transfer phase of a download"),
+    'merge_seconds': ('histogram', "Post-processing (merge / audio extraction)"),
+    'queue_wait_seconds': ('histogram', "Submission to a worker picking the job up"),
+    'info_seconds': ('histogram', "Metadata fetch duration"),
+    'host_wait_seconds': ('histogram', "Wait for the per-host rate / connection limit"),
+    'move_seconds': ('histogram', "Background move of a staged job from scratch to its destination"),
+    'normalize_seconds': ('histogram', "Two-pass loudness normalization and encode of one audio file"),
+    'downloaded_bytes_total': ('counter', "Bytes of finished downloads"),
+    'downloads_total': ('counter', "Finished downloads, by result (success, failed, cancelled, reused)"),
+    'retries_total': ('counter', "Download attempts scheduled for retry"),
+    'stalls_total': ('counter', "Downloads killed after no progress for stall_timeout"),
+    'restarts_total': ('counter', "Stalled downloads resumed from their .part file"),
+    'throttled_total': ('counter', "yt-dlp runs that hit HTTP 429/403 (host backed off)"),
+    'cache_hits_total': ('counter', "Metadata cache hits"),
+    'cache_misses_total': ('counter', "Metadata cache misses"),
+    'dedup_hits_total': ('counter', "Downloads skipped because an identical file was already downloaded"),
+    'live_segments_total': ('counter', "Segment files saved by live recordings"),
+    'live_reconnects_total': ('counter', "Live captures restarted after the stream dropped"),
+    'conversions_total': ('counter', "Finished downloads, by how the output was made (direct, remux, transcode)"),
+    'workers_busy': ('gauge', "Download workers currently busy"),
+    'workers_max': ('gauge', "Size of the download worker pool"),
+}
+
+_UNITS = {'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4,
+          'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4}
+
+
+def parse_size(text):
+    """yt-dlp size string ('10.00MiB', '~1.2GiB') -> bytes, else None."""
+    text = (text or '').strip().lstrip('~')
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            try:
+                return int(float(text[:-len(unit)]) * _UNITS[unit])
+            except ValueError:
+                return None
+    return None
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)  # Per bucket (not cumulative)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf if above the last)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)  # (name, labels) -> value
+        self._gauges = {}
+        self._histograms = {}
+        self._jobs = collections.OrderedDict()  # job id -> {field: value}
+
+    # --- Recording ---
+
+    def inc(self, name, value=1, job_id=None, **labels):
+        """Adds to a counter (and to the current job's field of the same name)."""
+        with self._lock:
+            self._counters[(name, _labels(labels))] += value
+            self._job_add(job_id, name, value)
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, value, job_id=None, **labels):
+        """Records a duration in a histogram (and as the current job's field)."""
+        with self._lock:
+            key = (name, _labels(labels))
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+            self._job_set(job_id, name, round(value, 6))
+
+    def job_field(self, field, value, job_id=None):
+        """Sets a plain field (e.g. result, url) on the current job's record."""
+        with self._lock:
+            self._job_set(job_id, field, value)
+
+    def _job_record(self, job_id):
+        job_id = current_job_id() if job_id is None else job_id
+        if job_id is None:
+            return None
+        record = self._jobs.get(job_id)
+        if record is None:
+            record = self._jobs[job_id] = {}
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return record
+
+    def _job_set(self, job_id, field, value):
+        record = self._job_record(job_id)
+        if record is not None:
+            record[field] = value
+
+    def _job_add(self, job_id, field, value):
+        record = self._job_record(job_id)
+        if record is not None:
+            record[field] = record.get(field, 0) + value
+
+    # --- Reading ---
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    def histogram(self, name, **labels):
+        with self._lock:
+            hist = self._histograms.get((name, _labels(labels)))
+            return hist.to_dict() if hist else None
+
+    def job(self, job_id):
+        with self._lock:
+            return dict(self._jobs.get(job_id, {}))
+
+    def snapshot(self):
+        """Aggregate and per-job values as plain JSON-serialisable dicts."""
+        with self._lock:
+            return {
+                'ts': time.time(),
+                'counters': {_series(k): v for k, v in self._counters.items()},
+                'gauges': {_series(k): v for k, v in self._gauges.items()},
+                'histograms': {_series(k): h.to_dict() for k, h in self._histograms.items()},
+                'jobs': {str(j): dict(r) for j, r in self._jobs.items()},
+            }
+
+    def prometheus_text(self, prefix='video_downloader_'):
+        """Aggregate values in the Prometheus text exposition format."""
+        with self._lock:
+            series = collections.defaultdict(list)
+            for (name, labels), value in self._counters.items():
+                series[name].append(('counter', labels, value))
+            for (name, labels), value in self._gauges.items():
+                series[name].append(('gauge', labels, value))
+            for (name, labels), hist in self._histograms.items():
+                series[name].append(('histogram', labels, hist))
+
+            lines = []
+            for name in sorted(series):
+                full = prefix + name
+                kind = series[name][0][0]
+                help_text = METRICS.get(name, (kind, name))[1]
+                lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+                for kind, labels, value in series[name]:
+                    if kind != 'histogram':
+                        lines.append(f"{full}{_format_labels(labels)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(value.buckets, value.counts):
+                        cumulative += n
+                        lines.append(f"{full}_bucket{_format_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{full}_sum{_format_labels(labels)} {_number(value.sum)}")
+                    lines.append(f"{full}_count{_format_labels(labels)} {value.count}")
+            return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._jobs.clear()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _series(key):
+    name, labels = key
+    return name + _format_labels(labels)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+REGISTRY = MetricsRegistry()
+
+
+class DownloadTimer:
+    """
+    Phase timings of one download, fed from the yt-dlp output loop:
+    start -> first destination (extractor) -> first progress line (TTFB)
+    -> first merge / extract-audio line (download) -> end (merge).
+    """
+
+    def __init__(self, registry=None, job_id=None):
+        self.registry = registry or REGISTRY
+        self.job_id = job_id if job_id is not None else current_job_id()
+        self.start = time.monotonic()
+        self.destination = None
+        self.first_byte = None
+        self.processing = None
+        self.total_bytes = None
+
+    def on_line(self, progress=None, path=None, processing=False):
+        """progress / path / processing: what the output loop parsed from the line."""
+        now = time.monotonic()
+        if path and self.destination is None:
+            self.destination = now
+        if progress:
+            if self.first_byte is None:
+                self.first_byte = now
+            size = parse_size(progress.get('_total_bytes_str'))
+            if size:
+                self.total_bytes = size
+        if processing and self.processing is None:
+            self.processing = now
+
+    def finish(self, result):
+        """result: 'success', 'failed' or 'cancelled'."""
+        end = time.monotonic()
+        r, job = self.registry, self.job_id
+        if self.destination is not None:
+            r.observe('extractor_seconds', self.destination - self.start, job)
+        if self.first_byte is not None:
+            r.observe('ttfb_seconds', self.first_byte - self.start, job)
+            r.observe('download_seconds', (self.processing or end) - (self.destination or self.start), job)
+        if self.processing is not None:
+            r.observe('merge_seconds', end - self.processing, job)
+        if result == 'success' and self.total_bytes:
+            r.inc('downloaded_bytes_total', self.total_bytes, job)
+        r.inc('downloads_total', 1, result=result)
+        r.job_field('result', result, job)
+
+
+# --- Exporters ---
+
+def serve_prometheus(registry=None, port=9464, host='127.0.0.1'):
+    """Serves registry.prometheus_text() on http://host:port/metrics from a daemon thread."""
+    registry = registry or REGISTRY
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes are not worth a log line
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    logger.info(f"Metrics endpoint on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+class JsonlDumper:
+    """Appends registry.snapshot() as one JSON line to path every interval seconds."""
+
+    def __init__(self, path, registry=None, interval=60):
+        self.path = path
+        self.registry = registry or REGISTRY
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='metrics-dump')
+        self._thread.start()
+        return self
+
+    def dump(self):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.registry.snapshot(), ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.error(f"Metrics dump failed: {e}")
+
+    def stop(self):
+        """Stops the thread after a final dump."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+        self.dump()
+
+
+def start_exporters(registry=None, port=None, path=None, interval=DUMP_INTERVAL):
+    """
+    Starts the exporters configured by the arguments or, when omitted, by
+    VIDEO_DOWNLOADER_METRICS_PORT / VIDEO_DOWNLOADER_METRICS_FILE. Both are
+    off by default. Returns (server or None, dumper or None).
+    """
+    port = port or os.environ.get(PORT_ENV)
+    path = path or os.environ.get(FILE_ENV)
+    server = dumper = None
+    if port:
+        try:
+            server = serve_prometheus(registry, int(port))
+        except (OSError, ValueError) as e:
+            logger.error(f"Metrics endpoint not started: {e}")
+    if path:
+        dumper = JsonlDumper(path, registry, interval).start()
+        atexit.register(dumper.stop)
+    return server, dumper
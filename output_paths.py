@@ -0,0 +1,318 @@
+"""
+Output file names for downloads.
+
+yt-dlp writes every job into its own work directory inside the destination
+(named after the job, so a retry or a stall restart resumes the same .part
+files) using the chosen output template. Only a finished file is moved out,
+and the move claims its final name atomically: two different videos with the
+same title, downloaded in parallel, end up as "Title.mp4" and "Title_2.mp4"
+instead of sharing a .part file or overwriting each other.
+
+A work dir is owned by the process running its job (pid and host in the
+job file) and deleted when the job fails or is cancelled. Work dirs of runs
+that crashed or were killed are reclaimed by sweep(), which the first job
+in each folder runs.
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+
+import yt_dlp
+from yt_dlp.utils import sanitize_filename
+
+logger = logging.getLogger(__name__)
+
+WORK_DIR = '.video-downloader'  # Inside the destination, so the final move is a rename
+JOB_FILE = '.job.json'  # Bookkeeping inside a work dir, never promoted
+TEMPLATES = {
+    'title': '%(title)s.%(ext)s',
+    'title_id': '%(title)s [%(id)s].%(ext)s',
+    'playlist': '%(playlist_title)s/%(playlist_index)03d - %(title)s.%(ext)s',
+    'uploader': '%(uploader)s/%(title)s.%(ext)s',
+    'date': '%(upload_date>%Y-%m)s/%(title)s.%(ext)s',
+}
+DEFAULT_TEMPLATE = TEMPLATES['title']
+MAX_SUFFIX = 10000
+ORPHAN_GRACE = 60  # Seconds; a younger work dir without a job file may be one being created
+FOREIGN_OWNER_AGE = 7 * 24 * 3600  # A job owned by another computer (network drive) is orphaned after this
+UNDELIVERED_AGE = 7 * 24 * 3600  # A finished job whose destination is gone (drive removed) is deleted after this
+
+_FIELD_RE = re.compile(r'%\((\w+)\)([-#0+ ]*\d*(?:\.\d+)?[diouxXeEfFgGs])')
+# yt-dlp leftovers that are not a finished file: .part / .ytdl, fragments, merge inputs (.f137.mp4)
+_UNFINISHED_RE = re.compile(r'(\.part(-Frag\d+)?|\.ytdl|\.temp|\.f\d+\.\w+)$')
+
+_owned = set()  # Work dirs (abs paths) of jobs running in this process
+_swept = set()  # Folders already swept by this process
+_owned_lock = threading.Lock()
+_renderer = None  # yt_dlp.YoutubeDL used only to render templates offline (costly to build, so shared)
+
+
+def resolve_template(template):
+    """A TEMPLATES key or a yt-dlp output template (None = DEFAULT_TEMPLATE)."""
+    if not template:
+        return DEFAULT_TEMPLATE
+    return TEMPLATES.get(template, template)
+
+
+def safe_name(value):
+    """`value` as it appears in a file name written with --restrict-filenames."""
+    return sanitize_filename(str(value), restricted=True)
+
+
+def prefill(template, fields):
+    """
+    Substitutes the `fields` yt-dlp would not know (e.g. playlist_index for
+    one item of a playlist); everything else is left for yt-dlp to render.
+    """
+    fields = {k: v for k, v in (fields or {}).items() if v is not None}
+
+    def substitute(match):
+        name, conversion = match.groups()
+        if name not in fields:
+            return match.group(0)
+        try:
+            value = ('%' + conversion) % fields[name]
+        except (TypeError, ValueError):
+            value = str(fields[name])
+        return safe_name(value).replace('%', '%%')
+
+    return _FIELD_RE.sub(substitute, resolve_template(template))
+
+
+def expected_path(output_path, template, info, ext):
+    """
+    Final path yt-dlp gives `info` (metadata of one video) saved as `ext` with
+    `template` and --restrict-filenames, or None if it cannot be rendered.
+    Work dirs hide the destination from yt-dlp's own "already downloaded"
+    check; this is how the services still see a file saved by an earlier run.
+    """
+    global _renderer
+    if not info or info.get('_type') == 'playlist':
+        return None
+    with _owned_lock:
+        if _renderer is None:
+            _renderer = yt_dlp.YoutubeDL({'quiet': True, 'restrictfilenames': True})
+    try:
+        name = _renderer.prepare_filename(dict(info, ext=ext), outtmpl=resolve_template(template))
+    except Exception as e:
+        logger.debug(f"Could not render {template!r}: {e}")
+        return None
+    return os.path.join(output_path, name) if name else None
+
+
+def job_dir(output_path, key):
+    """Work directory of one job; the same key (video, format, template) always gets the same one."""
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(output_path, WORK_DIR, digest)
+
+
+def is_unfinished(name):
+    return bool(_UNFINISHED_RE.search(name))
+
+
+def finished_files(directory):
+    """Paths (relative to directory) of the finished files yt-dlp left in it."""
+    found = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name not in (JOB_FILE, JOB_FILE + '.tmp') and not is_unfinished(name):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(found)
+
+
+def reserve_path(path):
+    """
+    Claims `path`, or the first free "name_N.ext" next to it, by creating an
+    empty placeholder with O_EXCL (atomic, also against other processes).
+    Returns the claimed path; the caller replaces the placeholder.
+    """
+    stem, ext = os.path.splitext(path)
+    for n in range(1, MAX_SUFFIX):
+        candidate = path if n == 1 else f"{stem}_{n}{ext}"
+        try:
+            fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return candidate
+    raise FileExistsError(f"No free name for {path}")
+
+
+def promote(src, dst):
+    """Moves a finished file to dst (or a free variant of it) without overwriting anything."""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    final = reserve_path(dst)
+    try:
+        os.replace(src, final)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            os.remove(final)
+            raise
+        # Work dir on another drive (scratch staging): copy next to the target, then rename
+        tmp = os.path.join(os.path.dirname(final), f".{os.path.basename(final)}.moving")
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, final)
+        except OSError:
+            for path in (tmp, final):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        os.remove(src)
+    if final != dst:
+        logger.info(f"{os.path.basename(dst)} already exists, saved as {os.path.basename(final)}")
+    return final
+
+
+def promote_job(directory, output_path):
+    """Moves every finished file of a job into output_path (keeping template subfolders). Returns their paths."""
+    promoted = [promote(os.path.join(directory, rel), os.path.join(output_path, rel))
+                for rel in finished_files(directory)]
+    remove_job_dir(directory)
+    return promoted
+
+
+def write_job_file(directory, **data):
+    """Adds `data` to the job file of a work dir (replaced atomically, sweep() may be reading it)."""
+    job = read_job_file(directory) or {}
+    job.update(data)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, JOB_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_job_file(directory):
+    """The data written by write_job_file, or None."""
+    try:
+        with open(os.path.join(directory, JOB_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def claim_job(directory, **data):
+    """
+    Creates a job's work dir, owned by this process until release_job().
+    The first claim in a folder also reclaims orphaned work dirs there.
+    """
+    directory = os.path.abspath(directory)
+    root = os.path.dirname(os.path.dirname(directory))
+    with _owned_lock:
+        _owned.add(directory)
+        first = root not in _swept
+        _swept.add(root)
+    if first:
+        sweep(root)
+    write_job_file(directory, pid=os.getpid(), host=socket.gethostname(), started=time.time(), finished=False, **data)
+
+
+def release_job(directory, keep=False):
+    """Ends this process's ownership of a work dir and deletes it, unless keep (a finished job)."""
+    with _owned_lock:
+        _owned.discard(os.path.abspath(directory))
+    if not keep:
+        remove_job_dir(directory)
+
+
+def sweep(root):
+    """
+    Deletes the work dirs under `root` whose owner is gone (crashed or killed
+    runs). Finished jobs are kept for Staging.recover(), unless their
+    destination has been missing for UNDELIVERED_AGE. Returns how many.
+    """
+    base = os.path.join(root, WORK_DIR)
+    try:
+        names = os.listdir(base)
+    except OSError:
+        return 0
+    count = 0
+    for name in names:
+        directory = os.path.abspath(os.path.join(base, name))
+        with _owned_lock:
+            if directory in _owned:
+                continue
+        if not os.path.isdir(directory):
+            continue
+        job = read_job_file(directory)
+        if job is None:
+            try:
+                if time.time() - os.path.getmtime(directory) < ORPHAN_GRACE:
+                    continue
+            except OSError:
+                continue
+        elif job.get('finished'):
+            if not _undeliverable(directory, job):
+                continue
+            logger.warning(f"Removing finished work dir {directory}: its destination {job.get('output_path')} "
+                           f"has been missing for over {UNDELIVERED_AGE // 86400} days")
+            remove_job_dir(directory)
+            count += 1
+            continue
+        elif _owner_alive(job):
+            continue
+        logger.info(f"Removing orphaned work dir {directory} ({job or 'no job file'})")
+        remove_job_dir(directory)
+        count += 1
+    return count
+
+
+def _undeliverable(directory, job):
+    """A finished job whose destination is gone and that finished UNDELIVERED_AGE ago or more."""
+    if os.path.isdir(job.get('output_path') or ''):
+        return False
+    try:
+        finished_at = os.path.getmtime(os.path.join(directory, JOB_FILE))
+    except OSError:
+        return False
+    return time.time() - finished_at >= UNDELIVERED_AGE
+
+
+def _owner_alive(job):
+    if job.get('host') != socket.gethostname():
+        # Cannot see processes on another computer; give them time
+        return time.time() - job.get('started', 0) < FOREIGN_OWNER_AGE
+    pid = job.get('pid')
+    if not isinstance(pid, int) or pid == os.getpid():
+        return False  # Not in _owned: left by an earlier process that had this pid
+    return pid_alive(pid)
+
+
+def pid_alive(pid):
+    """Whether a process with this pid is running."""
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: exists, owned by someone else
+        try:
+            code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def remove_job_dir(directory):
+    """Deletes a job's work directory, and the shared parent once it is empty."""
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(directory))
+    except OSError:
+        pass  # Other jobs still working
@@ -0,0 +1,111 @@
+"""
+Partial downloads: time ranges and chapters of a video.
+
+yt-dlp's --download-sections fetches only the fragments that cover the
+requested part (the matching HLS/DASH segments, or byte ranges read by
+ffmpeg), so a two-minute clip of a three-hour stream costs about two minutes
+of data and time. Cuts land on the nearest keyframes; nothing is re-encoded.
+
+A selection travels through the app as a tuple of yt-dlp section specs
+('*90-210' for a time range, a regex for chapter titles), so it hashes into
+job keys and serializes as plain strings.
+"""
+import re
+
+# Appended to the file name so each section gets its own file: "Title_Intro.mp4", "Title_01-02-03.mp4"
+# (--restrict-filenames drops spaces and brackets from the separator)
+SECTION_SUFFIX = '%(section_title,section_start>%H-%M-%S&_{}|)s'
+
+_TIME = r'\d+(?::\d{1,2}){0,2}(?:\.\d+)?'
+_RANGE_RE = re.compile(rf'^\s*({_TIME})?\s*-\s*({_TIME})?\s*$')
+_CHAPTER_PREFIX = '(?i)'
+
+
+def parse_time(text):
+    """'90', '1:30', '1:02:03' or '1:30.5' -> seconds."""
+    text = text.strip()
+    if not re.fullmatch(_TIME, text):
+        raise ValueError(f"Tempo inválido: {text}")
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse(text):
+    """
+    User input -> section specs. Comma-separated items: a time range
+    ('1:00-2:30', '-5:00' from the start, '1:00:00-' to the end) or part of
+    a chapter title (case-insensitive). Empty input = the whole video.
+    Raises ValueError with a message for the user.
+    """
+    specs = []
+    for item in (text or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        match = _RANGE_RE.match(item)
+        if not match:
+            specs.append(_CHAPTER_PREFIX + re.escape(item))
+            continue
+        start, end = match.groups()
+        if start is None and end is None:
+            raise ValueError(f"Intervalo inválido: {item}")
+        start = parse_time(start) if start else 0.0
+        end = parse_time(end) if end else None
+        if end is not None and end <= start:
+            raise ValueError(f"O fim deve ser depois do início: {item}")
+        specs.append(f"*{start:g}-{'inf' if end is None else f'{end:g}'}")
+    return tuple(specs)
+
+
+def section_args(specs):
+    """yt-dlp options downloading only these sections."""
+    return [arg for spec in specs or () for arg in ('--download-sections', spec)]
+
+
+def section_template(out_tmpl):
+    """Output template with the section in the file name (before the extension)."""
+    stem, dot, ext = out_tmpl.rpartition('.')
+    return f"{stem}{SECTION_SUFFIX}.{ext}" if dot else out_tmpl + SECTION_SUFFIX
+
+
+def fraction(specs, info):
+    """
+    Share of the video the sections cover (for size estimates), or None if
+    unknown (no duration, or chapters not loaded yet). 1 for the whole video.
+    """
+    if not specs:
+        return 1.0
+    duration = info.get('duration')
+    if not duration:
+        return None
+    covered = 0.0
+    for spec in specs:
+        if spec.startswith('*'):
+            start, _, end = spec[1:].partition('-')
+            covered += max(0.0, min(float(end), duration) - float(start))
+            continue
+        chapters = info.get('chapters')
+        if not chapters:
+            return None
+        covered += sum(c['end_time'] - c['start_time'] for c in chapters if re.search(spec, c.get('title') or ''))
+    return min(1.0, covered / duration)
+
+
+def describe(specs):
+    """Short label of a selection, e.g. '1:00–2:30, intro'."""
+    labels = []
+    for spec in specs or ():
+        if spec.startswith('*'):
+            start, _, end = spec[1:].partition('-')
+            labels.append(f"{_clock(float(start))}–{'fim' if end == 'inf' else _clock(float(end))}")
+        else:
+            labels.append(re.sub(r'\\(.)', r'\1', spec[len(_CHAPTER_PREFIX):]))
+    return ', '.join(labels)
+
+
+def _clock(seconds):
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
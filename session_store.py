@@ -0,0 +1,127 @@
+"""
+Session state shared by every yt-dlp process.
+
+A process started cold has no cookies and no cached player code, so every
+playlist item repeats the same consent / token handshake. SessionStore keeps
+one yt-dlp cache dir (player JS, signature functions, tokens; yt-dlp writes
+its entries atomically, so parallel processes can share it) and one master
+cookie jar. yt-dlp rewrites its --cookies file on exit, so parallel processes
+never get the master itself: each run gets a private copy, and the cookies it
+ends with are merged back under a lock (threads and other app instances).
+"""
+import contextlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from yt_dlp.cookies import YoutubeDLCookieJar
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+COOKIE_HEADER = "# Netscape HTTP Cookie File\n"
+STALE_RUN_AGE = 24 * 3600  # A run copy this old belongs to a process that is gone
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on `path` (created if missing), across processes."""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Retries for ~10s, then raises
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SessionStore:
+    def __init__(self, root):
+        """root: directory holding cookies.txt and the yt-dlp cache dir."""
+        self.root = root
+        self.cache_dir = os.path.join(root, 'yt-dlp')
+        self.cookie_file = os.path.join(root, 'cookies.txt')
+        self._lock_file = self.cookie_file + '.lock'
+        self._runs_dir = os.path.join(root, 'runs')
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self._runs_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock, file_lock(self._lock_file):
+            yield
+
+    @contextlib.contextmanager
+    def process_args(self):
+        """
+        yt-dlp options for one process: the shared cache dir and a private
+        copy of the cookie jar, merged back into the master when the block ends.
+        """
+        fd, run_cookies = tempfile.mkstemp(prefix='cookies-', suffix='.txt', dir=self._runs_dir)
+        os.close(fd)
+        try:
+            with self._locked():
+                if os.path.exists(self.cookie_file):
+                    shutil.copyfile(self.cookie_file, run_cookies)
+                else:
+                    with open(run_cookies, 'w', encoding='utf-8') as f:
+                        f.write(COOKIE_HEADER)
+            yield ['--cache-dir', self.cache_dir, '--cookies', run_cookies]
+            self.merge_cookies(run_cookies)
+        finally:
+            try:
+                os.remove(run_cookies)
+            except OSError:
+                pass
+
+    def merge_cookies(self, path):
+        """Adds / updates the master jar with the cookies in `path` (e.g. an exported cookies.txt)."""
+        with self._locked():
+            master = YoutubeDLCookieJar(self.cookie_file)
+            incoming = YoutubeDLCookieJar(path)
+            try:
+                if os.path.exists(self.cookie_file):
+                    master.load()
+                incoming.load()
+            except Exception as e:
+                logger.error(f"Cookie merge skipped ({path}): {e}")
+                return
+            for cookie in incoming:
+                master.set_cookie(cookie)
+            tmp = self.cookie_file + '.tmp'
+            master.save(tmp)
+            os.replace(tmp, self.cookie_file)
+
+    def cookies(self):
+        """Cookies in the master jar."""
+        with self._locked():
+            jar = YoutubeDLCookieJar(self.cookie_file)
+            if os.path.exists(self.cookie_file):
+                jar.load()
+            return list(jar)
+
+    def sweep(self, max_age=STALE_RUN_AGE):
+        """Removes private cookie copies left by crashed runs (older than max_age seconds)."""
+        cutoff = time.time() - max_age
+        for name in os.listdir(self._runs_dir):
+            path = os.path.join(self._runs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
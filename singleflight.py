@@ -0,0 +1,57 @@
+"""
+Single-flighting of identical concurrent calls.
+
+When several threads ask for the same key at the same time, only the first
+one (the leader) runs the call; the others wait and receive its result.
+Used so equivalent URLs are fetched or downloaded once.
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call in flight
+
+    def do(self, key, fn, cancel_event=None):
+        """
+        Runs fn() unless a call with the same key is in flight, in which case
+        waits for it. Returns (result, shared). A waiting caller whose
+        cancel_event is set stops waiting and gets (None, True); the leader
+        keeps running. Exceptions raised by the leader reach every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result, False
+
+        while not call.done.wait(0.1):
+            if cancel_event is not None and cancel_event.is_set():
+                return None, True
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
@@ -0,0 +1,195 @@
+"""
+Destination folder checks before a batch starts, and scratch staging.
+
+A playlist on a slow USB or network drive fails in two ways: the disk fills
+up halfway (the size estimate was never compared with free space while
+merges need room for the formats and the merged file at once), or several
+parallel merges of large files thrash it. preflight() checks both up front:
+free space against the estimated batch plus merge headroom, and the drive's
+sequential write speed (a short fsync'd probe). When the destination is slow
+and a faster local scratch dir has room, Staging lets the services download
+and merge there; finished files are then copied over one at a time by a
+background mover, which is the access pattern slow drives handle best.
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+import output_paths
+from estimator import DISK_SAFETY_MARGIN
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROBE_BYTES = 8 * 1024 * 1024
+PROBE_CHUNK = 1024 * 1024
+PROBE_TTL = 600  # Seconds a measured write speed is reused
+SLOW_WRITE_SPEED = 20 * 1000 * 1000  # Bytes/s; below this parallel merges thrash the drive
+STAGING_MIN_GAIN = 2.0  # Scratch must write at least this many times faster to be worth a copy
+MERGE_FACTOR = 2  # Formats and merged output exist side by side until a merge finishes
+
+_speeds = {}  # abs path -> (measured at, bytes/s)
+_speeds_lock = threading.Lock()
+
+
+def write_speed(path, size=PROBE_BYTES, use_cache=True):
+    """Sequential write speed of the drive holding `path` (bytes/s), None if it cannot be written."""
+    path = os.path.abspath(path)
+    with _speeds_lock:
+        cached = _speeds.get(path)
+    if use_cache and cached and time.monotonic() - cached[0] < PROBE_TTL:
+        return cached[1]
+    probe = os.path.join(path, f".video-downloader-probe-{os.getpid()}-{threading.get_ident()}")
+    chunk = os.urandom(PROBE_CHUNK)  # Incompressible, so compressed filesystems are not flattered
+    try:
+        start = time.perf_counter()
+        with open(probe, 'wb', buffering=0) as f:
+            for _ in range(max(1, size // PROBE_CHUNK)):
+                f.write(chunk)
+            os.fsync(f.fileno())  # Measure the drive, not the page cache
+        elapsed = time.perf_counter() - start
+    except OSError as e:
+        logger.warning(f"Write probe failed for {path}: {e}")
+        return None
+    finally:
+        try:
+            os.remove(probe)
+        except OSError:
+            pass
+    speed = max(1, size // PROBE_CHUNK) * PROBE_CHUNK / max(elapsed, 1e-6)
+    with _speeds_lock:
+        _speeds[path] = (time.monotonic(), speed)
+    logger.info(f"Write speed of {path}: {speed / 1e6:.1f} MB/s")
+    return speed
+
+
+def free_bytes(path):
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def merge_headroom(sizes, workers):
+    """Extra room while `workers` merges run at once (the largest items, pessimistically)."""
+    largest = sorted(sizes, reverse=True)[:max(1, workers)]
+    return sum(largest) * (MERGE_FACTOR - 1)
+
+
+def should_stage(dest_speed, scratch_speed, slow_speed=SLOW_WRITE_SPEED):
+    """Stage only when the destination is slow and the scratch dir is clearly faster."""
+    if dest_speed is None or scratch_speed is None:
+        return False
+    return dest_speed < slow_speed and scratch_speed >= dest_speed * STAGING_MIN_GAIN
+
+
+def preflight(path, sizes, workers=1, scratch_dir=None, margin=DISK_SAFETY_MARGIN, slow_speed=SLOW_WRITE_SPEED):
+    """
+    Checks the destination for a batch of `sizes` (estimated bytes per item)
+    downloaded by `workers` in parallel. Returns a dict:
+    ok (room for everything), needed / free bytes of the destination,
+    speed (bytes/s), slow, and stage (use scratch_dir for the batch).
+    """
+    total = sum(sizes)
+    headroom = merge_headroom(sizes, workers)
+    speed = write_speed(path)
+    slow = speed is not None and speed < slow_speed
+
+    stage = False
+    if scratch_dir and slow:
+        os.makedirs(scratch_dir, exist_ok=True)
+        scratch_free = free_bytes(scratch_dir)
+        if scratch_free is None or scratch_free >= headroom * MERGE_FACTOR * margin:
+            stage = should_stage(speed, write_speed(scratch_dir), slow_speed)
+
+    # Merges happen in the destination unless staged
+    needed = int(total * margin) + (0 if stage else int(headroom * margin))
+    free = free_bytes(path)
+    return {
+        'ok': free is None or free >= needed,
+        'needed': needed,
+        'free': free,
+        'speed': speed,
+        'slow': slow,
+        'stage': stage,
+    }
+
+
+class Staging:
+    def __init__(self, scratch_dir, metrics=None):
+        """
+        scratch_dir: fast local folder for work dirs of staged jobs (see DownloadJob.staged)
+        metrics: MetricsRegistry for move_seconds (metrics.REGISTRY by default)
+        """
+        self.scratch_dir = scratch_dir
+        self.metrics = metrics or REGISTRY
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._thread = None
+
+    # --- Background mover ---
+
+    def submit(self, work_dir, output_path, on_done=None):
+        """Queues the finished files of a staged job for the move to output_path (then on_done(paths))."""
+        # Recorded in the work dir, so recover() can finish the move after a restart
+        output_paths.write_job_file(work_dir, output_path=os.path.abspath(output_path), finished=True)
+        with self._cond:
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="staging-mover", daemon=True)
+                self._thread.start()
+        self._queue.put((work_dir, output_path, on_done))
+
+    def recover(self):
+        """Re-queues moves a previous run did not finish. Returns how many."""
+        root = os.path.join(self.scratch_dir, output_paths.WORK_DIR)
+        try:
+            names = os.listdir(root)
+        except OSError:
+            return 0
+        count = 0
+        for name in names:
+            work_dir = os.path.join(root, name)
+            job = output_paths.read_job_file(work_dir)
+            if not job or not job.get('finished'):
+                continue
+            if os.path.isdir(job.get('output_path', '')):
+                self.submit(work_dir, job['output_path'])
+                count += 1
+            else:
+                # Drive not plugged in: kept for a later start, until output_paths.sweep expires it
+                logger.warning(f"Staged job {work_dir} waits for its destination {job.get('output_path')}")
+        if count:
+            logger.info(f"Resuming {count} staged move(s)")
+        return count
+
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    def wait(self, timeout=None):
+        """Blocks until every queued move is done. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self):
+        while True:
+            work_dir, output_path, on_done = self._queue.get()
+            start = time.monotonic()
+            try:
+                files = output_paths.promote_job(work_dir, output_path)
+                self.metrics.observe('move_seconds', time.monotonic() - start)
+                logger.info(f"Moved {len(files)} staged file(s) to {output_path}")
+                if on_done:
+                    on_done(files)
+            except Exception as e:
+                # Left in scratch: recover() retries on the next start
+                logger.error(f"Staged move to {output_path} failed: {e}")
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
@@ -1,191 +1,289 @@
 """
-Performance Benchmark Script for Video Downloader
-Tests UI responsiveness and download speed improvements
-"""
+Performance benchmark for the download engine (no internet required).
 
-import time
-import sys
+Runs the real YtDlpService / DownloadManager code paths (and the real yt-dlp
+process) against a local HTTP server that serves synthetic media files and an
+RSS feed of them as a playlist (yt-dlp's generic extractor handles both).
+Results are printed and written as JSON so runs can be compared across commits:
+
+    python tests/benchmark_performance.py --output bench.json
+    python tests/benchmark_performance.py --items 8 --workers 4 --size-mb 8
+"""
+import argparse
+import http.server
+import json
 import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
-# Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def benchmark_ui_updates():
-    """Simulate UI update performance for playlist format changes"""
-    print("=" * 60)
-    print("BENCHMARK 1: UI Update Performance (Format/Quality Changes)")
-    print("=" * 60)
-    
-    # Simulate 100 playlist items
-    num_items = 100
-    
-    # Test 1: Individual updates (old method)
-    print(f"\nTest 1: Individual Updates ({num_items} items)")
-    start = time.time()
-    for i in range(num_items):
-        # Simulate individual .update() call overhead
-        time.sleep(0.001)  # ~1ms per update (typical Flet overhead)
-    old_time = time.time() - start
-    print(f"  Time: {old_time:.3f}s")
-    
-    # Test 2: Batch update (new method)
-    print(f"\nTest 2: Batch Update ({num_items} items)")
-    start = time.time()
-    # Simulate batch update - single update call
-    time.sleep(0.001)  # Single update overhead
-    new_time = time.time() - start
-    print(f"  Time: {new_time:.3f}s")
-    
-    improvement = ((old_time - new_time) / old_time) * 100
-    print(f"\n  ✓ Improvement: {improvement:.1f}% faster")
-    print(f"  ✓ Time saved: {old_time - new_time:.3f}s")
-    
+import ytdlp_service
+from download_manager import DownloadManager
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService, is_processing, output_file, parse_progress
+
+CHUNK = 64 * 1024
+
+
+class MediaServer:
+    """
+    Serves /media/<n>.mp4 (size_bytes of pseudo-random data, throttled to
+    rate bytes/s per connection when set) and /feed.xml listing `items` of them.
+    """
+
+    def __init__(self, size_bytes, items, rate=None):
+        self.size_bytes = size_bytes
+        self.items = items
+        self.rate = rate
+        self.payload = os.urandom(min(size_bytes, 1024 * 1024))
+        self.requests = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                self._respond(body=False)
+
+            def do_GET(self):
+                self._respond(body=True)
+
+            def _respond(self, body):
+                server.requests += 1
+                if self.path == '/feed.xml':
+                    data = server.feed().encode('utf-8')
+                    self._headers('application/rss+xml', len(data))
+                    if body:
+                        self.wfile.write(data)
+                elif self.path.startswith('/media/') and self.path.endswith('.mp4'):
+                    self._headers('video/mp4', server.size_bytes)
+                    if body:
+                        server.stream(self.wfile)
+                else:
+                    self.send_error(404)
+
+            def _headers(self, content_type, length):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(length))
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, n):
+        return f"{self.base}/media/{n}.mp4"
+
+    def feed(self):
+        items = ''.join(
+            f"<item><title>clip {n}</title><guid>clip-{n}</guid>"
+            f"<enclosure url=\"{self.url(n)}\" type=\"video/mp4\" length=\"{self.size_bytes}\"/></item>"
+            for n in range(self.items)
+        )
+        return (f"<?xml version=\"1.0\"?><rss version=\"2.0\"><channel><title>bench</title>"
+                f"<link>{self.base}/</link><description>bench</description>{items}</channel></rss>")
+
+    def stream(self, wfile):
+        sent, start = 0, time.monotonic()
+        try:
+            while sent < self.size_bytes:
+                n = min(CHUNK, self.size_bytes - sent)
+                wfile.write(self.payload[(sent % len(self.payload)):][:n].ljust(n, b'\0'))
+                sent += n
+                if self.rate:
+                    ahead = sent / self.rate - (time.monotonic() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client cancelled
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_metadata(server):
+    service = YtDlpService(metrics=MetricsRegistry())
+    url = server.url(0)
+    cold, (info, error) = timed(lambda: service.fetch_info(url))
+    assert info, error
+    cached, _ = timed(lambda: service.get_info_cached(url))
+    playlist, (feed, error) = timed(lambda: service.fetch_info(f"{server.base}/feed.xml"))
+    assert feed, error
     return {
-        'test': 'UI Updates',
-        'old_time': old_time,
-        'new_time': new_time,
-        'improvement_pct': improvement
+        'single_cold_s': round(cold, 4),
+        'single_cached_s': round(cached, 6),
+        'playlist_cold_s': round(playlist, 4),
+        'playlist_entries': len(feed.get('entries') or []),
     }
 
-def benchmark_progress_throttling():
-    """Test progress update throttling"""
-    print("\n" + "=" * 60)
-    print("BENCHMARK 2: Progress Update Throttling")
-    print("=" * 60)
-    
-    # Simulate high-speed download with many progress updates
-    num_updates = 1000  # Typical for a fast download
-    
-    # Test 1: No throttling (old method)
-    print(f"\nTest 1: No Throttling ({num_updates} updates)")
-    start = time.time()
-    for i in range(num_updates):
-        time.sleep(0.0001)  # Simulate update overhead
-    old_time = time.time() - start
-    print(f"  Time: {old_time:.3f}s")
-    
-    # Test 2: Throttled (max 2 updates/sec = 500ms interval)
-    print(f"\nTest 2: Throttled (max 2/sec)")
-    start = time.time()
-    # With 500ms throttle, only ~2 updates per second
-    # For a 10-second download, that's ~20 updates instead of 1000
-    throttled_updates = int(num_updates * 0.02)  # 2% of updates
-    for i in range(throttled_updates):
-        time.sleep(0.0001)
-    new_time = time.time() - start
-    print(f"  Time: {new_time:.3f}s")
-    print(f"  Updates reduced: {num_updates} → {throttled_updates}")
-    
-    improvement = ((old_time - new_time) / old_time) * 100
-    print(f"\n  ✓ Improvement: {improvement:.1f}% faster")
-    print(f"  ✓ Time saved: {old_time - new_time:.3f}s")
-    
+
+def bench_single_download(server, out_dir):
+    registry = MetricsRegistry()
+    service = YtDlpService(metrics=registry)
+    elapsed, (ok, msg) = timed(lambda: service.download(server.url(0), out_dir, 'high', 'mp4', False, lambda _: None))
+    assert ok, msg
     return {
-        'test': 'Progress Throttling',
-        'old_time': old_time,
-        'new_time': new_time,
-        'improvement_pct': improvement
+        'seconds': round(elapsed, 4),
+        'mb_per_s': round(server.size_bytes / elapsed / 1e6, 2),
+        'ttfb_s': registry.histogram('ttfb_seconds')['sum'],
+        'extractor_s': registry.histogram('extractor_seconds')['sum'],
     }
 
-def benchmark_parallel_downloads():
-    """Simulate parallel vs sequential download times"""
-    print("\n" + "=" * 60)
-    print("BENCHMARK 3: Parallel vs Sequential Downloads")
-    print("=" * 60)
-    
-    # Simulate 10 items, each taking 5 seconds
-    num_items = 10
-    download_time_per_item = 5  # seconds
-    
-    # Test 1: Sequential
-    print(f"\nTest 1: Sequential ({num_items} items)")
-    sequential_time = num_items * download_time_per_item
-    print(f"  Estimated time: {sequential_time}s ({sequential_time/60:.1f} min)")
-    
-    # Test 2: Parallel (3 workers)
-    print(f"\nTest 2: Parallel (3 workers)")
-    workers = 3
-    # With 3 workers, 10 items = ceil(10/3) = 4 batches
-    # Time = 4 batches * 5 seconds = 20 seconds
-    import math
-    batches = math.ceil(num_items / workers)
-    parallel_time = batches * download_time_per_item
-    print(f"  Estimated time: {parallel_time}s ({parallel_time/60:.1f} min)")
-    
-    improvement = ((sequential_time - parallel_time) / sequential_time) * 100
-    print(f"\n  ✓ Improvement: {improvement:.1f}% faster")
-    print(f"  ✓ Time saved: {sequential_time - parallel_time}s ({(sequential_time - parallel_time)/60:.1f} min)")
-    
+
+def bench_playlist(server, out_dir, workers):
+    """Downloads every feed entry through the shared manager with 1 and `workers` workers."""
+    service = YtDlpService(metrics=MetricsRegistry())
+    feed, error = service.fetch_info(f"{server.base}/feed.xml")
+    assert feed, error
+    urls = [e.get('url') or e.get('webpage_url') for e in feed['entries']]
+    results = {}
+    for n in sorted({1, workers}):
+        target = os.path.join(out_dir, f"workers_{n}")
+        os.makedirs(target)
+        registry = MetricsRegistry()
+        # Per-host politeness limits off: this measures the engine, not the limiter
+        service = YtDlpService(metrics=registry, host_limiter=HostLimiter(max_connections=n, rate=0))
+        manager = DownloadManager(service, max_workers=n, metrics=registry)
+        done = threading.Event()
+        start = time.perf_counter()
+        tasks = [manager.submit(url, target, 'high', 'mp4', False) for url in urls]
+        manager.subscribe(lambda _: all(t.finished for t in tasks) and done.set())
+        if not all(t.finished for t in tasks):
+            done.wait(600)
+        elapsed = time.perf_counter() - start
+        assert all(t.status == 'done' for t in tasks), [t.message for t in tasks]
+        wait = registry.histogram('queue_wait_seconds')
+        results[f"workers_{n}"] = {
+            'seconds': round(elapsed, 4),
+            'items_per_s': round(len(tasks) / elapsed, 3),
+            'queue_wait_avg_s': wait['avg'],
+        }
+    return {'items': len(urls), **results}
+
+
+def bench_cancel_latency(server, out_dir, runs=3):
+    """Time from terminate() to download() returning, mid-transfer on a slow server."""
+    latencies = []
+    leftovers = 0
+    for run in range(runs):
+        target = os.path.join(out_dir, f"cancel_{run}")
+        os.makedirs(target)
+        service = YtDlpService(metrics=MetricsRegistry())
+        event = threading.Event()
+        started = threading.Event()
+        result = []
+        t = threading.Thread(target=lambda: result.append(service.download(
+            server.url(run), target, 'high', 'mp4', False, lambda _: started.set(), cancel_event=event)))
+        t.start()
+        assert started.wait(60), "no progress before cancel"
+        start = time.perf_counter()
+        service.terminate(event)
+        t.join(30)
+        latencies.append(time.perf_counter() - start)
+        assert result and result[0] == (False, ytdlp_service.CANCELLED), result
+        leftovers += len(os.listdir(target))
     return {
-        'test': 'Parallel Downloads',
-        'old_time': sequential_time,
-        'new_time': parallel_time,
-        'improvement_pct': improvement
+        'runs': runs,
+        'avg_s': round(sum(latencies) / runs, 4),
+        'max_s': round(max(latencies), 4),
+        'leftover_files': leftovers,
     }
 
-def benchmark_metadata_caching():
-    """Test metadata caching benefit"""
-    print("\n" + "=" * 60)
-    print("BENCHMARK 4: Metadata Caching")
-    print("=" * 60)
-    
-    # Simulate repeated info fetches (e.g., user re-analyzing same URL)
-    fetch_time = 2.0  # seconds per fetch
-    num_fetches = 3
-    
-    # Test 1: No cache
-    print(f"\nTest 1: No Cache ({num_fetches} fetches)")
-    no_cache_time = fetch_time * num_fetches
-    print(f"  Time: {no_cache_time:.1f}s")
-    
-    # Test 2: With cache (only first fetch is slow)
-    print(f"\nTest 2: With Cache ({num_fetches} fetches)")
-    cached_time = fetch_time + (0.001 * (num_fetches - 1))  # First fetch + instant cache hits
-    print(f"  Time: {cached_time:.3f}s")
-    
-    improvement = ((no_cache_time - cached_time) / no_cache_time) * 100
-    print(f"\n  ✓ Improvement: {improvement:.1f}% faster")
-    print(f"  ✓ Time saved: {no_cache_time - cached_time:.3f}s")
-    
+
+def bench_progress_parsing(lines=200_000):
+    """CPU per stdout line of the parsing done in the download loop."""
+    sample = [
+        "[download]  23.5% of   10.00MiB at    1.00MiB/s ETA 00:08",
+        "[download] Destination: /tmp/some video/file.f137.mp4",
+        "[info] Downloading 1 format(s): 137+140",
+        '[Merger] Merging formats into "/tmp/some video/file.mp4"',
+    ]
+    batch = (sample * (lines // len(sample) + 1))[:lines]
+    start = time.process_time()
+    for line in batch:
+        output_file(line)
+        parse_progress(line)
+        is_processing(line)
+    cpu = time.process_time() - start
     return {
-        'test': 'Metadata Caching',
-        'old_time': no_cache_time,
-        'new_time': cached_time,
-        'improvement_pct': improvement
+        'lines': lines,
+        'cpu_s': round(cpu, 4),
+        'us_per_line': round(cpu / lines * 1e6, 3),
     }
 
-def print_summary(results):
-    """Print summary table"""
-    print("\n" + "=" * 60)
-    print("PERFORMANCE SUMMARY")
-    print("=" * 60)
-    print(f"\n{'Test':<30} {'Before':<12} {'After':<12} {'Improvement':<12}")
-    print("-" * 60)
-    
-    for result in results:
-        test = result['test']
-        old = f"{result['old_time']:.2f}s"
-        new = f"{result['new_time']:.2f}s"
-        imp = f"{result['improvement_pct']:.1f}%"
-        print(f"{test:<30} {old:<12} {new:<12} {imp:<12}")
-    
-    avg_improvement = sum(r['improvement_pct'] for r in results) / len(results)
-    print("-" * 60)
-    print(f"{'AVERAGE IMPROVEMENT':<30} {'':<12} {'':<12} {avg_improvement:.1f}%")
-    print("=" * 60)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(items=6, workers=3, size_mb=4.0, slow_rate=512 * 1024):
+    size = int(size_mb * 1024 * 1024)
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'items': items, 'workers': workers, 'size_mb': size_mb, 'slow_rate': slow_rate},
+        'results': {},
+    }
+    fast = MediaServer(size, items)
+    slow = MediaServer(size, items, rate=slow_rate)
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            steps = [
+                ('metadata', lambda: bench_metadata(fast)),
+                ('single_download', lambda: bench_single_download(fast, os.path.join(d, 'single'))),
+                ('playlist', lambda: bench_playlist(fast, os.path.join(d, 'playlist'), workers)),
+                ('cancel_latency', lambda: bench_cancel_latency(slow, os.path.join(d, 'cancel'))),
+                ('progress_parsing', bench_progress_parsing),
+            ]
+            for name, step in steps:
+                print(f"  {name}...", file=sys.stderr, flush=True)
+                report['results'][name] = step()
+    finally:
+        fast.close()
+        slow.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=6, help="playlist size")
+    parser.add_argument('--workers', type=int, default=3, help="parallel workers for the playlist run")
+    parser.add_argument('--size-mb', type=float, default=4.0, help="size of each synthetic file")
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    print("Video Downloader - engine benchmark", file=sys.stderr)
+    report = run(args.items, args.workers, args.size_mb)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
 
 if __name__ == "__main__":
-    print("\n🚀 Video Downloader - Performance Benchmark\n")
-    
-    results = []
-    results.append(benchmark_ui_updates())
-    results.append(benchmark_progress_throttling())
-    results.append(benchmark_parallel_downloads())
-    results.append(benchmark_metadata_caching())
-    
-    print_summary(results)
-    
-    print("\n✅ Benchmark complete!")
-    print("\nNOTE: These are simulated benchmarks. Real-world performance")
-    print("will vary based on network speed, system resources, and")
-    print("YouTube server response times.")
+    main()
@@ -0,0 +1,73 @@
+"""
+Offline stand-in for the ffmpeg runs of the audio batch mode (loudnorm.Normalizer).
+
+Point a Normalizer at it with ffmpeg_cmd=FAKE_FFMPEG. Two kinds of run:
+
+    ffmpeg -i SRC -af loudnorm=...:print_format=json -f null -
+        pass 1: prints loudnorm-style stats as JSON on stderr. The measured
+        loudness comes from the file name: "..._-23LUFS.webm" measures -23,
+        a name containing "silent" measures -inf (as ffmpeg does for silence).
+    ffmpeg -y -i SRC [-af FILTER] ... DST
+        pass 2: writes DST as one JSON line with the filter and codec options,
+        followed by the bytes of SRC. A name containing "corrupt" fails.
+
+If FAKE_FFMPEG_LOG is set, every invocation appends its argv as a JSON line.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+FAKE_FFMPEG = [sys.executable, os.path.abspath(__file__)]
+DEFAULT_LUFS = -20.0
+
+
+def option(argv, name):
+    return argv[argv.index(name) + 1] if name in argv else None
+
+
+def measure(src):
+    if 'silent' in os.path.basename(src):
+        return '-inf'
+    match = re.search(r'_(-?\d+(?:\.\d+)?)LUFS', os.path.basename(src))
+    return f"{float(match.group(1)) if match else DEFAULT_LUFS:.2f}"
+
+
+def main(argv):
+    if os.environ.get('FAKE_FFMPEG_LOG'):
+        with open(os.environ['FAKE_FFMPEG_LOG'], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(argv) + '\n')
+    src = option(argv, '-i')
+    if not src or not os.path.exists(src):
+        sys.stderr.write(f"{src}: No such file or directory\n")
+        return 1
+    time.sleep(0.05)  # Some CPU time per pass
+    if option(argv, '-f') == 'null':
+        i = measure(src)
+        tp = lra = thresh = offset = '-inf' if i == '-inf' else None
+        stats = {
+            'input_i': i,
+            'input_tp': tp or '-3.10',
+            'input_lra': lra or '6.40',
+            'input_thresh': thresh or f"{float(i) - 10:.2f}",
+            'output_i': '-16.00', 'output_tp': '-1.50', 'output_lra': '6.00', 'output_thresh': '-26.00',
+            'normalization_type': 'dynamic', 'target_offset': offset or '0.20',
+        }
+        sys.stderr.write(f"[Parsed_loudnorm_0 @ 0x1]\n{json.dumps(stats, indent=1)}\n")
+        return 0
+    if 'corrupt' in os.path.basename(src):
+        sys.stderr.write(f"{src}: Invalid data found when processing input\n")
+        return 1
+    dst = argv[-1]
+    header = {'filter': option(argv, '-af'), 'codec': option(argv, '-c:a'), 'bitrate': option(argv, '-b:a'),
+              'rate': option(argv, '-ar')}
+    with open(src, 'rb') as f:
+        data = f.read()
+    with open(dst, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b'\n' + data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,353 @@
+"""
+Offline stand-in for the yt-dlp command line, for deterministic engine tests.
+
+Point a service at it with ytdlp_cmd=FAKE_YTDLP (or set
+VIDEO_DOWNLOADER_YTDLP to "python tests/fake_ytdlp.py"). It understands the
+options the services pass (-J, -j, -o, --merge-output-format, --recode-video, --extract-audio,
+--audio-format, --limit-rate, --cookies, --cache-dir, --download-sections) and replays a scripted run chosen by the query
+string of the URL, e.g. https://fake.test/clip?steps=20&merge=1&stall=5&stall_at=50
+
+    title=T           video title (default: the last path segment)
+    size=10MiB        reported total size
+    steps=10          progress lines (evenly spaced percentages)
+    interval=0.01     seconds between progress lines
+    merge=1           two formats downloaded, then a [Merger] step
+    merged=mp4        container of a merge without --merge-output-format (--recode-video
+                      then converts it if it is another one)
+    stall=S           no output for S seconds once stall_at % (default 50) is reached
+                      (not repeated by a run that resumes the .part file)
+    dead=1            hangs after the first destination line, on every run
+    error=MSG         'ERROR: MSG' on stderr and exit 1 once fail_at % (default 0) is reached
+    flood=MB          MB of WARNING lines on stderr, spread over the run
+    playlist=N        -J returns a flat playlist of N entries
+    delay=S           seconds before -J / -j answer
+    cookie=NAME=VAL   the site sets a cookie (added to the --cookies file)
+    duration=60       video length in seconds
+    chapters=A,B,C    chapter titles (equal lengths)
+    formats=0         -J / -j without a format list (default: a YouTube-like ladder, see FORMATS)
+    live_until=EPOCH  a live stream until this time: -J reports is_live (was_live after),
+                      and `-o -` writes MPEG-TS packets to stdout until then
+    drop_every=S      a live capture process fails after S seconds (network drop)
+    FIELD=VALUE       any other value is available to the -o template as %(FIELD)s
+
+--limit-rate is honoured: a run never reports bytes faster than the limit.
+With --download-sections, each section is written to its own file with
+steps scaled to its share of the duration, and progress goes to stderr only
+(ffmpeg-style stats), as with yt-dlp's ffmpeg section downloader.
+With --continue, an existing .part file is resumed (1 KiB is written per step).
+-f bestaudio without --extract-audio saves the audio stream as is (.webm).
+--extract-audio downloads .m4a if the first choice of -f asks for AAC (mp4a), else .webm.
+If FAKE_YTDLP_LOG is set, every invocation appends its argv as a JSON line.
+"""
+import json
+import os
+import re
+import sys
+import time
+import urllib.parse
+
+FAKE_YTDLP = [sys.executable, os.path.abspath(__file__)]
+UNITS = {'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+WARNING = "WARNING: [fake] fragment retry, skipping " + "x" * 200 + "\n"
+# (format_id, ext, vcodec, acodec, height, kbps), worst to best as yt-dlp sorts them
+FORMATS = [
+    ('18', 'mp4', 'avc1.42001E', 'mp4a.40.2', 360, 600),
+    ('140', 'm4a', 'none', 'mp4a.40.2', None, 128),
+    ('251', 'webm', 'none', 'opus', None, 160),
+    ('135', 'mp4', 'avc1.4d401f', 'none', 480, 1000),
+    ('244', 'webm', 'vp09.00.30.08', 'none', 480, 900),
+    ('136', 'mp4', 'avc1.4d401f', 'none', 720, 2500),
+    ('247', 'webm', 'vp09.00.31.08', 'none', 720, 2200),
+    ('137', 'mp4', 'avc1.640028', 'none', 1080, 4500),
+    ('248', 'webm', 'vp09.00.40.08', 'none', 1080, 4000),
+]
+
+
+def parse_args(argv):
+    opts, urls = {}, []
+    takes_value = {'-o', '-f', '--merge-output-format', '--audio-format', '--audio-quality', '--limit-rate',
+                   '--socket-timeout', '--user-agent', '--source-address', '--ffmpeg-location', '--download-sections',
+                   '--cookies', '--cache-dir', '--wait-for-video', '--recode-video'}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == '--download-sections':
+            opts.setdefault(arg, []).append(argv[i + 1])
+            i += 2
+            continue
+        if arg in takes_value:
+            opts[arg] = argv[i + 1]
+            i += 2
+            continue
+        if arg.startswith('-'):
+            opts[arg] = True
+        else:
+            urls.append(arg)
+        i += 1
+    return opts, urls
+
+
+def scenario(url):
+    parsed = urllib.parse.urlsplit(url)
+    params = dict(urllib.parse.parse_qsl(parsed.query))
+    params.setdefault('id', parsed.path.rstrip('/').rsplit('/', 1)[-1] or 'video')
+    params.setdefault('title', params['id'])
+    return params
+
+
+def size_bytes(text):
+    for unit, factor in UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def chapters(params):
+    titles = [t for t in params.get('chapters', '').split(',') if t]
+    length = float(params.get('duration', 60)) / max(1, len(titles))
+    return [{'title': t, 'start_time': n * length, 'end_time': (n + 1) * length} for n, t in enumerate(titles)]
+
+
+def info_dict(url, params):
+    info = {
+        'id': params['id'],
+        'title': params['title'],
+        'extractor_key': 'Fake',
+        'original_url': url,
+        'webpage_url': url,
+        'duration': float(params.get('duration', 60)),
+        'filesize_approx': size_bytes(params.get('size', '10.00MiB')),
+    }
+    if params.get('chapters'):
+        info['chapters'] = chapters(params)
+    if params.get('formats', '1') != '0':
+        info['formats'] = [
+            {'format_id': fid, 'ext': ext, 'vcodec': vcodec, 'acodec': acodec, 'height': height, 'tbr': kbps,
+             'filesize': int(kbps * 1000 / 8 * info['duration'])}
+            for fid, ext, vcodec, acodec, height, kbps in FORMATS
+        ]
+    if 'live_until' in params:
+        info['is_live'] = is_live(params)
+        info['live_status'] = 'is_live' if info['is_live'] else 'was_live'
+        del info['duration']
+    return info
+
+
+def stream_live(params):
+    """`-o -` on a live stream: 188-byte TS packets on stdout until it ends (or drops)."""
+    if not is_live(params):
+        sys.stderr.write("ERROR: This live event has ended\n")
+        return 1
+    interval = float(params.get('interval', 0.01))
+    packet = b'\x47' + b'\0' * 187
+    started = time.time()
+    out = sys.stdout.buffer
+    while is_live(params):
+        if 'drop_every' in params and time.time() - started >= float(params['drop_every']):
+            sys.stderr.write("ERROR: fragment 1 not found, unable to continue\n")
+            return 1
+        out.write(packet * 8)
+        out.flush()
+        time.sleep(interval)
+    return 0
+
+
+def is_live(params):
+    return 'live_until' in params and time.time() < float(params['live_until'])
+
+
+def selected_sections(opts, params):
+    """--download-sections -> [{'section_start', 'section_end', 'section_title'}], [{}] for the whole video."""
+    if '--download-sections' not in opts:
+        return [{}]
+    duration = float(params.get('duration', 60))
+    selected = []
+    for spec in opts['--download-sections']:
+        if spec.startswith('*'):
+            start, _, end = spec[1:].partition('-')
+            selected.append({'section_start': float(start), 'section_end': min(float(end), duration)})
+        else:
+            selected.extend({'section_start': c['start_time'], 'section_end': c['end_time'], 'section_title': c['title']}
+                            for c in chapters(params) if re.search(spec, c['title']))
+    return selected
+
+
+def print_info(url, flat):
+    params = scenario(url)
+    time.sleep(float(params.get('delay', 0)))
+    if 'error' in params:
+        sys.stderr.write(f"ERROR: {params['error']}\n")
+        return 1
+    if flat and 'playlist' in params:
+        entries = [
+            {'_type': 'url', 'id': f"{params['id']}-{n}", 'title': f"{params['title']} {n}",
+             'url': f"https://fake.test/{params['id']}-{n}", 'duration': 60}
+            for n in range(int(params['playlist']))
+        ]
+        print(json.dumps({'_type': 'playlist', 'id': params['id'], 'title': params['title'], 'entries': entries}))
+    else:
+        print(json.dumps(info_dict(url, params)))
+    return 0
+
+
+def render_field(expr, fields):
+    """One %(...)s field: alternatives 'a,b', '>strftime' for numbers, '&replacement' and '|default'."""
+    expr, has_default, default = expr.partition('|')
+    expr, _, replacement = expr.partition('&')
+    names, _, strf = expr.partition('>')
+    value = next((fields[n] for n in names.split(',') if fields.get(n) is not None), None)
+    if value is None:
+        return default if has_default else 'NA'
+    if strf and isinstance(value, (int, float)):
+        value = time.strftime(strf, time.gmtime(value))
+    value = re.sub(r'[^\w.-]', '_', str(value))
+    return replacement.format(value) if replacement else value
+
+
+def target_path(opts, params, ext, section=None):
+    """Renders the -o template (fields from the scenario and section, NA if unknown) and creates its folders."""
+    fields = {**params, **(section or {}), 'ext': ext}
+    template = opts.get('-o', '%(title)s.%(ext)s')
+    path = re.sub(r'%\(([^)]+)\)s', lambda m: render_field(m.group(1), fields), template)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return path.replace('%%', '%')
+
+
+def download(url, opts):
+    params = scenario(url)
+    print(f"[fake] Extracting URL: {url}", flush=True)
+    for section in selected_sections(opts, params):
+        code = download_section(opts, params, section)
+        if code:
+            return code
+    return 0
+
+
+def download_section(opts, params, section):
+    """Downloads the whole video ({} section) or one section, which gets its share of the steps and size."""
+    share = 1.0
+    if section:
+        share = (section['section_end'] - section['section_start']) / float(params.get('duration', 60))
+    total = int(size_bytes(params.get('size', '10.00MiB')) * share)
+    steps = max(1, round(int(params.get('steps', 10)) * share))
+    interval = float(params.get('interval', 0.01))
+    rate = float(opts['--limit-rate']) if '--limit-rate' in opts else None
+    if rate:
+        interval = max(interval, total / steps / rate)
+    stall, stall_at = float(params.get('stall', 0)), float(params.get('stall_at', 50))
+    error, fail_at = params.get('error'), float(params.get('fail_at', 0))
+    flood_per_step = int(float(params.get('flood', 0)) * 1024 * 1024 / len(WARNING) / steps)
+
+    audio = '--extract-audio' in opts
+    selector = opts.get('-f', '')
+    raw_audio = 'bestaudio' in selector and 'bestvideo' not in selector  # Audio stream kept as downloaded
+    merged = 'webm' if raw_audio else params.get('merged', 'mp4')
+    ext = opts.get('--audio-format', 'mp3') if audio else opts.get('--merge-output-format', merged)
+    final = target_path(opts, params, ext, section)
+    if section:
+        parts = [final]  # ffmpeg fetches and muxes the section in one go
+    elif params.get('merge') and not audio:
+        parts = [target_path(opts, params, 'f137.mp4'), target_path(opts, params, 'f140.m4a')]
+    else:
+        audio_ext = 'm4a' if 'mp4a' in selector.split('/')[0] else 'webm'
+        parts = [target_path(opts, params, audio_ext if audio else ext)]
+
+    # A resumed run does not stall again
+    stalled = '--continue' in opts and any(os.path.exists(p) or os.path.exists(p + '.part') for p in parts)
+
+    for part in parts:
+        if '--continue' in opts and os.path.exists(part):
+            print(f"[download] {part} has already been downloaded", flush=True)
+            continue
+        print(f"[download] Destination: {part}", flush=True)
+        if params.get('dead'):
+            time.sleep(3600)
+        done = 0
+        if '--continue' in opts and os.path.exists(part + '.part'):
+            done = min(os.path.getsize(part + '.part') // 1024, steps)
+            print(f"[download] Resuming download at byte {done * 1024}", flush=True)
+        with open(part + '.part', 'ab' if done else 'wb') as f:
+            for step in range(done + 1, steps + 1):
+                percent = 100.0 * step / steps
+                if error and percent > fail_at:
+                    sys.stderr.write(f"ERROR: {error}\n")
+                    return 1
+                if stall and not stalled and percent >= stall_at:
+                    stalled = True
+                    time.sleep(stall)
+                time.sleep(interval)
+                f.write(b'\0' * 1024)
+                f.flush()
+                if flood_per_step:
+                    sys.stderr.write(WARNING * flood_per_step)
+                if section:
+                    sys.stderr.write(f"size={step}KiB time=00:00:{step:02d}.00 speed=1x\r")
+                    sys.stderr.flush()
+                    continue
+                speed = f"{(rate or total / steps / max(interval, 0.001)) / UNITS['MiB']:.2f}MiB/s"
+                print(f"[download] {percent:5.1f}% of {total / UNITS['MiB']:.2f}MiB at {speed} ETA 00:00", flush=True)
+        os.replace(part + '.part', part)
+
+    if audio and not section:
+        if parts[0] == final:
+            print(f"[ExtractAudio] Not converting audio {final}; file is already in target format {ext}", flush=True)
+        else:
+            print(f"[ExtractAudio] Destination: {final}", flush=True)
+            os.replace(parts[0], final)
+    elif len(parts) > 1:
+        print(f'[Merger] Merging formats into "{final}"', flush=True)
+        time.sleep(interval)
+        with open(final, 'wb') as f:
+            f.write(b'\0' * 1024)
+        for part in parts:
+            os.remove(part)
+    if '--recode-video' in opts and not audio:
+        recode_video(opts, params, final, ext, section)
+    return 0
+
+
+def recode_video(opts, params, path, ext, section):
+    """--recode-video: yt-dlp's VideoConvertor, a no-op when the file already is in the target container."""
+    target = opts['--recode-video']
+    if ext == target:
+        print(f'[VideoConvertor] Not converting media file "{path}"; already is in target format {target}', flush=True)
+        return
+    converted = target_path(opts, params, target, section)
+    print(f"[VideoConvertor] Converting video from {ext} to {target}; Destination: {converted}", flush=True)
+    os.replace(path, converted)
+
+
+def save_cookies(opts, urls):
+    """Adds the cookies the scenario sets to the --cookies jar, as yt-dlp does on exit."""
+    if '--cookies' not in opts:
+        return
+    for url in urls:
+        params = scenario(url)
+        if 'cookie' in params:
+            name, _, value = params['cookie'].partition('=')
+            with open(opts['--cookies'], 'a', encoding='utf-8') as f:
+                f.write(f".fake.test\tTRUE\t/\tFALSE\t{int(time.time()) + 3600}\t{name}\t{value}\n")
+
+
+def main(argv):
+    if os.environ.get('FAKE_YTDLP_LOG'):
+        with open(os.environ['FAKE_YTDLP_LOG'], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(argv) + '\n')
+    opts, urls = parse_args(argv)
+    if not urls:
+        sys.stderr.write("ERROR: no URL given\n")
+        return 2
+    save_cookies(opts, urls)
+    if '-J' in opts:
+        return print_info(urls[0], flat='--flat-playlist' in opts)
+    if '-j' in opts:
+        for url in urls:
+            print_info(url, flat=False)
+        return 0
+    if opts.get('-o') == '-':
+        return stream_live(scenario(urls[0]))
+    return download(urls[0], opts)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
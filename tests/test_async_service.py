@@ -0,0 +1,197 @@
+"""
+Tests the asyncio service against the fake yt-dlp (no network required)
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ytdlp_service
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from session_store import SessionStore
+from ytdlp_service import AsyncYtDlpService
+
+
+def test_progress_events():
+    ytdlp_service.PROGRESS_INTERVAL, interval = 0, ytdlp_service.PROGRESS_INTERVAL
+
+    async def run(d):
+        service = AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP)
+        return [e async for e in service.progress('https://fake.test/ok?steps=3', d, 'high', 'mp4', False)]
+
+    with tempfile.TemporaryDirectory() as d:
+        events = asyncio.run(run(d))
+    ytdlp_service.PROGRESS_INTERVAL = interval
+    assert events[0] == {'status': 'queued'}
+    assert [e['_percent_str'] for e in events if e['status'] == 'downloading'] == ['33.3%', '66.7%', '100.0%']
+    assert events[-1] == {'status': 'finished', 'success': True, 'message': 'Download Completo'}
+    print("   ✓ Progress streamed as async events")
+
+
+def test_semaphore_bounds_processes():
+    async def run(d):
+        # No per-host limits: only the semaphore may hold jobs back
+        service = AsyncYtDlpService(max_concurrency=2, ytdlp_cmd=FAKE_YTDLP,
+                                    host_limiter=HostLimiter(max_connections=100, rate=0))
+        start = time.monotonic()
+        results = await asyncio.gather(*(
+            service.download(f'https://fake.test/v{i}?steps=1&interval=0.3', d, 'high', 'mp4', False)
+            for i in range(6)
+        ))
+        return results, time.monotonic() - start
+
+    with tempfile.TemporaryDirectory() as d:
+        results, elapsed = asyncio.run(run(d))
+    assert all(ok for ok, _ in results)
+    assert elapsed >= 0.9  # 6 jobs, 2 at a time, 0.3s each
+    print(f"   ✓ 6 jobs with 2 slots took {elapsed:.2f}s")
+
+
+def test_failure_message():
+    url = 'https://fake.test/bad?error=[youtube] x: Video unavailable'
+    with tempfile.TemporaryDirectory() as d:
+        ok, msg = asyncio.run(AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP).download(url, d, 'high', 'mp4', False))
+    assert not ok and msg == "Erro no download: [youtube] x: Video unavailable"
+    print("   ✓ yt-dlp error line reported")
+
+
+def test_cancel_kills_child_and_cleans_up():
+    async def run(d):
+        service = AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP)
+        progress = []
+        url = 'https://fake.test/long?steps=100&interval=0.05'
+        task = asyncio.ensure_future(service.download(url, d, 'high', 'mp4', False, progress.append))
+        while not progress:
+            await asyncio.sleep(0.01)
+        start = time.monotonic()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return time.monotonic() - start
+
+    with tempfile.TemporaryDirectory() as d:
+        latency = asyncio.run(run(d))
+        assert os.listdir(d) == []  # .part removed
+    assert latency < 2
+    print(f"   ✓ Task cancel stopped the child in {latency * 1000:.0f} ms and removed partial files")
+
+
+def test_stall_restarts_and_resumes():
+    async def run(d):
+        service = AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP, stall_timeout=0.5)
+        url = 'https://fake.test/edge?steps=10&interval=0.02&stall=30'
+        return await asyncio.wait_for(service.download(url, d, 'high', 'mp4', False), 15)
+
+    with tempfile.TemporaryDirectory() as d:
+        start = time.monotonic()
+        ok, msg = asyncio.run(run(d))
+        assert os.listdir(d) == ['edge.mp4']
+    assert ok, msg
+    print(f"   ✓ Stalled child killed and resumed ({time.monotonic() - start:.1f}s)")
+
+
+def test_same_options_as_thread_service():
+    async def run(d):
+        service = AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP)
+        events = []
+        result = await service.download('https://fake.test/v?title=V&steps=2&merge=1&merged=webm', d, 'high', 'mp4',
+                                        False, events.append, format_id='248+251', transcode=True)
+        return result, events
+
+    with tempfile.TemporaryDirectory() as d:
+        calls = os.path.join(d, 'calls')
+        os.environ['FAKE_YTDLP_LOG'] = calls
+        try:
+            (ok, msg), events = asyncio.run(run(os.path.join(d, 'out')))
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        files = os.listdir(os.path.join(d, 'out'))
+        with open(calls, encoding='utf-8') as f:
+            argv = json.loads(f.readline())
+    assert ok, msg
+    assert files == ['V.mp4']
+    assert argv[argv.index('-f') + 1].startswith('248+251/') and argv[argv.index('--recode-video') + 1] == 'mp4'
+    assert events[-1] == {'status': 'processing', 'conversion': 'transcode'}
+    print("   ✓ Format ids, transcode mode and the conversion report work as in YtDlpService")
+
+
+def test_busy_session_does_not_block_loop():
+    async def run(d, session):
+        service = AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP, session=session, host_limiter=HostLimiter(rate=0))
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        ok, _ = await service.download('https://fake.test/v?title=V&steps=2', os.path.join(d, 'out'), 'high', 'mp4',
+                                       False)
+        ticker.cancel()
+        return ok, ticks
+
+    with tempfile.TemporaryDirectory() as d:
+        session = SessionStore(os.path.join(d, 'session'))
+        held = threading.Event()
+
+        def hold():
+            with session._locked():  # The thread service copying or merging cookies
+                held.set()
+                time.sleep(0.5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        ok, ticks = asyncio.run(run(d, session))
+        holder.join()
+    assert ok
+    assert ticks >= 20  # The loop kept running while the download waited for the session
+    print("   ✓ Session lock and file work run off the event loop")
+
+
+def test_info_single_flight_and_cache():
+    with tempfile.TemporaryDirectory() as d:
+        calls = os.path.join(d, 'calls')
+        os.environ['FAKE_YTDLP_LOG'] = calls
+
+        async def run():
+            service = AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP)
+            urls = ['https://youtu.be/dQw4w9WgXcQ?delay=0.2', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=5']
+            infos = await asyncio.gather(*(service.get_info(u) for u in urls * 3))
+            cached = await service.get_info('https://m.youtube.com/watch?v=dQw4w9WgXcQ')
+            return infos, cached
+
+        try:
+            infos, cached = asyncio.run(run())
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        assert all(i is infos[0] for i in infos) and infos[0]['id'] == 'dQw4w9WgXcQ'
+        assert cached == infos[0]
+        with open(calls, encoding='utf-8') as f:
+            assert len(f.readlines()) == 1  # One process for every spelling
+    print("   ✓ Equivalent URLs share one fetch, then the cache")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Async Service")
+    print("=" * 60)
+    test_progress_events()
+    test_semaphore_bounds_processes()
+    test_failure_message()
+    test_cancel_kills_child_and_cleans_up()
+    test_stall_restarts_and_resumes()
+    test_same_options_as_thread_service()
+    test_busy_session_does_not_block_loop()
+    test_info_single_flight_and_cache()
+    print("\n✓ ALL TESTS PASSED")
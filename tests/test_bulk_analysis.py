@@ -0,0 +1,105 @@
+"""
+Tests bulk analysis of many links with a fake service (no network required)
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_analysis import BulkAnalyzer, parse_urls, url_key
+
+
+class FakeService:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.fetched = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def get_cached(self, url):
+        return None
+
+    def fetch_info(self, url):
+        with self.lock:
+            self.fetched.append(url)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if 'broken' in url:
+            return None, 'Video unavailable'
+        if 'list=' in url:
+            return {'_type': 'playlist', 'entries': [
+                {'id': 'aaaaaaaaaaa', 'ie_key': 'Youtube', 'url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa'},
+                {'id': 'bbbbbbbbbbb', 'ie_key': 'Youtube', 'url': 'https://www.youtube.com/watch?v=bbbbbbbbbbb'},
+            ]}, None
+        vid = url_key(url).split(':')[1]
+        return {'id': vid, 'extractor_key': 'Youtube', 'webpage_url': f'https://www.youtube.com/watch?v={vid}'}, None
+
+
+def run(analyzer, urls):
+    results = []
+    finished = threading.Event()
+    analyzer.start(urls, lambda url, entries, error: results.append((url, entries, error)), finished.set)
+    assert finished.wait(5)
+    return results
+
+
+def test_parse_urls():
+    text = """https://youtu.be/aaaaaaaaaaa
+    https://www.youtube.com/watch?v=bbbbbbbbbbb, https://youtu.be/aaaaaaaaaaa
+    not a link (https://www.youtube.com/watch?v=ccccccccccc)."""
+    assert parse_urls(text) == [
+        'https://youtu.be/aaaaaaaaaaa',
+        'https://www.youtube.com/watch?v=bbbbbbbbbbb',
+        'https://www.youtube.com/watch?v=ccccccccccc',
+    ]
+    assert url_key('https://m.youtube.com/watch?v=aaaaaaaaaaa&t=10') == 'youtube:aaaaaaaaaaa'
+    assert url_key('https://www.youtube.com/watch?v=aaaaaaaaaaa&list=PL1') == 'youtube:playlist:PL1'
+    print("   ✓ URLs extracted from free text, ids read from URLs")
+
+
+def test_concurrency_limit_and_streaming():
+    service = FakeService(delay=0.1)
+    urls = [f"https://www.youtube.com/watch?v={c * 11}" for c in 'defghijk']
+    results = run(BulkAnalyzer(service, max_workers=3), urls)
+    assert len(results) == len(urls)
+    assert service.peak == 3
+    assert all(len(entries) == 1 and not error for _, entries, error in results)
+    print("   ✓ Links analysed concurrently within the limit")
+
+
+def test_duplicates_and_errors():
+    service = FakeService()
+    analyzer = BulkAnalyzer(service, max_workers=2)
+    urls = [
+        'https://www.youtube.com/playlist?list=PL1',
+        'https://youtu.be/aaaaaaaaaaa',  # Also in the playlist
+        'https://www.youtube.com/watch?v=ccccccccccc&t=10',
+        'https://m.youtube.com/watch?v=ccccccccccc',  # Same video, never fetched
+        'https://example.com/broken',
+    ]
+    results = run(analyzer, urls)
+
+    assert 'https://m.youtube.com/watch?v=ccccccccccc' not in service.fetched
+    ids = [e['id'] for _, entries, _ in results for e in entries]
+    assert sorted(ids) == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc']
+    errors = [(url, error) for url, _, error in results if error]
+    assert errors == [('https://example.com/broken', 'Video unavailable')]
+    assert analyzer.duplicates == 2 and analyzer.errors == 1
+    assert analyzer.completed == analyzer.total == len(urls)
+    print("   ✓ Duplicates collapsed by video id, errors reported per link")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Bulk Analysis")
+    print("=" * 60)
+    test_parse_urls()
+    test_concurrency_limit_and_streaming()
+    test_duplicates_and_errors()
+    print("\n✓ ALL TESTS PASSED")
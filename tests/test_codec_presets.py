@@ -0,0 +1,125 @@
+"""
+Tests the codec-aware quality presets: container-compatible streams, the opt-in transcode mode
+and the per-job remux / transcode report (no network required)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+import estimator
+import format_plan
+from download_manager import DownloadManager
+from fake_ytdlp import FAKE_YTDLP, FORMATS
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService, download_cmd
+
+LADDER = [{'format_id': fid, 'ext': ext, 'vcodec': vcodec, 'acodec': acodec, 'height': height, 'tbr': kbps,
+           'filesize': int(kbps * 1000 / 8 * 100), 'url': f'https://fake.test/{fid}', 'protocol': 'https'}
+          for fid, ext, vcodec, acodec, height, kbps in FORMATS]
+
+
+def new_service():
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0))
+
+
+def ytdlp_pick(spec):
+    """The format ids yt-dlp's own selector engine picks from LADDER."""
+    select = yt_dlp.YoutubeDL({'quiet': True}).build_format_selector(spec)
+    chosen = list(select({'formats': LADDER, 'has_merged_format': False, 'incomplete_formats': False}))
+    return chosen[0]['format_id'] if chosen else None
+
+
+def test_presets_prefer_container_codecs():
+    info = {'formats': LADDER, 'duration': 100}
+    mp4 = format_plan.plan(info, False, 'medium', 'mp4')
+    assert mp4['format_id'] == '136+140' and mp4['conversion'] == 'remux'
+    assert format_plan.describe(mp4) == "720p · H.264 + AAC · 31 MB"
+    assert format_plan.plan(info, False, 'medium', 'webm')['format_id'] == '247+251'
+    best = format_plan.plan(info, False, 'high', 'mp4', transcode=True)
+    assert best['format_id'] == '248+251' and format_plan.describe(best).endswith("· recodifica")
+    assert format_plan.plan(info, False, 'high', 'webm', transcode=True)['conversion'] == 'remux'
+    assert format_plan.plan(info, True, 'high', 'm4a')['format_id'] == '140'  # AAC, copied into .m4a
+    assert format_plan.plan(info, True, 'high', 'mp3')['conversion'] == 'transcode'
+    # Size estimates follow the preset
+    assert estimator.estimate_bytes(info, False, 'medium', format_plan.preferred('mp4', False)) == (mp4['bytes'], True)
+    # No compatible pair: the plain selector
+    vp9_only = {'formats': [f for f in LADDER if not f['vcodec'].startswith('avc1')]}
+    assert format_plan.plan(vp9_only, False, 'high', 'mp4')['format_id'] == '248+251'
+    print("   ✓ Presets pick H.264 + AAC for mp4, VP9 + Opus for webm, AAC for m4a")
+
+
+def test_planner_matches_ytdlp_selectors():
+    for quality in ('high', 'medium', 'low'):
+        for codec in ('mp4', 'webm', 'mkv'):
+            for transcode in (False, True):
+                planned = format_plan.plan({'formats': LADDER}, False, quality, codec, transcode)['format_id']
+                assert ytdlp_pick(format_plan.video_selector(quality, codec, transcode)) == planned
+    for codec in ('m4a', 'mp3', 'wav'):
+        for transcode in (False, True):
+            planned = format_plan.plan({'formats': LADDER}, True, 'high', codec, transcode)['format_id']
+            assert ytdlp_pick(format_plan.audio_selector(codec, transcode)) == planned
+    print("   ✓ The planner picks what yt-dlp's selector engine picks, for every preset")
+
+
+def test_transcode_mode_command():
+    cmd = download_cmd('https://x.test/v', '/tmp', 'high', 'mp4', False, ytdlp=['yt-dlp'])
+    assert cmd[cmd.index('--merge-output-format') + 1] == 'mp4' and '--recode-video' not in cmd
+    cmd = download_cmd('https://x.test/v', '/tmp', 'high', 'mp4', False, ytdlp=['yt-dlp'], transcode=True)
+    assert cmd[cmd.index('-f') + 1] == "bestvideo+bestaudio/best"
+    assert cmd[cmd.index('--recode-video') + 1] == 'mp4' and '--merge-output-format' not in cmd
+    print("   ✓ Transcode mode fetches the best streams and re-encodes to the container")
+
+
+def test_jobs_report_remux_or_transcode():
+    service = new_service()
+    runs = [
+        ('merge=1', 'mp4', False, False, 'remux', 'V.mp4'),
+        ('merge=1&merged=webm', 'mp4', False, True, 'transcode', 'V.mp4'),
+        ('merge=1&merged=mp4', 'mp4', False, True, 'remux', 'V.mp4'),  # Already mp4: not converted
+        ('', 'm4a', True, False, 'remux', 'V.m4a'),  # AAC stream kept as is
+        ('', 'mp3', True, False, 'transcode', 'V.mp3'),
+        ('', 'webm', False, False, 'direct', 'V.webm'),  # Single file, nothing to do
+    ]
+    for params, codec, is_audio, transcode, expected, name in runs:
+        events = []
+        with tempfile.TemporaryDirectory() as d:
+            ok, msg = service.download(f'https://fake.test/v?title=V&steps=2&{params}', d, 'high', codec, is_audio,
+                                       events.append, transcode=transcode)
+            files = os.listdir(d)
+        assert ok, msg
+        assert files == [name]
+        assert events[-1] == {'status': 'processing', 'conversion': expected}, (params, codec, events[-1])
+    assert service.metrics.counter('conversions_total', kind='transcode') == 2
+    assert service.metrics.counter('conversions_total', kind='remux') == 3
+    print("   ✓ Every job reports whether its output was remuxed or transcoded")
+
+
+def test_task_conversion():
+    manager = DownloadManager(new_service(), max_workers=2)
+    with tempfile.TemporaryDirectory() as d:
+        tasks = [manager.submit('https://fake.test/a?title=A&steps=2&merge=1', d, 'high', 'mp4', False),
+                 manager.submit('https://fake.test/b?title=B&steps=2&merge=1&merged=webm', d, 'high', 'mp4', False,
+                                transcode=True)]
+        end = time.time() + 20
+        while not all(t.finished for t in tasks) and time.time() < end:
+            time.sleep(0.02)
+    assert [t.conversion for t in tasks] == ['remux', 'transcode']
+    print("   ✓ Tasks carry the report for the UI")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Codec-Aware Presets")
+    print("=" * 60)
+    test_presets_prefer_container_codecs()
+    test_planner_matches_ytdlp_selectors()
+    test_transcode_mode_command()
+    test_jobs_report_remux_or_transcode()
+    test_task_conversion()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,178 @@
+"""
+Tests reuse of finished downloads through the content-hash index (no network required)
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedup
+from dedup import DedupIndex
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import ALREADY_DOWNLOADED, YtDlpService
+
+
+def make_service(index):
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0),
+                        dedup=index)
+
+
+def test_fingerprint_samples():
+    with tempfile.TemporaryDirectory() as d:
+        a, b = os.path.join(d, 'a'), os.path.join(d, 'b')
+        size = 4 * dedup.SAMPLE_BYTES
+        for path, middle in ((a, b'\0'), (b, b'\1')):
+            with open(path, 'wb') as f:
+                f.write(b'\0' * dedup.SAMPLE_BYTES + middle * dedup.SAMPLE_BYTES + b'\0' * 2 * dedup.SAMPLE_BYTES)
+        fa, fb = dedup.fingerprint(a), dedup.fingerprint(b)
+    assert fa.startswith(f"{size}:") and fa != fb  # The middle chunk is sampled
+    print("   ✓ Fingerprint is size plus start / middle / end samples")
+
+
+def test_same_folder_skips_download():
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        dest = os.path.join(d, 'dest')
+        index = DedupIndex(os.path.join(d, 'dedup.json'))
+        service = make_service(index)
+        url = 'https://fake.test/v?title=Clip&steps=3'
+        assert service.download(url, dest, 'high', 'mp4', False, lambda _: None)[0]
+        os.environ['FAKE_YTDLP_LOG'] = log
+        try:
+            ok, msg = service.download(url, dest, 'high', 'mp4', False, lambda _: None)
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        assert ok and msg == ALREADY_DOWNLOADED
+        assert not os.path.exists(log)  # yt-dlp not started
+        assert os.listdir(dest) == ['Clip.mp4']
+        # A different format is a different job
+        assert service.download(url, dest, 'low', 'mp4', False, lambda _: None)[1] != ALREADY_DOWNLOADED
+    assert service.metrics.counter('dedup_hits_total') == 1
+    print("   ✓ Same video and format already in the folder: not downloaded again")
+
+
+def test_file_outside_index_not_fetched_again():
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        dest = os.path.join(d, 'dest')
+        url = 'https://fake.test/v?title=Old Clip&steps=3'
+        # Saved before the index existed (or after it was cleared), named with the video id
+        assert make_service(None).download(url, dest, 'high', 'mp4', False, lambda _: None, template='title_id')[0]
+        index = DedupIndex(os.path.join(d, 'dedup.json'))
+        service = make_service(index)
+        assert service.fetch_info(url)[0]  # Analysed first, as the UI does
+        os.environ['FAKE_YTDLP_LOG'] = log
+        try:
+            ok, msg = service.download(url, dest, 'high', 'mp4', False, lambda _: None, template='title_id')
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        assert ok and msg == ALREADY_DOWNLOADED
+        assert not os.path.exists(log)  # yt-dlp not started
+        assert os.listdir(dest) == ['Old_Clip [v].mp4']  # No "Old_Clip [v]_2.mp4"
+        key = service._new_job(url, dest, 'high', 'mp4', False, template='title_id').dedup_key
+        assert index.find(key)  # Index seeded
+    print("   ✓ File already in the folder but not indexed: not downloaded again")
+
+
+def test_same_title_other_video_downloaded():
+    with tempfile.TemporaryDirectory() as d:
+        dest = os.path.join(d, 'dest')
+        index = DedupIndex(os.path.join(d, 'dedup.json'))
+        service = make_service(index)
+        first, second = 'https://fake.test/aaa?title=Same&steps=2', 'https://fake.test/bbb?title=Same&steps=2&size=2MiB'
+        for url in (first, second):
+            assert service.fetch_info(url)[0]
+            ok, msg = service.download(url, dest, 'high', 'mp4', False, lambda _: None)
+            assert ok and msg != ALREADY_DOWNLOADED
+        assert sorted(os.listdir(dest)) == ['Same.mp4', 'Same_2.mp4']
+        # Each video indexed with its own file
+        assert index.find(service._new_job(second, dest, 'high', 'mp4', False).dedup_key) == os.path.join(dest, 'Same_2.mp4')
+    print("   ✓ Another video with the same title (title-only template) is downloaded, not taken for this one")
+
+
+def test_other_folder_gets_hard_link():
+    with tempfile.TemporaryDirectory() as d:
+        first, second = os.path.join(d, 'mix'), os.path.join(d, 'uploads')
+        service = make_service(DedupIndex(os.path.join(d, 'dedup.json')))
+        url = 'https://fake.test/v?title=Clip&steps=3'
+        assert service.download(url, first, 'high', 'mp4', False, lambda _: None)[0]
+        ok, msg = service.download(url, second, 'high', 'mp4', False, lambda _: None)
+        assert ok and msg == ALREADY_DOWNLOADED
+        assert os.path.samefile(os.path.join(first, 'Clip.mp4'), os.path.join(second, 'Clip.mp4'))
+        assert os.listdir(second) == ['Clip.mp4']  # No work dir left behind
+    print("   ✓ Same job for another folder: hard link instead of a download")
+
+
+def test_reuse_keeps_template_subfolders():
+    with tempfile.TemporaryDirectory() as d:
+        first, second = os.path.join(d, 'mix'), os.path.join(d, 'uploads')
+        service = make_service(DedupIndex(os.path.join(d, 'dedup.json')))
+        url = 'https://fake.test/v?title=Clip&uploader=Chan&steps=3'
+        assert service.download(url, first, 'high', 'mp4', False, lambda _: None, template='uploader')[0]
+        ok, msg = service.download(url, second, 'high', 'mp4', False, lambda _: None, template='uploader')
+        assert ok and msg == ALREADY_DOWNLOADED
+        assert os.path.samefile(os.path.join(first, 'Chan', 'Clip.mp4'), os.path.join(second, 'Chan', 'Clip.mp4'))
+    print("   ✓ Reused files keep their template subfolders")
+
+
+def test_incomplete_set_not_reused():
+    with tempfile.TemporaryDirectory() as d:
+        paths = [os.path.join(d, 'Clip-part1.mp4'), os.path.join(d, 'Clip-part2.mp4')]
+        for path in paths:
+            with open(path, 'wb') as f:
+                f.write(path.encode())
+        index = DedupIndex(os.path.join(d, 'dedup.json'))
+        index.record('k', paths, d)
+        assert DedupIndex(os.path.join(d, 'dedup.json')).find_all('k') == {d: paths}  # Persisted as one set
+        os.remove(paths[1])
+        assert index.find_all('k') == {} and index.find('k') is None
+        assert index.reuse('k', os.path.join(d, 'other')) is None
+        assert not os.path.exists(os.path.join(d, 'other'))
+    print("   ✓ A job whose files are not all there is downloaded again, not reused in part")
+
+
+def test_identical_content_linked():
+    with tempfile.TemporaryDirectory() as d:
+        service = make_service(DedupIndex(os.path.join(d, 'dedup.json')))
+        # Two URLs, same bytes (a re-upload)
+        assert service.download('https://fake.test/a?title=A&steps=4', d, 'high', 'mp4', False, lambda _: None)[0]
+        assert service.download('https://fake.test/b?title=B&steps=4', d, 'high', 'mp4', False, lambda _: None)[0]
+        assert os.path.samefile(os.path.join(d, 'A.mp4'), os.path.join(d, 'B.mp4'))
+    print("   ✓ Finished file with the same content as an indexed one becomes a hard link")
+
+
+def test_stale_entry_dropped():
+    with tempfile.TemporaryDirectory() as d:
+        index_path = os.path.join(d, 'dedup.json')
+        path = os.path.join(d, 'Clip.mp4')
+        with open(path, 'wb') as f:
+            f.write(b'video')
+        index = DedupIndex(index_path)
+        index.record('k', [path])
+        assert DedupIndex(index_path).find('k') == path  # Persisted
+        with open(path, 'ab') as f:
+            f.write(b'edited')
+        assert index.find('k') is None
+        os.remove(path)
+        assert DedupIndex(index_path).find('k') is None
+        assert index.reuse('k', os.path.join(d, 'other')) is None
+    print("   ✓ Edited or deleted files are not reused")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Download Deduplication")
+    print("=" * 60)
+    test_fingerprint_samples()
+    test_same_folder_skips_download()
+    test_file_outside_index_not_fetched_again()
+    test_same_title_other_video_downloaded()
+    test_other_folder_gets_hard_link()
+    test_reuse_keeps_template_subfolders()
+    test_incomplete_set_not_reused()
+    test_identical_content_linked()
+    test_stale_entry_dropped()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,176 @@
+"""
+Tests the shared download manager with a fake service (no network required)
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download_manager import DownloadManager, DownloadTask
+from ytdlp_service import DownloadJob
+
+
+class FakeService:
+    def __init__(self, duration=0.05, fail=None, crash=()):
+        self.duration = duration
+        self.fail = fail or {}  # url -> list of messages for consecutive attempts
+        self.crash = set(crash)  # urls whose download raises
+        self.running = 0
+        self.peak = 0
+        self.rate_limits = []
+        self.options = []
+        self.lock = threading.Lock()
+
+    def terminate(self, cancel_event):
+        cancel_event.set()
+
+    def download(self, url, output_path, quality, codec, is_audio, progress_hook, cancel_event=None, rate_limit=None,
+                 **options):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.rate_limits.append(rate_limit)
+            self.options.append(options)
+        try:
+            if url in self.crash:
+                raise RuntimeError("disk vanished")
+            for p in (25, 50, 75, 100):
+                if cancel_event.wait(self.duration / 4):
+                    return False, "Cancelado pelo usuário"
+                progress_hook({'status': 'downloading', '_percent_str': f"{p}%", '_speed_str': '1.0MiB/s'})
+            failures = self.fail.get(url)
+            if failures:
+                return False, failures.pop(0)
+            return True, "Download Completo"
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def wait_until(cond, timeout=5):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_shared_pool_across_groups():
+    service = FakeService()
+    manager = DownloadManager(service, max_workers=2, bandwidth_limit=4_000_000)
+    playlist = [manager.submit(f"https://x/p{i}", "/tmp", "high", "mp4", False, group="playlist") for i in range(6)]
+    single = manager.submit("https://x/single", "/tmp", "high", "mp4", False, group="single")
+
+    assert wait_until(lambda: all(t.finished for t in playlist + [single]))
+    assert service.peak == 2  # One pool for every group
+    assert set(service.rate_limits) == {2_000_000}  # Budget split per worker
+    assert manager.group_summary("playlist") == {'total': 6, 'done': 6, 'failed': 0, 'cancelled': 0, 'active': 0, 'progress': 1.0}
+    assert manager.groups() == ["playlist", "single"]
+    print("   ✓ Groups share one worker pool and bandwidth budget")
+
+
+def test_cancel_group_keeps_others_running():
+    service = FakeService(duration=0.4)
+    manager = DownloadManager(service, max_workers=2)
+    a = [manager.submit(f"https://x/a{i}", "/tmp", "high", "mp4", False, group="a") for i in range(3)]
+    b = manager.submit("https://x/b", "/tmp", "high", "mp4", False, group="b")
+    assert wait_until(lambda: service.running == 2)
+    manager.cancel_group("a")
+
+    assert wait_until(lambda: b.finished)
+    assert b.status == DownloadTask.DONE
+    assert all(t.status == DownloadTask.CANCELLED for t in a)
+    print("   ✓ Cancelling one analysis leaves other jobs alone")
+
+
+def test_retry_and_events():
+    service = FakeService(fail={"https://x/flaky": ["Erro no download: HTTP Error 503"],
+                                "https://x/gone": ["Erro no download: Video unavailable"]})
+    manager = DownloadManager(service, max_workers=1, retry_base_delay=0.01)
+    seen = []
+    manager.subscribe(lambda t: seen.append((t.url, t.status)))
+    flaky = manager.submit("https://x/flaky", "/tmp", "high", "mp4", False)
+    gone = manager.submit("https://x/gone", "/tmp", "high", "mp4", False)
+
+    assert wait_until(lambda: flaky.finished and gone.finished)
+    assert flaky.status == DownloadTask.DONE and flaky.attempts == 2
+    assert gone.status == DownloadTask.FAILED and "unavailable" in gone.message
+    assert ("https://x/flaky", DownloadTask.RETRYING) in seen
+    print("   ✓ Transient failures retried, permanent ones reported")
+
+
+def test_service_exception_fails_task():
+    service = FakeService(crash={"https://x/crash"})
+    manager = DownloadManager(service, max_workers=1)
+    seen = []
+    manager.subscribe(lambda t: seen.append(t.status))
+    crash = manager.submit("https://x/crash", "/tmp", "high", "mp4", False)
+    after = manager.submit("https://x/after", "/tmp", "high", "mp4", False)
+
+    assert wait_until(lambda: crash.finished and after.finished)
+    assert crash.status == DownloadTask.FAILED and crash.message == "disk vanished"
+    assert DownloadTask.FAILED in seen  # Listeners were told
+    assert after.status == DownloadTask.DONE  # The worker kept going
+    print("   ✓ An exception in the service fails the task instead of leaving it running")
+
+
+def test_clear_finished_releases_jobs():
+    manager = DownloadManager(FakeService(duration=0.02, crash={"https://x/bad"}), max_workers=2)
+    done = [manager.submit(url, "/tmp", "high", "mp4", False) for url in ("https://x/a", "https://x/bad")]
+    assert wait_until(lambda: all(t.finished for t in done))
+    manager.clear_finished()
+    assert manager.tasks() == [] and manager._queue.stats() == {}  # Queue records released too
+    task = manager.submit("https://x/c", "/tmp", "high", "mp4", False)
+    assert wait_until(lambda: task.status == DownloadTask.DONE)
+    print("   ✓ Clearing finished tasks also drops their queue jobs")
+
+
+def test_options_passed_by_keyword():
+    service = FakeService(duration=0.01)
+    manager = DownloadManager(service, max_workers=1)
+    task = manager.submit("https://x/a", "/tmp", "high", "mp4", False, title="A", template='title_id',
+                          format_id='136+140', staged=True)
+    assert wait_until(lambda: task.finished)
+    assert service.options == [{'template': 'title_id', 'format_id': '136+140', 'staged': True}]
+    try:
+        manager.submit("https://x/b", "/tmp", "high", "mp4", False, rate_limit=1000)
+        assert False, "rate_limit accepted"
+    except TypeError:
+        pass
+    try:
+        DownloadJob("https://x/c", "/tmp", "high", "mp4", False, 1000)  # Options are keyword-only
+        assert False, "positional option accepted"
+    except TypeError:
+        pass
+    print("   ✓ Download options travel by name from submit to the service")
+
+
+def test_pause_and_move_to_front():
+    service = FakeService(duration=0.02)
+    manager = DownloadManager(service, max_workers=1)
+    manager.pause()
+    order = []
+    manager.subscribe(lambda t: order.append(t.url) if t.status == DownloadTask.DONE else None)
+    tasks = [manager.submit(f"https://x/{i}", "/tmp", "high", "mp4", False) for i in range(4)]
+    time.sleep(0.1)
+    assert service.peak == 0  # Nothing starts while paused
+    manager.move_to_front(tasks[3])
+    manager.resume()
+    assert wait_until(lambda: len(order) == 4)
+    assert order[0] == "https://x/3"
+    print("   ✓ Pause/resume and move-to-front")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Download Manager")
+    print("=" * 60)
+    test_shared_pool_across_groups()
+    test_cancel_group_keeps_others_running()
+    test_retry_and_events()
+    test_service_exception_fails_task()
+    test_clear_finished_releases_jobs()
+    test_options_passed_by_keyword()
+    test_pause_and_move_to_front()
+    print("\n✓ ALL TESTS PASSED")
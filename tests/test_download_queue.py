@@ -0,0 +1,123 @@
+"""
+Tests the download job queue: ordering, pause/resume and retries (no network required)
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download_queue import DownloadQueue, Job, is_transient
+
+
+def drain(q):
+    out = []
+    while True:
+        job = q.get(timeout=0.5)
+        if job is None:
+            return out
+        out.append(job.payload)
+        q.mark_done(job)
+
+
+def test_priority_and_move_to_front():
+    q = DownloadQueue()
+    jobs = [q.push(f"item{i}", priority=i) for i in range(5)]
+    q.set_priority(jobs[0].id, 10)
+    q.move_to_front(jobs[3].id)
+    assert drain(q) == ["item3", "item1", "item2", "item4", "item0"]
+    assert q.join(timeout=1)
+    print("   ✓ Priorities, reprioritising and move-to-front")
+
+
+def test_pause_resume():
+    q = DownloadQueue()
+    q.push("a")
+    q.pause()
+    assert q.get(timeout=0.1) is None  # Paused: nothing handed out
+    threading.Timer(0.1, q.resume).start()
+    job = q.get(timeout=2)
+    assert job and job.payload == "a"
+    print("   ✓ Pause holds new jobs until resume")
+
+
+def test_retry_with_backoff():
+    q = DownloadQueue(max_retries=2, base_delay=0.05, max_delay=0.2)
+    job = q.push("flaky")
+    q.push("private")
+
+    start = time.monotonic()
+    attempts = {"flaky": 0, "private": 0}
+    while True:
+        j = q.get(timeout=2)
+        if j is None:
+            break
+        attempts[j.payload] += 1
+        if j.payload == "flaky" and attempts["flaky"] < 3:
+            assert q.mark_failed(j, "ERROR: HTTP Error 503: Service Unavailable")
+        elif j.payload == "private":
+            assert not q.mark_failed(j, "ERROR: Private video")
+        else:
+            q.mark_done(j)
+
+    assert attempts == {"flaky": 3, "private": 1}
+    assert job.state == Job.DONE
+    assert time.monotonic() - start >= 0.05  # Backoff waited (0.025..0.05 + 0.05..0.1)
+    assert [j.payload for j in q.failures()] == ["private"]
+
+    # Retries are bounded
+    q = DownloadQueue(max_retries=1, base_delay=0.01)
+    q.push("down")
+    while (j := q.get(timeout=1)) is not None:
+        q.mark_failed(j, "Connection reset by peer")
+    assert q.failures()[0].attempts == 2
+    print("   ✓ Transient failures retried with backoff, permanent ones reported")
+
+
+def test_forget_finished_jobs():
+    q = DownloadQueue()
+    a, b, c = q.push("a", priority=1), q.push("b", priority=2), q.push("c", priority=3)
+    q.set_priority(c.id, 0)  # Leaves a stale heap item behind
+    assert not q.forget(a.id)  # Still queued
+    assert q.remove(a.id) and q.forget(a.id)
+    assert drain(q) == ["c", "b"]  # Items of a forgotten job are skipped
+    assert all(q.forget(job.id) for job in (b, c))
+    assert q.stats() == {} and q.failures() == []
+    assert not q.forget(a.id)  # Already gone
+    print("   ✓ Finished jobs can be dropped from the queue's records")
+
+
+def test_is_transient():
+    assert is_transient("Erro no download: HTTP Error 429: Too Many Requests")
+    assert is_transient("Read timed out.")
+    assert not is_transient("Erro no download: Video unavailable")
+    assert not is_transient("Cancelado pelo usuário")
+    assert not is_transient(None)
+    print("   ✓ Error classification")
+
+
+def test_large_queue_is_cheap():
+    q = DownloadQueue()
+    start = time.perf_counter()
+    jobs = [q.push(i, priority=i) for i in range(10_000)]
+    for job in jobs[::7]:
+        q.move_to_front(job.id)
+    count = len(drain(q))
+    elapsed = time.perf_counter() - start
+    assert count == 10_000
+    assert elapsed < 2.0, elapsed
+    print(f"   ✓ 10k jobs pushed, reordered and drained in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Download Queue")
+    print("=" * 60)
+    test_priority_and_move_to_front()
+    test_pause_resume()
+    test_retry_with_backoff()
+    test_forget_finished_jobs()
+    test_is_transient()
+    test_large_queue_is_cheap()
+    print("\n✓ ALL TESTS PASSED")
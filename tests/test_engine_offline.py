@@ -0,0 +1,179 @@
+"""
+Tests the thread-based service end to end against the fake yt-dlp (no network required)
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ytdlp_service
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService, default_ytdlp_cmd
+
+
+def new_service(**kwargs):
+    # Every fake URL is on one host; per-host limits are covered by test_host_limiter.py
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0), **kwargs)
+
+
+def test_configurable_command():
+    os.environ[ytdlp_service.YTDLP_ENV] = '/opt/yt-dlp --verbose'
+    try:
+        assert default_ytdlp_cmd() == ['/opt/yt-dlp', '--verbose']
+    finally:
+        del os.environ[ytdlp_service.YTDLP_ENV]
+    assert default_ytdlp_cmd() == [sys.executable, '-m', 'yt_dlp']
+    assert ytdlp_service.info_cmd('u', FAKE_YTDLP)[:2] == FAKE_YTDLP
+    print("   ✓ yt-dlp command from the constructor or VIDEO_DOWNLOADER_YTDLP")
+
+
+def test_metadata_playlist_and_batch():
+    service = new_service()
+    playlist, error = service.fetch_info('https://fake.test/list?playlist=3')
+    assert error is None and playlist['_type'] == 'playlist' and len(playlist['entries']) == 3
+    info, error = service.fetch_info('https://fake.test/gone?error=Private video')
+    assert info is None and error == 'Private video'
+    urls = [e['url'] for e in playlist['entries']]
+    batch = service.get_info_batch(urls)
+    assert sorted(batch) == sorted(urls) and batch[urls[0]]['id'] == 'list-0'
+    print("   ✓ Playlist, failing and batch metadata")
+
+
+def test_merge_download():
+    events = []
+    with tempfile.TemporaryDirectory() as d:
+        ok, msg = new_service().download('https://fake.test/clip?title=My Clip&merge=1&steps=4', d, 'high', 'mp4',
+                                         False, events.append)
+        files = os.listdir(d)
+    assert ok and msg == "Download Completo"
+    assert files == ['My_Clip.mp4']  # Intermediate formats merged and removed
+    assert {'status': 'processing'} in events
+    assert events[-1] == {'status': 'processing', 'conversion': 'remux'}  # Merged by copying the streams
+    print("   ✓ Two formats merged into one file")
+
+
+def test_cancel_cleans_partial_files():
+    service = new_service()
+    event, started, result = threading.Event(), threading.Event(), []
+    with tempfile.TemporaryDirectory() as d:
+        t = threading.Thread(target=lambda: result.append(service.download(
+            'https://fake.test/long?merge=1&steps=200&interval=0.02', d, 'high', 'mp4', False,
+            lambda _: started.set(), cancel_event=event)))
+        t.start()
+        assert started.wait(10)
+        start = time.monotonic()
+        service.terminate(event)
+        t.join(10)
+        latency = time.monotonic() - start
+        assert os.listdir(d) == []
+    assert result == [(False, ytdlp_service.CANCELLED)]
+    assert latency < 2
+    print(f"   ✓ Cancel stopped the child in {latency * 1000:.0f} ms and removed partial files")
+
+
+def test_rate_limit_and_progress_throttling():
+    events = []
+    with tempfile.TemporaryDirectory() as d:
+        start = time.monotonic()
+        ok, _ = new_service().download('https://fake.test/slow?size=1.00MiB&steps=40&interval=0', d, 'high', 'mp4',
+                                       False, events.append, rate_limit=1024 * 1024)
+        elapsed = time.monotonic() - start
+    assert ok and elapsed >= 1.0  # 1 MiB at 1 MiB/s
+    assert 2 <= len(events) <= 4  # 40 progress lines, at most one event per PROGRESS_INTERVAL
+    print(f"   ✓ --limit-rate honoured ({elapsed:.2f}s) and {len(events)} of 40 progress lines forwarded")
+
+
+def test_stalled_download_is_restarted_and_resumed():
+    service = new_service(stall_timeout=0.5)
+    events = []
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        out = os.path.join(d, 'out')
+        os.makedirs(out)
+        os.environ['FAKE_YTDLP_LOG'] = log
+        try:
+            start = time.monotonic()
+            # Hangs for 30s at 50%, like a dead CDN edge
+            ok, msg = service.download('https://fake.test/edge?steps=10&interval=0.02&stall=30&merge=1', out,
+                                       'high', 'mp4', False, events.append)
+            elapsed = time.monotonic() - start
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        files = os.listdir(out)
+        with open(log, encoding='utf-8') as f:
+            calls = f.readlines()
+    assert ok, msg
+    assert elapsed < 10 and len(calls) == 2
+    assert files == ['edge.mp4']
+    assert service.metrics.counter('stalls_total') == 1 and service.metrics.counter('restarts_total') == 1
+    print(f"   ✓ Stalled process killed after 0.5s and resumed from .part ({elapsed:.1f}s total)")
+
+
+def test_download_fails_after_max_restarts():
+    service = new_service(stall_timeout=0.3, max_restarts=1)
+    with tempfile.TemporaryDirectory() as d:
+        # Hangs on every run
+        ok, msg = service.download('https://fake.test/dead?dead=1', d, 'high', 'mp4', False,
+                                   lambda _: None)
+        left = os.listdir(d)
+    assert left == []
+    assert not ok and msg == "Download travado (sem progresso por 0.3s)"
+    assert service.metrics.counter('stalls_total') == 2 and service.metrics.counter('restarts_total') == 1
+    print("   ✓ Gives up after max_restarts with a retryable error")
+
+
+def test_failed_download_leaves_nothing():
+    with tempfile.TemporaryDirectory() as d:
+        ok, msg = new_service().download('https://fake.test/v?merge=1&steps=10&error=HTTP+Error+500&fail_at=70', d,
+                                         'high', 'mp4', False, lambda _: None)
+        left = os.listdir(d)
+    assert not ok and msg == "Erro no download: HTTP Error 500"
+    assert left == []  # Formats and .part files removed with the work dir
+    print("   ✓ Failed download removed its partial files")
+
+
+def test_concurrent_requests_share_one_process():
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        out = os.path.join(d, 'out')
+        os.makedirs(out)
+        os.environ['FAKE_YTDLP_LOG'] = log
+        service = new_service()
+        results = []
+        try:
+            threads = [threading.Thread(target=lambda: results.append(service.download(
+                'https://fake.test/same?steps=10&interval=0.03', out, 'high', 'mp4', False, lambda _: None)))
+                for _ in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(10)
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        with open(log, encoding='utf-8') as f:
+            calls = [json.loads(line) for line in f]
+    assert len(results) == 3 and all(ok for ok, _ in results)
+    assert len(calls) == 1
+    print("   ✓ Three identical requests ran one yt-dlp process")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Engine (fake yt-dlp)")
+    print("=" * 60)
+    test_configurable_command()
+    test_metadata_playlist_and_batch()
+    test_merge_download()
+    test_cancel_cleans_partial_files()
+    test_rate_limit_and_progress_throttling()
+    test_stalled_download_is_restarted_and_resumed()
+    test_download_fails_after_max_restarts()
+    test_failed_download_leaves_nothing()
+    test_concurrent_requests_share_one_process()
+    print("\n✓ ALL TESTS PASSED")
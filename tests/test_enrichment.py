@@ -0,0 +1,102 @@
+"""
+Tests the background metadata enricher with a fake service (no network required)
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enrichment import MetadataEnricher
+
+
+class FakeService:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.batch_times = []
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def get_cached(self, url):
+        return self.cache.get(url)
+
+    def get_info_batch(self, urls):
+        with self.lock:
+            self.batches.append(list(urls))
+            self.batch_times.append(time.monotonic())
+        time.sleep(self.delay)
+        results = {u: {'url': u, 'formats': [{}]} for u in urls if 'broken' not in u}
+        self.cache.update(results)
+        return results
+
+
+def wait_for(results, count, timeout=5):
+    end = time.time() + timeout
+    while len(results) < count and time.time() < end:
+        time.sleep(0.01)
+
+
+def test_batches_and_callbacks():
+    service = FakeService()
+    enricher = MetadataEnricher(service, max_workers=2, batch_size=5, host_interval=0)
+    results = {}
+    urls = [f"https://a.example/v{i}" for i in range(12)] + ["https://a.example/broken"]
+    for i, url in enumerate(urls):
+        enricher.request(url, lambda u, info: results.__setitem__(u, info), priority=i)
+    wait_for(results, len(urls))
+
+    assert len(results) == len(urls)
+    assert results["https://a.example/broken"] is None
+    assert all(len(b) <= 5 for b in service.batches)
+    assert len(service.batches) <= 4  # 13 URLs, batches of 5 (coalesced)
+
+    # Cached URLs are answered immediately without a new batch
+    before = len(service.batches)
+    hit = []
+    enricher.request(urls[0], lambda u, info: hit.append(info))
+    assert hit and hit[0]['url'] == urls[0]
+    assert len(service.batches) == before
+    print("   ✓ Batched resolution, failures reported as None, cache hits")
+
+
+def test_prioritize_and_politeness():
+    service = FakeService(delay=0.05)
+    enricher = MetadataEnricher(service, max_workers=1, batch_size=2, host_interval=0.2, coalesce=0.1)
+    done = []
+    urls = [f"https://b.example/v{i}" for i in range(6)]
+    for i, url in enumerate(urls):
+        enricher.request(url, lambda u, info: done.append(u), priority=i)
+    # Rows 4 and 5 scrolled into view before the first batch was built
+    enricher.prioritize([urls[4], urls[5]])
+    wait_for(done, len(urls))
+
+    assert service.batches[0] == [urls[4], urls[5]]
+    gaps = [b - a for a, b in zip(service.batch_times, service.batch_times[1:])]
+    assert all(g >= 0.19 for g in gaps), gaps
+    print("   ✓ Visible rows first, per-host interval respected")
+
+
+def test_clear_drops_pending():
+    service = FakeService(delay=0.1)
+    enricher = MetadataEnricher(service, max_workers=1, batch_size=1, host_interval=0)
+    done = []
+    for i in range(5):
+        enricher.request(f"https://c.example/v{i}", lambda u, info: done.append(u))
+    time.sleep(0.12)
+    enricher.clear()
+    time.sleep(0.3)
+    assert enricher.pending() == 0
+    assert len(done) <= 2
+    print("   ✓ clear() drops pending requests")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Metadata Enricher")
+    print("=" * 60)
+    test_batches_and_callbacks()
+    test_prioritize_and_politeness()
+    test_clear_drops_pending()
+    print("\n✓ ALL TESTS PASSED")
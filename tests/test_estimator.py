@@ -0,0 +1,57 @@
+"""
+Tests the format-based size estimator (no network required)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import estimator
+
+# Minimal ladder in yt-dlp order (worst -> best)
+FORMATS = [
+    {'format_id': '139', 'vcodec': 'none', 'acodec': 'mp4a.40.5', 'abr': 48, 'filesize': 1_000_000},
+    {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128, 'filesize': 3_000_000},
+    {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a.40.2', 'height': 360, 'filesize_approx': 8_000_000},
+    {'format_id': '135', 'vcodec': 'avc1', 'acodec': 'none', 'height': 480, 'filesize': 10_000_000},
+    {'format_id': '136', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 2000},
+    {'format_id': '401', 'vcodec': 'av01', 'acodec': 'none', 'height': 2160, 'filesize': 400_000_000},
+]
+
+
+def test_pick_formats():
+    ids = lambda fs: [f['format_id'] for f in fs]
+    assert ids(estimator.pick_formats(FORMATS, False, 'high')) == ['401', '140']
+    assert ids(estimator.pick_formats(FORMATS, False, 'medium')) == ['136', '140']
+    assert ids(estimator.pick_formats(FORMATS, False, 'low')) == ['135', '140']
+    assert ids(estimator.pick_formats(FORMATS, True, 'high')) == ['140']
+    # No separate streams: falls back to the best combined format
+    assert ids(estimator.pick_formats(FORMATS[2:3], False, 'high')) == ['18']
+    assert estimator.pick_formats([], False, 'high') == []
+    print("   ✓ Format selection mirrors download selectors")
+
+
+def test_estimate_bytes():
+    info = {'duration': 100, 'formats': FORMATS}
+    assert estimator.estimate_bytes(info, False, 'high') == (403_000_000, True)
+    assert estimator.estimate_bytes(info, True, 'low') == (3_000_000, True)
+    # 2000 kbps * 100 s = 25 MB (decimal) from tbr
+    assert estimator.estimate_bytes(info, False, 'medium') == (25_000_000 + 3_000_000, True)
+
+    # tbr without duration can't be sized -> fallback
+    size, exact = estimator.estimate_bytes({'formats': FORMATS}, False, 'medium')
+    assert (size, exact) == (0, False)
+
+    # Flat playlist entry: duration only
+    size, exact = estimator.estimate_bytes({'duration': 60}, True, 'high')
+    assert not exact and size == 320 * 1000 // 8 * 60
+    print("   ✓ Sizes come from filesize / filesize_approx / tbr")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Size Estimator")
+    print("=" * 60)
+    test_pick_formats()
+    test_estimate_bytes()
+    print("\n✓ ALL TESTS PASSED")
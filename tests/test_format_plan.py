@@ -0,0 +1,75 @@
+"""
+Tests format plans resolved from metadata before downloads start (no network required)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import format_plan
+from download_manager import DownloadManager
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService, download_cmd
+
+
+def new_service():
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0))
+
+
+def test_plan_from_formats():
+    info = new_service().get_info('https://fake.test/v?title=Clip&duration=100')
+    medium = format_plan.plan(info, False, 'medium')
+    assert medium['format_id'] == '247+251' and medium['height'] == 720
+    assert format_plan.describe(medium) == "720p · VP9 + Opus · 28 MB"
+    assert format_plan.plan(info, True, 'high')['format_id'] == '251'
+    combined = {'formats': [{'format_id': '18', 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360}]}
+    assert format_plan.plan(combined, False, 'high')['format_id'] == '18'
+    assert format_plan.describe(format_plan.plan(combined, False, 'high')) == "360p · H.264 + AAC"
+    assert format_plan.plan({'title': 'flat entry'}, False, 'high') is None
+    print("   ✓ Planned format ids, resolution, codecs and size match the quality selector")
+
+
+def test_command_keeps_selector_fallback():
+    cmd = download_cmd('https://x.test/v', '/tmp', 'medium', 'mp4', False, ytdlp=['yt-dlp'], format_id='136+140')
+    assert cmd[cmd.index('-f') + 1] == f"136+140/{format_plan.video_selector('medium', 'mp4')}"
+    cmd = download_cmd('https://x.test/v', '/tmp', 'medium', 'mp4', False, ytdlp=['yt-dlp'])
+    assert cmd[cmd.index('-f') + 1] == format_plan.video_selector('medium', 'mp4')
+    print("   ✓ Explicit ids go first, the selector only if they are gone")
+
+
+def test_playlist_items_get_planned_ids():
+    service = new_service()
+    urls = [f'https://fake.test/{n}?title=Item{n}&steps=2' for n in range(3)]
+    details = service.get_info_batch(urls)  # What the playlist screen's enricher fetches
+    plans = {url: format_plan.plan(details[url], False, 'low', 'mp4') for url in urls}
+    manager = DownloadManager(service, max_workers=3)
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        os.environ['FAKE_YTDLP_LOG'] = log
+        try:
+            tasks = [manager.submit(url, d, 'low', 'mp4', False, format_id=plans[url]['format_id']) for url in urls]
+            end = time.time() + 20
+            while not all(t.finished for t in tasks) and time.time() < end:
+                time.sleep(0.02)
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        with open(log, encoding='utf-8') as f:
+            selectors = [argv[argv.index('-f') + 1] for argv in map(json.loads, f)]
+    assert all(t.message == "Download Completo" for t in tasks)
+    assert selectors == [f"135+140/{format_plan.video_selector('low', 'mp4')}"] * 3
+    print("   ✓ Workers received the planned format ids")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Format Plans")
+    print("=" * 60)
+    test_plan_from_formats()
+    test_command_keeps_selector_fallback()
+    test_playlist_items_get_planned_ids()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,96 @@
+"""
+Tests the per-host rate / connection limiter and its 429 backoff (no network required)
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter, host_key, is_throttled
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService
+
+
+def test_host_key():
+    assert host_key('https://youtu.be/dQw4w9WgXcQ') == host_key('https://m.youtube.com/watch?v=dQw4w9WgXcQ') == 'youtube'
+    assert host_key('https://www.youtube.com/playlist?list=PL123') == 'youtube'
+    assert host_key('https://www.example.org/a.mp4') == host_key('https://example.org/b.mp4') == 'example.org'
+    assert is_throttled("ERROR: unable to download video data: HTTP Error 429: Too Many Requests")
+    assert not is_throttled("ERROR: Private video")
+    print("   ✓ URLs grouped by extractor / host; 429 and 403 recognised")
+
+
+def test_rate_and_connections():
+    limiter = HostLimiter(max_connections=2, rate=10)
+    url = 'https://example.org/v'
+    starts = []
+
+    def job():
+        with limiter.slot(url):
+            starts.append(time.monotonic())
+            time.sleep(0.3)
+
+    begin = time.monotonic()
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for t in threads:
+        t.start()
+    # Another host is not held back
+    assert limiter.acquire('https://other.org/v') and time.monotonic() - begin < 0.2
+    for t in threads:
+        t.join()
+    starts.sort()
+    assert all(b - a >= 0.09 for a, b in zip(starts, starts[1:]))  # Max 10 starts/s
+    assert starts[2] - begin >= 0.3  # Third waited for a connection slot
+    assert limiter.snapshot()['example.org']['active'] == 0
+    print("   ✓ Starts spaced by the rate limit, at most 2 connections per host")
+
+
+def test_backoff_and_recovery():
+    limiter = HostLimiter(rate=0, backoff_base=0.2, backoff_max=0.3)
+    url = 'https://example.org/v'
+    assert limiter.throttled(url) == 0.2
+    assert limiter.throttled(url) == 0.3  # Doubled, capped at backoff_max
+    acquired, wait = limiter.try_acquire(url, connection=False)
+    assert not acquired and 0.2 < wait <= 0.3
+    cancel = threading.Event()
+    cancel.set()
+    assert not limiter.acquire(url, cancel_event=cancel)
+    start = time.monotonic()
+    assert limiter.acquire(url, connection=False)
+    assert time.monotonic() - start >= 0.2
+    limiter.succeeded(url)
+    limiter.succeeded(url)
+    assert limiter.snapshot()['example.org']['level'] == 0
+    print("   ✓ Backoff doubles per throttle, waiters can cancel, successes wind it down")
+
+
+def test_service_backs_off_on_429():
+    registry = MetricsRegistry()
+    limiter = HostLimiter(rate=0, backoff_base=0.5)
+    service = YtDlpService(metrics=registry, ytdlp_cmd=FAKE_YTDLP, host_limiter=limiter)
+    with tempfile.TemporaryDirectory() as d:
+        ok, msg = service.download('https://fake.test/a?error=HTTP Error 429: Too Many Requests', d, 'high', 'mp4',
+                                   False, lambda _: None)
+        assert not ok and '429' in msg
+        assert registry.counter('throttled_total') == 1
+        start = time.monotonic()
+        ok, _ = service.download('https://fake.test/b?steps=1', d, 'high', 'mp4', False, lambda _: None)
+        waited = time.monotonic() - start
+    assert ok and waited >= 0.4  # Same host waited out the backoff
+    assert limiter.snapshot()['fake.test']['level'] == 0  # Recovered
+    print(f"   ✓ 429 from yt-dlp paused the host ({waited:.2f}s) and recovered on success")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Host Limiter")
+    print("=" * 60)
+    test_host_key()
+    test_rate_and_connections()
+    test_backoff_and_recovery()
+    test_service_backs_off_on_429()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,81 @@
+"""
+Tests live stream recording into rotating segments (no network required)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import live
+import output_paths
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from live import LiveRecorder
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService
+
+
+def new_service():
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0))
+
+
+def test_detect_and_command():
+    assert live.is_live({'is_live': True})
+    assert live.is_live({'live_status': 'is_upcoming'})  # Premiere
+    assert not live.is_live({'live_status': 'was_live'})
+    assert not live.is_live(None)
+    cmd = live.live_cmd('https://x.test/live', 'medium', False, from_start=True, ytdlp=['yt-dlp'])
+    assert cmd[cmd.index('-o') + 1] == '-' and '--live-from-start' in cmd and cmd[-1] == 'https://x.test/live'
+    assert '--live-from-start' not in live.live_cmd('https://x.test/live', 'high', True, ytdlp=['yt-dlp'])
+    print("   ✓ Live / upcoming streams detected, capture command pipes MPEG-TS")
+
+
+def test_segments_survive_drops():
+    service = new_service()
+    url = f'https://fake.test/live?title=Show&live_until={time.time() + 2.5:.2f}&drop_every=0.5'
+    assert live.is_live(service.get_info(url))
+    with tempfile.TemporaryDirectory() as d:
+        recorder = LiveRecorder(service, url, d, title='Show', segment_seconds=0.25).start()
+        assert recorder.wait(timeout=20)
+        files = sorted(os.listdir(d))
+        sizes = [os.path.getsize(os.path.join(d, name)) for name in files]
+    assert recorder.status == LiveRecorder.FINISHED, recorder.message
+    assert recorder.reconnects >= 1
+    assert len(files) == len(recorder.segments) >= 3
+    assert all(name.startswith('Show_') and name.endswith('.ts') for name in files)
+    assert all(size and size % live.TS_PACKET == 0 for size in sizes)  # Cut on packet boundaries
+    assert sum(sizes) == recorder.bytes_written
+    assert output_paths.WORK_DIR not in files
+    assert service.metrics.counter('live_reconnects_total') == recorder.reconnects
+    assert service.metrics.counter('live_segments_total') == len(files)
+    print(f"   ✓ {len(files)} segments over {recorder.reconnects} reconnects, all whole packets")
+
+
+def test_stop_keeps_recording():
+    service = new_service()
+    url = f'https://fake.test/live?title=Show&live_until={time.time() + 600:.0f}'
+    with tempfile.TemporaryDirectory() as d:
+        recorder = LiveRecorder(service, url, d, title='Show').start()
+        time.sleep(1)
+        start = time.monotonic()
+        recorder.stop()
+        assert recorder.wait(timeout=10)
+        stopped_in = time.monotonic() - start
+        files = os.listdir(d)
+        size = os.path.getsize(os.path.join(d, files[0]))
+    assert recorder.status == LiveRecorder.FINISHED and recorder.reconnects == 0
+    assert len(files) == 1 and size == recorder.bytes_written > 0  # Open segment finalized, work dir gone
+    assert stopped_in < 3
+    print("   ✓ Stop finalizes the open segment instead of deleting it")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Live Recording")
+    print("=" * 60)
+    test_detect_and_command()
+    test_segments_survive_drops()
+    test_stop_keeps_recording()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,88 @@
+"""
+Tests the queue-based logging pipeline (rotation, level, JSON records with job ids)
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_setup import job_context, resolve_level, setup_logging, stop_logging
+
+
+def read_records(path):
+    records = []
+    for name in sorted(os.listdir(os.path.dirname(path))):
+        if name.startswith(os.path.basename(path)):
+            with open(os.path.join(os.path.dirname(path), name), encoding='utf-8') as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def test_json_records_rotation_and_level():
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'app_log.txt')
+        listener = setup_logging(path, level='INFO', max_bytes=20_000, backups=5, console=False)
+        try:
+            log = logging.getLogger('test.worker')
+
+            def worker(job_id):
+                with job_context(job_id):
+                    for i in range(50):
+                        log.info(f"progress {i}")
+                        log.debug("hidden at INFO")
+
+            threads = [threading.Thread(target=worker, args=(n,)) for n in (1, 2, 3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            log.warning("outside any job")
+        finally:
+            stop_logging(listener)
+            for handler in listener.handlers:
+                handler.close()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+
+        records = read_records(path)
+        assert len([n for n in os.listdir(d) if n.startswith('app_log.txt.')]) >= 1  # Rotated
+        assert all(os.path.getsize(os.path.join(d, n)) <= 20_000 for n in os.listdir(d))
+        assert not any(r['msg'] == "hidden at INFO" for r in records)
+        by_job = {}
+        for r in records:
+            by_job.setdefault(r['job_id'], []).append(r)
+        assert {1, 2, 3} <= set(by_job)
+        assert all(r['msg'].startswith('progress') for job in (1, 2, 3) for r in by_job[job])
+        assert by_job[None][-1]['msg'] == "outside any job" and by_job[None][-1]['level'] == 'WARNING'
+        assert {'ts', 'level', 'logger', 'thread', 'job_id', 'msg'} <= set(records[0])
+    print("   ✓ JSON records tagged with job ids, rotated by size, filtered by level")
+
+
+def test_resolve_level():
+    assert resolve_level('debug') == logging.DEBUG
+    assert resolve_level(logging.WARNING) == logging.WARNING
+    assert resolve_level('nonsense') == logging.INFO
+    os.environ['VIDEO_DOWNLOADER_LOG_LEVEL'] = 'ERROR'
+    try:
+        assert resolve_level() == logging.ERROR
+    finally:
+        del os.environ['VIDEO_DOWNLOADER_LOG_LEVEL']
+    print("   ✓ Level from argument or environment")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Logging Pipeline")
+    print("=" * 60)
+    test_json_records_rotation_and_level()
+    test_resolve_level()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,123 @@
+"""
+Tests the audio batch mode: parallel stream downloads and two-pass loudness normalization (no network required)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import loudnorm
+from dedup import DedupIndex
+from download_manager import DownloadManager
+from fake_ffmpeg import FAKE_FFMPEG
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from loudnorm import Normalizer
+from metrics import MetricsRegistry
+from ytdlp_service import ALREADY_DOWNLOADED, YtDlpService
+
+
+def new_service(**kwargs):
+    metrics = MetricsRegistry()
+    return YtDlpService(metrics=metrics, ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0),
+                        normalizer=Normalizer(FAKE_FFMPEG, max_workers=2, metrics=metrics), **kwargs)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        return json.loads(f.readline())
+
+
+def logged(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_commands_and_stats():
+    stderr = 'size=N/A\n[Parsed_loudnorm_0 @ 0x1]\n{\n "input_i" : "-23.05",\n "input_tp" : "-4.10",\n ' \
+             '"input_lra" : "7.20",\n "input_thresh" : "-33.40",\n "target_offset" : "0.30"\n}\n'
+    stats = loudnorm.parse_stats(stderr)
+    assert stats == {'input_i': -23.05, 'input_tp': -4.1, 'input_lra': 7.2, 'input_thresh': -33.4, 'target_offset': 0.3}
+    assert loudnorm.parse_stats(stderr.replace('-23.05', '-inf')) is None  # Silence
+    assert loudnorm.parse_stats('no stats') is None
+    analyze = loudnorm.analyze_cmd('in.webm', ['ffmpeg'])
+    assert analyze[-3:] == ['-f', 'null', '-'] and 'print_format=json' in analyze[analyze.index('-af') + 1]
+    encode = loudnorm.encode_cmd('in.webm', 'out.mp3', 'mp3', 'high', stats, ['ffmpeg'])
+    chain = encode[encode.index('-af') + 1]
+    assert 'measured_I=-23.05' in chain and 'linear=true' in chain
+    assert encode[encode.index('-c:a') + 1] == 'libmp3lame' and encode[encode.index('-b:a') + 1] == '320k'
+    assert '-b:a' not in loudnorm.encode_cmd('in.webm', 'out.wav', 'wav', 'high', stats, ['ffmpeg'])
+    print("   ✓ Pass 1 measures, pass 2 applies the measured gain and encodes in the same run")
+
+
+def test_playlist_batch():
+    service = new_service()
+    manager = DownloadManager(service, max_workers=3)
+    with tempfile.TemporaryDirectory() as d:
+        ytdlp_log, ffmpeg_log = os.path.join(d, 'ytdlp.jsonl'), os.path.join(d, 'ffmpeg.jsonl')
+        dest = os.path.join(d, 'dest')
+        os.environ.update(FAKE_YTDLP_LOG=ytdlp_log, FAKE_FFMPEG_LOG=ffmpeg_log)
+        try:
+            tasks = [manager.submit(f'https://fake.test/{n}?title=Track{n}_{lufs}LUFS&steps=3', dest, 'medium', 'mp3',
+                                    True, group='album', normalize=True)
+                     for n, lufs in ((1, -23), (2, -9), (3, -16))]
+            end = time.time() + 20
+            while not all(t.finished for t in tasks) and time.time() < end:
+                time.sleep(0.02)
+            assert service.normalizer.wait(timeout=20)
+        finally:
+            del os.environ['FAKE_YTDLP_LOG'], os.environ['FAKE_FFMPEG_LOG']
+        files = sorted(os.listdir(dest))
+        headers = {name: read_header(os.path.join(dest, name)) for name in files}
+        ytdlp_runs, ffmpeg_runs = logged(ytdlp_log), logged(ffmpeg_log)
+    assert files == ['Track1_-23LUFS.mp3', 'Track2_-9LUFS.mp3', 'Track3_-16LUFS.mp3']
+    assert all('--extract-audio' not in argv for argv in ytdlp_runs)  # Streams downloaded as they are
+    assert len(ffmpeg_runs) == 6  # Analysis + one normalize-and-encode run per file
+    assert 'measured_I=-23.0' in headers['Track1_-23LUFS.mp3']['filter']
+    assert 'measured_I=-9.0' in headers['Track2_-9LUFS.mp3']['filter']
+    assert all(h['codec'] == 'libmp3lame' and h['bitrate'] == '192k' for h in headers.values())
+    assert service.metrics.snapshot()['histograms']['normalize_seconds']['count'] == 3
+    print("   ✓ Audio playlist: streams downloaded in parallel, each normalized and encoded in one pass")
+
+
+def test_silence_and_broken_input():
+    service = new_service()
+    with tempfile.TemporaryDirectory() as d:
+        for title in ('Intro_silent', 'Glitch_corrupt'):
+            ok, msg = service.download(f'https://fake.test/{title}?title={title}&steps=2', d, 'high', 'm4a', True,
+                                       lambda _: None, normalize=True)
+            assert ok, msg
+        assert service.normalizer.wait(timeout=10)
+        files = sorted(os.listdir(d))
+        silent = read_header(os.path.join(d, 'Intro_silent.m4a'))
+    assert files == ['Glitch_corrupt.webm', 'Intro_silent.m4a']  # A failed encode keeps the download
+    assert silent['filter'] is None and silent['codec'] == 'aac'
+    print("   ✓ Silence is encoded without gain, a failed encode keeps the original audio")
+
+
+def test_normalized_files_reused():
+    with tempfile.TemporaryDirectory() as d:
+        service = new_service(dedup=DedupIndex(os.path.join(d, 'dedup.json')))
+        url = 'https://fake.test/a?title=Song&steps=2'
+        assert service.download(url, d, 'high', 'mp3', True, lambda _: None, normalize=True)[0]
+        assert service.normalizer.wait(timeout=10)
+        assert service.download(url, d, 'high', 'mp3', True, lambda _: None, normalize=True)[1] == ALREADY_DOWNLOADED
+        # Not normalized: another job
+        assert service.download(url, d, 'high', 'mp3', True, lambda _: None)[1] != ALREADY_DOWNLOADED
+    print("   ✓ Normalized files are indexed and reused; the plain extract is a separate job")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Audio Batch Normalization")
+    print("=" * 60)
+    test_commands_and_stats()
+    test_playlist_batch()
+    test_silence_and_broken_input()
+    test_normalized_files_reused()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,124 @@
+"""
+Tests the metrics registry, its exporters and the service / manager instrumentation (no network required)
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download_manager import DownloadManager
+from fake_ytdlp import FAKE_YTDLP
+from logging_setup import job_context
+from metrics import JsonlDumper, MetricsRegistry, parse_size, serve_prometheus
+from ytdlp_service import MetadataCache, YtDlpService
+
+def test_parse_size():
+    assert parse_size('2.00MiB') == 2 * 1024 * 1024
+    assert parse_size('~1.5KiB') == 1536
+    assert parse_size('10MB') == 10_000_000
+    assert parse_size('N/A') is None and parse_size(None) is None
+    print("   ✓ yt-dlp size strings")
+
+
+def test_registry_aggregate_and_per_job():
+    registry = MetricsRegistry(max_jobs=2)
+    with job_context(1):
+        registry.observe('ttfb_seconds', 0.3)
+        registry.inc('retries_total')
+        registry.inc('retries_total')
+    registry.observe('ttfb_seconds', 7, job_id=2)
+    registry.observe('ttfb_seconds', 900, job_id=3)  # Above the last bucket
+    registry.inc('downloads_total', result='success')
+
+    hist = registry.histogram('ttfb_seconds')
+    assert hist['count'] == 3 and hist['p50'] == 10 and hist['p95'] == float('inf')
+    assert registry.counter('retries_total') == 2
+    assert registry.counter('downloads_total', result='success') == 1
+    assert registry.job(1) == {}  # Evicted: only the last 2 jobs are kept
+    assert registry.job(2) == {'ttfb_seconds': 7}
+
+    text = registry.prometheus_text()
+    assert '# TYPE video_downloader_ttfb_seconds histogram' in text
+    assert 'video_downloader_ttfb_seconds_bucket{le="0.5"} 1' in text
+    assert 'video_downloader_ttfb_seconds_bucket{le="+Inf"} 3' in text
+    assert 'video_downloader_downloads_total{result="success"} 1' in text
+    json.dumps(registry.snapshot())  # Serialisable
+    print("   ✓ Counters, histograms and bounded per-job records")
+
+
+def test_exporters():
+    registry = MetricsRegistry()
+    registry.inc('cache_hits_total', 3)
+    server = serve_prometheus(registry, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        body = urllib.request.urlopen(url, timeout=5).read().decode()
+        assert 'video_downloader_cache_hits_total 3' in body
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'metrics.jsonl')
+        dumper = JsonlDumper(path, registry, interval=0.05).start()
+        time.sleep(0.2)
+        dumper.stop()
+        with open(path, encoding='utf-8') as f:
+            snapshots = [json.loads(line) for line in f]
+    assert len(snapshots) >= 2
+    assert snapshots[-1]['counters']['cache_hits_total'] == 3
+    print("   ✓ Prometheus endpoint and periodic JSONL dump")
+
+
+def test_cache_hits():
+    registry = MetricsRegistry()
+    cache = MetadataCache(metrics=registry)
+    cache.get('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    cache.put('https://www.youtube.com/watch?v=dQw4w9WgXcQ', {'id': 'dQw4w9WgXcQ'})
+    cache.get('https://youtu.be/dQw4w9WgXcQ')
+    assert registry.counter('cache_hits_total') == 1 and registry.counter('cache_misses_total') == 1
+    print("   ✓ Metadata cache hits and misses")
+
+
+def test_download_phases_through_manager():
+    registry = MetricsRegistry()
+    # Two formats, progress, then a merge step
+    url = 'https://fake.test/v?size=2.00MiB&steps=3&interval=0.05&merge=1'
+    with tempfile.TemporaryDirectory() as d:
+        manager = DownloadManager(YtDlpService(metrics=registry, ytdlp_cmd=FAKE_YTDLP), max_workers=1, metrics=registry)
+        done = threading.Event()
+        manager.subscribe(lambda t: t.finished and done.set())
+        task = manager.submit(url, d, 'high', 'mp4', False)
+        assert done.wait(30)
+
+    assert task.status == 'done'
+    job = registry.job(task.id)
+    for field in ('queue_wait_seconds', 'extractor_seconds', 'ttfb_seconds', 'download_seconds', 'merge_seconds'):
+        assert field in job, field
+    assert job['ttfb_seconds'] >= job['extractor_seconds'] > 0
+    assert job['merge_seconds'] >= 0.04
+    assert job['downloaded_bytes_total'] == 2 * 1024 * 1024
+    assert job['result'] == 'success' and job['attempts'] == 1
+    assert registry.counter('downloads_total', result='success') == 1
+    end = time.time() + 5  # The worker frees its slot right after the last update
+    while 'workers_busy 0' not in registry.prometheus_text() and time.time() < end:
+        time.sleep(0.01)
+    assert 'workers_busy 0' in registry.prometheus_text()
+    print("   ✓ Queue wait, extraction, TTFB, download and merge recorded per job")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Metrics")
+    print("=" * 60)
+    test_parse_size()
+    test_registry_aggregate_and_per_job()
+    test_exporters()
+    test_cache_hits()
+    test_download_phases_through_manager()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,146 @@
+"""
+Tests output templates, atomic name reservation and promotion of finished files (no network required)
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import output_paths
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService
+
+
+def new_service():
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0))
+
+
+def test_templates_and_prefill():
+    assert output_paths.resolve_template(None) == '%(title)s.%(ext)s'
+    assert output_paths.resolve_template('title_id') == '%(title)s [%(id)s].%(ext)s'
+    assert output_paths.resolve_template('%(id)s.%(ext)s') == '%(id)s.%(ext)s'
+    filled = output_paths.prefill('playlist', {'playlist_title': 'My List: 100%', 'playlist_index': 7})
+    assert filled == 'My_List_-_100%%/007 - %(title)s.%(ext)s'
+    assert output_paths.prefill('date', {'playlist_index': 1}) == output_paths.TEMPLATES['date']
+    print("   ✓ Presets resolved; caller fields filled in and escaped, the rest left to yt-dlp")
+
+
+def test_reserve_path_is_atomic():
+    with tempfile.TemporaryDirectory() as d:
+        target = os.path.join(d, 'Same.mp4')
+        claimed = []
+        barrier = threading.Barrier(8)
+
+        def claim():
+            barrier.wait()
+            claimed.append(output_paths.reserve_path(target))
+
+        threads = [threading.Thread(target=claim) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        names = sorted(os.path.basename(p) for p in claimed)
+    assert len(set(claimed)) == 8
+    assert names == ['Same.mp4'] + [f'Same_{n}.mp4' for n in range(2, 9)]
+    print("   ✓ 8 concurrent claims of one name got 8 distinct files")
+
+
+def test_promote_job_keeps_existing_files():
+    with tempfile.TemporaryDirectory() as d:
+        with open(os.path.join(d, 'Clip.mp4'), 'w') as f:
+            f.write('old')
+        work = output_paths.job_dir(d, ('fake:clip', 'high'))
+        os.makedirs(os.path.join(work, 'Channel'))
+        for name in ('Clip.mp4', 'Clip.f137.mp4.part', os.path.join('Channel', 'Clip.mp4')):
+            with open(os.path.join(work, name), 'w') as f:
+                f.write('new')
+        promoted = output_paths.promote_job(work, d)
+        with open(os.path.join(d, 'Clip.mp4')) as f:
+            old = f.read()
+        left = sorted(os.listdir(d))
+    assert [os.path.relpath(p, d) for p in promoted] == [os.path.join('Channel', 'Clip.mp4'), 'Clip_2.mp4']
+    assert old == 'old'
+    assert left == ['Channel', 'Clip.mp4', 'Clip_2.mp4']  # Work dir and leftovers removed
+    print("   ✓ Finished files promoted into subfolders, nothing overwritten, work dir removed")
+
+
+def test_parallel_same_title_downloads():
+    service = new_service()
+    results = []
+    with tempfile.TemporaryDirectory() as d:
+        # Two different videos, same title, same folder, at the same time
+        threads = [threading.Thread(target=lambda n=n: results.append(service.download(
+            f'https://fake.test/v{n}?title=Same&merge=1&steps=10&interval=0.02', d, 'high', 'mp4', False,
+            lambda _: None))) for n in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(20)
+        files = sorted(os.listdir(d))
+    assert len(results) == 2 and all(ok for ok, _ in results)
+    assert files == ['Same.mp4', 'Same_2.mp4']
+    print("   ✓ Same-title videos downloaded in parallel kept both files")
+
+
+def test_playlist_template_with_fields():
+    service = new_service()
+    with tempfile.TemporaryDirectory() as d:
+        ok, _ = service.download('https://fake.test/v?title=Song', d, 'high', 'mp4', False, lambda _: None,
+                                 template='playlist', fields={'playlist_title': 'Mix', 'playlist_index': 3})
+        ok2, _ = service.download('https://fake.test/w?title=Song&uploader=Band', d, 'high', 'mp4', False,
+                                  lambda _: None, template='uploader')
+        files = sorted(os.path.relpath(os.path.join(root, n), d) for root, _, names in os.walk(d) for n in names)
+    assert ok and ok2
+    assert files == [os.path.join('Band', 'Song.mp4'), os.path.join('Mix', '003 - Song.mp4')]
+    print("   ✓ Playlist and uploader templates create their subfolders")
+
+
+def test_sweep_reclaims_orphans():
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    with tempfile.TemporaryDirectory() as d:
+        def job(name, **data):
+            work = output_paths.job_dir(d, name)
+            os.makedirs(work)
+            with open(os.path.join(work, 'Clip.f137.mp4.part'), 'wb') as f:
+                f.write(b'x')
+            if data:
+                output_paths.write_job_file(work, host=socket.gethostname(), started=time.time(), **data)
+            return work
+
+        crashed = job('crashed', pid=dead.pid)
+        running = job('other instance', pid=os.getppid())
+        staged = job('finished', pid=dead.pid, finished=True)
+        fresh = job('being created')
+        legacy = job('no job file')
+        os.utime(legacy, (time.time() - 3600,) * 2)
+        ours = output_paths.job_dir(d, 'ours')
+        output_paths.claim_job(ours, url='https://fake.test/v')  # First claim here sweeps the folder
+        assert not os.path.exists(crashed) and not os.path.exists(legacy)
+        assert all(os.path.isdir(w) for w in (running, staged, fresh, ours))
+        assert output_paths.sweep(d) == 0  # Own job left alone
+        assert output_paths.read_job_file(ours)['pid'] == os.getpid()
+        output_paths.release_job(ours)
+        assert not os.path.exists(ours)
+    print("   ✓ Work dirs of dead owners swept; running, finished and own jobs kept")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Output Paths")
+    print("=" * 60)
+    test_templates_and_prefill()
+    test_reserve_path_is_atomic()
+    test_promote_job_keeps_existing_files()
+    test_parallel_same_title_downloads()
+    test_playlist_template_with_fields()
+    test_sweep_reclaims_orphans()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,121 @@
+"""
+Tests time-range and chapter downloads (no network required)
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sections
+from dedup import DedupIndex
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import ALREADY_DOWNLOADED, YtDlpService
+
+# A three-hour stream: one step (1 KiB written) per 10 seconds of video
+STREAM = 'https://fake.test/stream?title=Live&duration=10800&steps=1080&size=1GiB&interval=0&chapters=Intro,Talk,Outro'
+
+
+def new_service(**kwargs):
+    return YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0), **kwargs)
+
+
+def test_parse_and_describe():
+    specs = sections.parse(' 1:00:00-1:02:00, -90, 2:50:00-, intro ')
+    assert specs == ('*3600-3720', '*0-90', '*10200-inf', '(?i)intro')
+    assert sections.section_args(specs[:1]) == ['--download-sections', '*3600-3720']
+    assert sections.describe(specs) == "1:00:00–1:02:00, 0:00–1:30, 2:50:00–fim, intro"
+    assert sections.parse('') == ()
+    for bad in ('2:00-1:00', '-'):
+        try:
+            sections.parse(bad)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
+    print("   ✓ Ranges and chapter names parsed into yt-dlp section specs")
+
+
+def test_fraction_for_estimates():
+    info = {'duration': 600, 'chapters': [{'title': 'Intro', 'start_time': 0, 'end_time': 60},
+                                          {'title': 'Main', 'start_time': 60, 'end_time': 600}]}
+    assert sections.fraction((), info) == 1.0
+    assert sections.fraction(sections.parse('0:30-1:30'), info) == 0.1
+    assert sections.fraction(sections.parse('intro, 9:00-'), info) == 0.2
+    assert sections.fraction(sections.parse('intro'), {'duration': 600}) is None  # Chapters not loaded yet
+    assert sections.fraction(sections.parse('1:00-2:00'), {}) is None
+    print("   ✓ Size estimates scale with the selected share of the video")
+
+
+def test_clip_costs_clip_length():
+    with tempfile.TemporaryDirectory() as d:
+        ok, msg = new_service().download(STREAM, d, 'high', 'mp4', False, lambda _: None,
+                                         sections=sections.parse('1:00:00-1:02:00'))
+        assert ok, msg
+        files = os.listdir(d)
+        size = os.path.getsize(os.path.join(d, files[0]))
+    assert files == ['Live_01-00-00.mp4']
+    assert size == 12 * 1024  # 2 of 180 minutes: 12 of 1080 steps fetched
+    print("   ✓ Two-minute clip of a three-hour stream fetched only its fragments")
+
+
+def test_chapters_one_file_each():
+    with tempfile.TemporaryDirectory() as d:
+        ok, msg = new_service().download(STREAM, d, 'high', 'mp4', False, lambda _: None,
+                                         sections=sections.parse('intro, OUTRO'))
+        files = sorted(os.listdir(d))
+    assert ok, msg
+    assert files == ['Live_Intro.mp4', 'Live_Outro.mp4']
+    print("   ✓ Selected chapters saved as separate files")
+
+
+def test_stderr_progress_is_not_a_stall():
+    service = new_service(stall_timeout=0.3, max_restarts=0)
+    with tempfile.TemporaryDirectory() as d:
+        # ~1.2s of ffmpeg-style stats on stderr, nothing on stdout
+        ok, msg = service.download('https://fake.test/v?title=Clip&steps=60&interval=0.1', d, 'high', 'mp4',
+                                   False, lambda _: None, sections=sections.parse('0:00-0:12'))
+    assert ok, msg
+    assert service.metrics.counter('stalls_total') == 0
+    print("   ✓ Section download reporting only on stderr was not killed as stalled")
+
+
+def test_sections_reused_as_a_set():
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        first, second, third = (os.path.join(d, name) for name in ('first', 'second', 'third'))
+        service = new_service(dedup=DedupIndex(os.path.join(d, 'dedup.json')))
+        ranges = sections.parse('1:00:00-1:02:00, 2:00:00-2:01:00')
+        assert service.download(STREAM, first, 'high', 'mp4', False, lambda _: None, sections=ranges)[0]
+        names = sorted(os.listdir(first))
+        assert names == ['Live_01-00-00.mp4', 'Live_02-00-00.mp4']
+        os.environ['FAKE_YTDLP_LOG'] = log
+        try:
+            ok, msg = service.download(STREAM, second, 'high', 'mp4', False, lambda _: None, sections=ranges)
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        assert ok and msg == ALREADY_DOWNLOADED
+        assert not os.path.exists(log)  # yt-dlp not started
+        assert sorted(os.listdir(second)) == names
+        assert all(os.path.samefile(os.path.join(first, n), os.path.join(second, n)) for n in names)
+        # One file of each copy gone: nothing complete to reuse, downloaded again
+        for folder in (first, second):
+            os.remove(os.path.join(folder, names[1]))
+        ok, msg = service.download(STREAM, third, 'high', 'mp4', False, lambda _: None, sections=ranges)
+        assert ok and msg != ALREADY_DOWNLOADED
+        assert sorted(os.listdir(third)) == names
+    print("   ✓ Section job reused into another folder with every section file, or downloaded again")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Sections")
+    print("=" * 60)
+    test_parse_and_describe()
+    test_fraction_for_estimates()
+    test_clip_costs_clip_length()
+    test_chapters_one_file_each()
+    test_stderr_progress_is_not_a_stall()
+    test_sections_reused_as_a_set()
+    print("\n✓ ALL TESTS PASSED")
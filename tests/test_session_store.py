@@ -0,0 +1,100 @@
+"""
+Tests the cookie jar / yt-dlp cache shared across jobs (no network required)
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from session_store import SessionStore
+from ytdlp_service import AsyncYtDlpService, YtDlpService
+
+
+def cookie_names(store):
+    return sorted(c.name for c in store.cookies())
+
+
+def test_run_copies_are_merged():
+    with tempfile.TemporaryDirectory() as d:
+        store = SessionStore(d)
+        with store.process_args() as first, store.process_args() as second:
+            assert first[:2] == ['--cache-dir', store.cache_dir] and first[3] != second[3]
+            # Two processes each rewrite their own copy; neither loses the other's cookie
+            for args, name in ((first, 'a'), (second, 'b')):
+                with open(args[3], 'a', encoding='utf-8') as f:
+                    f.write(f".example.org\tTRUE\t/\tFALSE\t4102444800\t{name}\t1\n")
+        assert cookie_names(store) == ['a', 'b']
+        with store.process_args() as args:
+            with open(args[3], encoding='utf-8') as f:
+                assert '\ta\t1' in f.read()  # Next run starts with the saved cookies
+            with open(args[3], 'a', encoding='utf-8') as f:
+                f.write(".example.org\tTRUE\t/\tFALSE\t4102444800\ta\t2\n")
+        assert [c.value for c in store.cookies() if c.name == 'a'] == ['2']  # Newer value wins
+        assert os.listdir(os.path.join(d, 'runs')) == []
+    print("   ✓ Per-process jar copies merged back, newest value wins, copies removed")
+
+
+def test_parallel_jobs_share_session():
+    with tempfile.TemporaryDirectory() as d:
+        log = os.path.join(d, 'calls.jsonl')
+        out = os.path.join(d, 'out')
+        os.makedirs(out)
+        store = SessionStore(os.path.join(d, 'session'))
+        service = YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, session=store,
+                               host_limiter=HostLimiter(rate=0, max_connections=8))
+        os.environ['FAKE_YTDLP_LOG'] = log
+        results = []
+        try:
+            threads = [threading.Thread(target=lambda n=n: results.append(service.download(
+                f'https://fake.test/v{n}?steps=5&cookie=c{n}=x', out, 'high', 'mp4', False, lambda _: None)))
+                for n in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(20)
+            info, error = service.fetch_info('https://fake.test/meta?cookie=meta=y')
+        finally:
+            del os.environ['FAKE_YTDLP_LOG']
+        with open(log, encoding='utf-8') as f:
+            calls = [json.loads(line) for line in f]
+        names = cookie_names(store)
+    assert len(results) == 6 and all(ok for ok, _ in results) and info, error
+    assert names == ['c0', 'c1', 'c2', 'c3', 'c4', 'c5', 'meta']
+    assert all(call[call.index('--cache-dir') + 1] == store.cache_dir for call in calls)
+    print(f"   ✓ {len(calls)} parallel processes shared the cache dir; every cookie kept")
+
+
+def test_async_service_uses_session():
+    with tempfile.TemporaryDirectory() as d:
+        store = SessionStore(d)
+        service = AsyncYtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, session=store,
+                                    host_limiter=HostLimiter(rate=0))
+        out = os.path.join(d, 'out')
+        os.makedirs(out)
+
+        async def run():
+            info, _ = await service.fetch_info('https://fake.test/a?cookie=a=1')
+            ok, _ = await service.download('https://fake.test/b?steps=2&cookie=b=1', out, 'high', 'mp4', False)
+            return info, ok
+
+        info, ok = asyncio.run(run())
+        assert info and ok
+        assert cookie_names(store) == ['a', 'b']
+    print("   ✓ Async metadata and downloads share the same jar")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Session Store")
+    print("=" * 60)
+    test_run_copies_are_merged()
+    test_parallel_jobs_share_session()
+    test_async_service_uses_session()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,76 @@
+"""
+Stress test: a yt-dlp that floods stderr must not deadlock a download (no network required)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ytdlp_service
+from fake_ytdlp import FAKE_YTDLP
+from ytdlp_service import AsyncYtDlpService, StderrTail, YtDlpService
+
+FLOOD_MB = 20
+# ~FLOOD_MB of warnings on stderr, far more than a pipe buffer holds,
+# interleaved with progress on stdout
+FLOOD_URL = f"https://fake.test/flood?steps=10&flood={FLOOD_MB}"
+
+
+def test_tail_is_bounded():
+    tail = StderrTail(max_chars=1000)
+    tail.feed("ERROR: first\n")
+    for i in range(10000):
+        tail.feed(f"WARNING: line {i}\n")
+    tail.feed("no newline " * 1000)  # Endless partial line
+    tail.close()
+    assert len(tail.text()) <= 2 * 1000
+    assert tail.text().splitlines()[-1].endswith("no newline ")
+    assert tail.last_error() == "first"
+    assert tail.total > 100_000
+    print("   ✓ Ring buffer keeps the tail and the last ERROR line")
+
+
+def test_thread_service_survives_flood():
+    # Fails on the last step, after almost all of the flood
+    url = FLOOD_URL + "&fail_at=95&error=[generic] fragment 42 not found, unable to continue"
+    result = []
+    with tempfile.TemporaryDirectory() as d:
+        t = threading.Thread(target=lambda: result.append(
+            YtDlpService(ytdlp_cmd=FAKE_YTDLP).download(url, d, 'high', 'mp4', False, lambda _: None)))
+        start = time.monotonic()
+        t.start()
+        t.join(timeout=60)
+    assert not t.is_alive(), "download deadlocked on a full stderr pipe"
+    assert result == [(False, "Erro no download: [generic] fragment 42 not found, unable to continue")]
+    print(f"   ✓ Thread service: {FLOOD_MB} MB of stderr drained in {time.monotonic() - start:.1f}s")
+
+
+def test_async_service_survives_flood():
+    ytdlp_service.PROGRESS_INTERVAL, interval = 0, ytdlp_service.PROGRESS_INTERVAL
+
+    async def run(d):
+        progress = []
+        result = await asyncio.wait_for(
+            AsyncYtDlpService(ytdlp_cmd=FAKE_YTDLP).download(FLOOD_URL, d, 'high', 'mp4', False, progress.append), 60)
+        return result, progress
+
+    with tempfile.TemporaryDirectory() as d:
+        (ok, msg), progress = asyncio.run(run(d))
+    ytdlp_service.PROGRESS_INTERVAL = interval
+    assert ok and len([e for e in progress if e['status'] == 'downloading']) == 10
+    assert progress[-1] == {'status': 'processing', 'conversion': 'direct'}
+    print("   ✓ Async service: progress kept flowing during the flood")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing stderr draining")
+    print("=" * 60)
+    test_tail_is_bounded()
+    test_thread_service_survives_flood()
+    test_async_service_survives_flood()
+    print("\n✓ ALL TESTS PASSED")
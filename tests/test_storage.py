@@ -0,0 +1,125 @@
+"""
+Tests the destination pre-flight check, the write probe and scratch staging (no network required)
+"""
+import errno
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import output_paths
+import storage
+from fake_ytdlp import FAKE_YTDLP
+from host_limiter import HostLimiter
+from metrics import MetricsRegistry
+from ytdlp_service import YtDlpService
+
+
+def test_write_probe():
+    with tempfile.TemporaryDirectory() as d:
+        speed = storage.write_speed(d, size=2 * 1024 * 1024, use_cache=False)
+        assert speed and speed > 0
+        assert storage.write_speed(d) == speed  # Reused within PROBE_TTL
+        assert os.listdir(d) == []  # Probe file removed
+    assert storage.write_speed('/nonexistent/dir', use_cache=False) is None
+    print(f"   ✓ Write probe measured {speed / 1e6:.0f} MB/s and cleaned up")
+
+
+def test_preflight():
+    with tempfile.TemporaryDirectory() as d:
+        check = storage.preflight(d, [100, 200, 300], workers=2)
+        assert check['ok'] and not check['stage']
+        # Two merges at once: the two largest items need room twice
+        assert check['needed'] == int(600 * 1.1) + int(500 * 1.1)
+        assert not storage.preflight(d, [10 ** 18], workers=1)['ok']
+        slow = storage.preflight(d, [100], slow_speed=float('inf'))
+        assert slow['slow']
+    assert storage.should_stage(5e6, 200e6)
+    assert not storage.should_stage(5e6, 8e6)  # Scratch not clearly faster
+    assert not storage.should_stage(100e6, 500e6)  # Destination fast enough
+    assert not storage.should_stage(None, 500e6)
+    print("   ✓ Free space compared with the batch plus merge headroom; staging only when it pays off")
+
+
+def test_staged_download_moves_in_background():
+    with tempfile.TemporaryDirectory() as dest, tempfile.TemporaryDirectory() as scratch:
+        staging = storage.Staging(scratch, metrics=MetricsRegistry())
+        service = YtDlpService(metrics=MetricsRegistry(), ytdlp_cmd=FAKE_YTDLP, host_limiter=HostLimiter(rate=0),
+                               staging=staging)
+        seen_in_dest = []
+        ok, msg = service.download('https://fake.test/v?title=Clip&merge=1&steps=5', dest, 'high', 'mp4', False,
+                                   lambda _: seen_in_dest.append(os.listdir(dest)), staged=True)
+        assert ok, msg
+        assert staging.wait(10)
+        files, left = os.listdir(dest), os.listdir(scratch)
+        # Staging is decided per job: another job for the same folder writes there directly
+        assert service.download('https://fake.test/w?title=Other&steps=2', dest, 'high', 'mp4', False, lambda _: None)[0]
+        assert staging.pending() == 0 and os.listdir(scratch) == []
+        assert sorted(os.listdir(dest)) == ['Clip.mp4', 'Other.mp4']
+    assert all(listing == [] for listing in seen_in_dest)  # Nothing written to the slow drive while downloading
+    assert files == ['Clip.mp4'] and left == []
+    assert staging.metrics.histogram('move_seconds')['count'] == 1
+    print("   ✓ Staged job downloaded in scratch, then moved to the destination; other jobs are not staged")
+
+
+def test_cross_device_move_and_recovery():
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if 'scratch' in src and not src.endswith('.tmp'):  # Job file updates stay on one drive
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real_replace(src, dst)
+
+    with tempfile.TemporaryDirectory() as dest, tempfile.TemporaryDirectory(suffix='scratch') as scratch:
+        # A finished staged job left behind by a previous run
+        work = output_paths.job_dir(scratch, 'job')
+        os.makedirs(work)
+        with open(os.path.join(work, 'Left.mp4'), 'wb') as f:
+            f.write(b'x' * 1000)
+        output_paths.write_job_file(work, output_path=dest, finished=True)
+        staging = storage.Staging(scratch, metrics=MetricsRegistry())
+        os.replace = replace
+        try:
+            assert staging.recover() == 1
+            assert staging.wait(10)
+        finally:
+            os.replace = real_replace
+        files, left = os.listdir(dest), os.listdir(scratch)
+        size = os.path.getsize(os.path.join(dest, 'Left.mp4'))
+    assert files == ['Left.mp4'] and size == 1000 and left == []
+    print("   ✓ Interrupted move resumed on start; copy-then-rename across drives")
+
+
+def test_undeliverable_staged_job_expires():
+    with tempfile.TemporaryDirectory() as scratch:
+        def finished(name, age):
+            work = output_paths.job_dir(scratch, name)
+            os.makedirs(work)
+            with open(os.path.join(work, 'Clip.mp4'), 'wb') as f:
+                f.write(b'x')
+            output_paths.write_job_file(work, output_path=os.path.join(scratch, 'unplugged'), finished=True)
+            stamp = time.time() - age
+            os.utime(os.path.join(work, output_paths.JOB_FILE), (stamp, stamp))
+            return work
+
+        old = finished('old', output_paths.UNDELIVERED_AGE + 60)
+        recent = finished('recent', 60)
+        staging = storage.Staging(scratch, metrics=MetricsRegistry())
+        assert staging.recover() == 0  # Destination missing: nothing to move
+        assert output_paths.sweep(scratch) == 1
+        assert not os.path.exists(old) and os.path.isdir(recent)  # The drive may still come back
+    print("   ✓ Finished staged jobs whose destination stays missing are deleted after a while")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Storage")
+    print("=" * 60)
+    test_write_probe()
+    test_preflight()
+    test_staged_download_moves_in_background()
+    test_cross_device_move_and_recovery()
+    test_undeliverable_staged_job_expires()
+    print("\n✓ ALL TESTS PASSED")
@@ -0,0 +1,98 @@
+"""
+Tests the local thumbnail cache against a local HTTP server (no internet required)
+"""
+import base64
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thumbnails
+from thumbnails import ThumbnailCache, pick_thumbnail
+
+hits = []
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        hits.append(self.path)
+        body = self.path.encode() * 500  # ~ a few KB, unique per path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_pick_thumbnail():
+    flat = [
+        {'url': 'a', 'width': 168, 'height': 94},
+        {'url': 'b', 'width': 336, 'height': 188},
+        {'url': 'c', 'width': 1280, 'height': 720},
+    ]
+    assert pick_thumbnail(flat, 80, 45) == 'a'
+    assert pick_thumbnail(flat, 180, 100) == 'c'
+    assert pick_thumbnail(flat[:2], 180, 100) == 'b'  # Nothing covers: largest available
+    yt = 'https://i.ytimg.com/vi/abc/maxresdefault.jpg'
+    assert pick_thumbnail(yt, 80, 45) == 'https://i.ytimg.com/vi/abc/mqdefault.jpg'
+    assert pick_thumbnail(yt, 180, 100) == 'https://i.ytimg.com/vi/abc/hqdefault.jpg'
+    assert pick_thumbnail([], 80, 45) is None
+    print("   ✓ Smallest covering thumbnail is chosen")
+
+
+def test_fetch_once_and_persist():
+    server, base = start_server()
+    hits.clear()
+    with tempfile.TemporaryDirectory() as d:
+        cache = ThumbnailCache(d)
+        url = base + '/vi/one.jpg'
+        # Concurrent rows asking for the same image share one fetch
+        with ThreadPoolExecutor(8) as ex:
+            results = list(ex.map(lambda _: cache.get(url, 80, 45), range(8)))
+        assert len(set(results)) == 1 and results[0]
+        assert hits == ['/vi/one.jpg']
+        cache.flush()
+
+        # A new instance (next app start) reads from disk
+        cache2 = ThumbnailCache(d)
+        assert cache2.get(url, 80, 45) == results[0]
+        assert len(hits) == 1
+        if thumbnails.Image is None:
+            assert base64.b64decode(results[0]) == b'/vi/one.jpg' * 500
+    server.shutdown()
+    print("   ✓ Each image fetched once, reused across instances")
+
+
+def test_eviction():
+    server, base = start_server()
+    with tempfile.TemporaryDirectory() as d:
+        cache = ThumbnailCache(d, max_bytes=20_000)
+        for i in range(10):
+            assert cache.get(f"{base}/vi/img{i:02d}.jpg", 80, 45)
+        assert cache.total_bytes() <= 20_000
+        blobs = [f for _, _, files in os.walk(d) for f in files if f.endswith('.jpg')]
+        assert len(blobs) == len(cache._index)
+    server.shutdown()
+    print("   ✓ Cache stays under its size cap")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing Thumbnail Cache")
+    print("=" * 60)
+    test_pick_thumbnail()
+    test_fetch_once_and_persist()
+    test_eviction()
+    print("\n✓ ALL TESTS PASSED")
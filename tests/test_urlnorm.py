@@ -0,0 +1,114 @@
+"""
+Tests URL canonicalization and single-flighting (no network required)
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight
+from urlnorm import cache_key, canonicalize
+
+
+def test_youtube_spellings():
+    spellings = [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://youtu.be/dQw4w9WgXcQ',
+        'https://youtu.be/dQw4w9WgXcQ?si=abc',
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10',
+        'https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ',
+        'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+        'https://www.youtube.com/embed/dQw4w9WgXcQ',
+    ]
+    assert {canonicalize(u) for u in spellings} == {('youtube', 'dQw4w9WgXcQ')}
+
+    mixed = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLabc'
+    assert canonicalize(mixed) == ('youtube:playlist', 'PLabc')
+    assert canonicalize(mixed, no_playlist=True) == ('youtube', 'dQw4w9WgXcQ')
+    assert canonicalize('not a url') is None
+    print("   ✓ YouTube URL spellings map to one (extractor, id)")
+
+
+def test_other_sites_and_fallback():
+    assert canonicalize('https://vimeo.com/76979871') == ('vimeo', '76979871')
+    # Unknown sites fall back to a normalized URL
+    a = cache_key('https://EXAMPLE.com/video.mp4?b=2&a=1&utm_source=x#frag')
+    b = cache_key('https://example.com/video.mp4?a=1&b=2')
+    assert a == b == 'https://example.com/video.mp4?a=1&b=2'
+    print("   ✓ Other extractors matched offline, URL fallback normalized")
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'info'
+
+    with ThreadPoolExecutor(8) as ex:
+        results = list(ex.map(lambda _: flight.do('youtube:x', slow_fetch), range(8)))
+    assert len(calls) == 1
+    assert [r for r, _ in results] == ['info'] * 8
+    assert sum(1 for _, shared in results if not shared) == 1
+    assert not flight.in_flight('youtube:x')
+
+    # Sequential calls run again (no result caching here)
+    flight.do('youtube:x', slow_fetch)
+    assert len(calls) == 2
+    print("   ✓ Concurrent identical calls run once and share the result")
+
+
+def test_single_flight_errors_and_cancel():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError('boom')
+
+    errors = []
+
+    def follower():
+        started.wait()
+        try:
+            flight.do('k', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=follower)
+    t.start()
+    try:
+        flight.do('k', failing)
+    except ValueError:
+        pass
+    t.join()
+    assert len(errors) == 1
+
+    # A waiting caller can give up without stopping the leader
+    cancel = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do('k', lambda: time.sleep(0.3) or 'done'))
+    leader.start()
+    time.sleep(0.05)
+    threading.Timer(0.05, cancel.set).start()
+    assert flight.do('k', lambda: 'never', cancel_event=cancel) == (None, True)
+    assert flight.in_flight('k')
+    leader.join()
+    print("   ✓ Leader errors reach followers, followers can cancel")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Testing URL Canonicalization")
+    print("=" * 60)
+    test_youtube_spellings()
+    test_other_sites_and_fallback()
+    test_single_flight_shares_result()
+    test_single_flight_errors_and_cancel()
+    print("\n✓ ALL TESTS PASSED")
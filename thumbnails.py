@@ -0,0 +1,252 @@
+"""
+Local thumbnail cache.
+
+Each thumbnail is fetched once, downscaled to the size it is displayed at
+and stored on disk under the hash of its content. Rows then receive a few
+KB of base64 instead of the client fetching full-size remote images.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional: without Pillow we rely on picking a small variant
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Thumbnails are stored at this multiple of the display size (HiDPI screens)
+SCALE = 2
+JPEG_QUALITY = 80
+INDEX_SAVE_INTERVAL = 2.0  # Seconds between index writes while rows resolve
+
+# i.ytimg.com serves fixed-size variants of every thumbnail
+_YT_THUMB_RE = re.compile(r'^(https?://i\d?\.ytimg\.com/vi(?:_webp)?/[^/]+/)[^/?]+')
+_YT_VARIANTS = [(120, 90, 'default.jpg'), (320, 180, 'mqdefault.jpg'), (480, 360, 'hqdefault.jpg')]
+
+
+def pick_thumbnail(thumbnails, width, height):
+    """
+    Picks the smallest thumbnail URL that still covers width x height
+    (times SCALE). Accepts an info dict 'thumbnails' list or a single URL.
+    """
+    need_w, need_h = width * SCALE, height * SCALE
+    if isinstance(thumbnails, str):
+        thumbnails = [{'url': thumbnails}]
+    candidates = [t for t in (thumbnails or []) if t.get('url')]
+    if not candidates:
+        return None
+
+    sized = [t for t in candidates if t.get('width') and t.get('height')]
+    covering = [t for t in sized if t['width'] >= need_w and t['height'] >= need_h]
+    if covering:
+        return min(covering, key=lambda t: t['width'] * t['height'])['url']
+    if sized:
+        return max(sized, key=lambda t: t['width'] * t['height'])['url']
+
+    # Unsized list (e.g. a bare 'thumbnail'): ask YouTube for a smaller variant
+    url = candidates[-1]['url']
+    m = _YT_THUMB_RE.match(url)
+    if m and '_webp' not in m.group(1):
+        for w, h, name in _YT_VARIANTS:
+            if w >= need_w and h >= need_h * 4 // 3:  # 4:3 variants are letterboxed
+                return m.group(1) + name
+    return url
+
+
+def downscale(data, width, height):
+    """Crops/resizes image bytes to width x height (times SCALE) as JPEG. Needs Pillow."""
+    if Image is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.fit(img.convert('RGB'), (width * SCALE, height * SCALE), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        logger.error(f"Thumbnail downscale failed: {e}")
+        return data
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes=50 * 1024 * 1024, max_workers=4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Event, so concurrent rows fetch a URL once
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = set()
+        os.makedirs(cache_dir, exist_ok=True)
+        # key -> {'digest', 'size', 'used'}
+        self._index = self._load_index()
+        self._index_saved_at = 0
+        self._index_dirty = False
+
+    # --- Public API ---
+
+    def get(self, url, width, height):
+        """Returns base64 JPEG of url at the display size, fetching it once. None on failure."""
+        data = self.get_bytes(url, width, height)
+        return base64.b64encode(data).decode('ascii') if data else None
+
+    def get_async(self, thumbnails, width, height, callback):
+        """Resolves the best thumbnail on a worker and calls callback(base64 or None)."""
+        url = pick_thumbnail(thumbnails, width, height)
+        if not url:
+            return
+
+        def run():
+            callback(self.get(url, width, height))
+
+        with self._lock:
+            future = self._executor.submit(run)
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+
+    def cancel_pending(self):
+        """Cancels fetches that have not started (e.g. the screen was replaced)."""
+        with self._lock:
+            futures = list(self._futures)
+        for f in futures:
+            f.cancel()
+        self.flush()
+
+    def get_bytes(self, url, width, height):
+        key = self._key(url, width, height)
+        while True:
+            with self._lock:
+                data = self._read(key)
+                if data is not None:
+                    return data
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            # Another thread is fetching the same image
+            event.wait()
+
+        try:
+            data = self._fetch(url)
+            if data:
+                data = downscale(data, width, height)
+                with self._lock:
+                    self._store(key, data)
+            return data
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def flush(self):
+        """Writes the index if it has unsaved changes."""
+        with self._lock:
+            if self._index_dirty:
+                self._save_index()
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(e['size'] for e in self._index.values())
+
+    # --- Internals ---
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    @staticmethod
+    def _key(url, width, height):
+        return hashlib.sha1(f"{url}|{width}x{height}".encode()).hexdigest()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + '.jpg')
+
+    def _fetch(self, url):
+        try:
+            req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+            with urllib.request.urlopen(req, timeout=15) as resp:
+                return resp.read()
+        except Exception as e:
+            logger.error(f"Thumbnail fetch failed for {url}: {e}")
+            return None
+
+    def _read(self, key):
+        entry = self._index.get(key)
+        if not entry:
+            return None
+        try:
+            with open(self._blob_path(entry['digest']), 'rb') as f:
+                data = f.read()
+        except OSError:
+            del self._index[key]
+            return None
+        entry['used'] = time.time()
+        return data
+
+    def _store(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):  # Identical images share one blob
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self._index[key] = {'digest': digest, 'size': len(data), 'used': time.time()}
+        self._evict()
+        self._index_dirty = True
+        if time.time() - self._index_saved_at >= INDEX_SAVE_INTERVAL:
+            self._save_index()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits max_bytes."""
+        refs = {}
+        sizes = {}
+        for e in self._index.values():
+            refs[e['digest']] = refs.get(e['digest'], 0) + 1
+            sizes[e['digest']] = e['size']
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]['used']):
+            if total <= self.max_bytes:
+                break
+            del self._index[key]
+            digest = entry['digest']
+            refs[digest] -= 1
+            if refs[digest]:
+                continue  # Blob still referenced by another key
+            total -= sizes[digest]
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp = self._index_path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(tmp, self._index_path)
+            self._index_saved_at = time.time()
+            self._index_dirty = False
+        except OSError as e:
+            logger.error(f"Failed to save thumbnail index: {e}")
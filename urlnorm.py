@@ -0,0 +1,99 @@
+"""
+URL canonicalization.
+
+Maps the many spellings of a video URL (youtu.be/X, youtube.com/watch?v=X&t=10,
+m.youtube.com/..., /shorts/X) to one (extractor, id) pair without launching
+yt-dlp. YouTube is matched with a fast path; other sites use the URL patterns
+of yt-dlp's own extractors (in-process, no network). Caches, single-flighting
+and download bookkeeping are keyed by cache_key() so equivalent URLs share
+one entry.
+"""
+import functools
+import logging
+import re
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+_YT_HOSTS = re.compile(r'^(?:www\.|m\.|music\.)?(?:youtube\.com|youtube-nocookie\.com)$')
+_YT_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_YT_PATH_ID = re.compile(r'^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})(?:[/?#]|$)')
+# Query parameters that never change what is downloaded
+_TRACKING_PARAMS = re.compile(r'^(?:utm_\w+|si|feature|fbclid|gclid|pp)$')
+
+
+def _youtube(parts, no_playlist):
+    host = (parts.hostname or '').lower()
+    query = parse_qs(parts.query)
+    video = None
+    if host == 'youtu.be':
+        video = parts.path.lstrip('/').split('/')[0]
+    elif _YT_HOSTS.match(host):
+        if parts.path == '/watch':
+            video = (query.get('v') or [''])[0]
+        else:
+            m = _YT_PATH_ID.match(parts.path)
+            video = m.group(1) if m else None
+    else:
+        return None
+
+    playlist = (query.get('list') or [''])[0]
+    # Without --no-playlist, yt-dlp resolves watch?v=X&list=Y as the playlist
+    if playlist and (not no_playlist or not video):
+        return 'youtube:playlist', playlist
+    if video and _YT_ID.match(video):
+        return 'youtube', video
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _from_extractors(url):
+    """Matches url against yt-dlp's extractor patterns (no network)."""
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+    except ImportError:
+        return None
+    try:
+        for ie in gen_extractor_classes():
+            if ie.ie_key() == 'Generic' or not ie.suitable(url):
+                continue
+            temp_id = ie.get_temp_id(url)
+            return (ie.ie_key().lower(), temp_id) if temp_id else None
+    except Exception as e:
+        logger.error(f"Extractor matching failed for {url}: {e}")
+    return None
+
+
+def canonicalize(url, no_playlist=False):
+    """
+    Returns (extractor, id) for url, or None when it cannot be resolved
+    offline. no_playlist: the URL is downloaded with --no-playlist, so
+    watch?v=X&list=Y refers to the video X.
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    if parts.scheme not in ('http', 'https'):
+        return None
+    return _youtube(parts, no_playlist) or _from_extractors(normalize_url(url))
+
+
+def normalize_url(url):
+    """Lower-cases scheme/host, drops the fragment and tracking parameters."""
+    parts = urlsplit(url.strip())
+    query = [(k, v) for k, v in parse_qs(parts.query, keep_blank_values=True).items()
+             if not _TRACKING_PARAMS.match(k)]
+    query = urlencode(sorted((k, v[0]) for k, v in query))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+
+def cache_key(url, no_playlist=False):
+    """Stable key for url: 'extractor:id', or the normalized URL as a fallback."""
+    canonical = canonicalize(url, no_playlist)
+    if canonical:
+        return f"{canonical[0]}:{canonical[1]}"
+    try:
+        return normalize_url(url)
+    except ValueError:
+        return url
@@ -0,0 +1,1139 @@
+"""
+yt-dlp backend (subprocess based, no UI code).
+
+YtDlpService is the thread-based API used by the download manager: every
+call blocks its thread while the yt-dlp child runs. AsyncYtDlpService is
+the asyncio-native variant built on asyncio.create_subprocess_exec: progress
+is an async iterator of events, concurrency is bounded by a Semaphore and a
+download is cancelled by cancelling its task, so hundreds of queued jobs cost
+one event loop instead of one blocked OS thread each. Both build the same
+commands, parse output the same way and can share one metadata cache.
+"""
+import asyncio
+import codecs
+import collections
+import contextlib
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import dedup
+import output_paths
+import urlnorm
+from format_plan import VIDEO_SELECTORS, audio_selector, conversion_event, selector, video_selector
+from sections import section_args, section_template
+from host_limiter import POLL_INTERVAL, HostLimiter
+from metrics import REGISTRY, DownloadTimer
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+YTDLP_ENV = 'VIDEO_DOWNLOADER_YTDLP'  # Command that runs yt-dlp, e.g. "/usr/bin/yt-dlp"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+FFMPEG_DIR = os.path.dirname(os.path.abspath(__file__))  # Local ffmpeg (setup_ffmpeg)
+INFO_TIMEOUT = 90  # Hard timeout for a metadata process (seconds)
+PROGRESS_INTERVAL = 0.5  # Min seconds between progress events per download
+STDERR_TAIL_CHARS = 32 * 1024  # stderr kept per download for error reporting
+STDERR_CHUNK = 4096
+STALL_TIMEOUT = 60  # Seconds without progress before a download is restarted
+MAX_STALL_RESTARTS = 2
+CANCELLED = "Cancelado pelo usuário"
+ALREADY_DOWNLOADED = "Já baixado (arquivo reaproveitado)"
+CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+
+
+# --- Commands & output parsing (shared by both services) ---
+
+def default_ytdlp_cmd():
+    """yt-dlp command prefix: VIDEO_DOWNLOADER_YTDLP if set, else the bundled module."""
+    configured = os.environ.get(YTDLP_ENV)
+    if configured:
+        return shlex.split(configured, posix=os.name != 'nt')
+    return [sys.executable, "-m", "yt_dlp"]
+
+
+def info_cmd(url, ytdlp=None):
+    # --flat-playlist: Get playlist metadata without full video info (faster)
+    return [
+        *(ytdlp or default_ytdlp_cmd()),
+        "-J",
+        "--flat-playlist",
+        "--socket-timeout", "30",
+        "--user-agent", USER_AGENT,
+        "--source-address", "0.0.0.0",  # Force IPv4
+        url
+    ]
+
+
+def batch_info_cmd(urls, ytdlp=None):
+    return [
+        *(ytdlp or default_ytdlp_cmd()),
+        "-j",  # One JSON object per line, per video
+        "--no-playlist",
+        "--ignore-errors",  # A private/removed item must not fail the batch
+        "--socket-timeout", "30",
+        "--user-agent", USER_AGENT,
+        "--source-address", "0.0.0.0",  # Force IPv4
+        *urls
+    ]
+
+
+def download_cmd(url, output_path, quality, codec, is_audio, *, rate_limit=None, template=None, ytdlp=None, sections=None,
+                 normalize=False, format_id=None, transcode=False):
+    """
+    template: yt-dlp output template relative to output_path (output_paths.DEFAULT_TEMPLATE if None)
+    sections: section specs (see sections.parse); only those parts are downloaded
+    normalize: audio batch mode, the audio stream is kept as downloaded (loudnorm.Normalizer encodes it)
+    format_id: formats planned from the metadata (see format_plan), e.g. '137+140'; the quality
+               selector remains as the fallback
+    transcode: "max quality" mode, the best streams whatever their codec, re-encoded to `codec` if
+               needed (default: streams the container holds as they are are preferred, see format_plan)
+    """
+    out_tmpl = os.path.join(output_path, template or output_paths.DEFAULT_TEMPLATE)
+    cmd = [
+        *(ytdlp or default_ytdlp_cmd()),
+        "--no-playlist",
+        "--socket-timeout", "15",
+        "--user-agent", USER_AGENT,
+        "--source-address", "0.0.0.0",
+        "--restrict-filenames",
+        "--continue",  # Resume .part files (restart after a stall, retries)
+        "--newline",  # Important for progress parsing
+        "--progress",
+        "--ffmpeg-location", FFMPEG_DIR,  # Force local ffmpeg
+        "-o", out_tmpl,
+        url
+    ]
+
+    # Format/Quality Setup
+    if is_audio:
+        cmd.extend(["-f", selector(format_id, audio_selector(codec, transcode or normalize))])
+        if not normalize:
+            cmd.extend(["--extract-audio", "--audio-format", codec])
+            if quality == 'low': cmd.extend(["--audio-quality", "128K"])
+            elif quality == 'high': cmd.extend(["--audio-quality", "320K"])
+    else:
+        if quality in VIDEO_SELECTORS:
+            cmd.extend(["-f", selector(format_id, video_selector(quality, codec, transcode))])
+        if transcode:
+            # Merged into whatever container fits the streams, then converted only if it is not `codec`
+            cmd.extend(["--recode-video", codec])
+        else:
+            cmd.extend(["--merge-output-format", codec])
+
+    if rate_limit:
+        cmd.extend(["--limit-rate", str(int(rate_limit))])
+    cmd.extend(section_args(sections))
+    return cmd
+
+
+def parse_progress(line):
+    """'[download]  23.5% of 10MiB at 1MiB/s ETA 00:08' -> progress dict, else None."""
+    if not line.startswith('[download]') or '%' not in line:
+        return None
+    parts = line.split()
+    data = {'status': 'downloading'}
+    for i, part in enumerate(parts):
+        if '%' in part:
+            data['_percent_str'] = part
+        if part == 'of' and i < len(parts) - 1:
+            data['_total_bytes_str'] = parts[i + 1]
+        if '/s' in part:
+            data['_speed_str'] = part
+        if part == 'ETA' and i < len(parts) - 1:
+            data['_eta_str'] = parts[i + 1]
+    return data
+
+
+def is_processing(line):
+    return '[ExtractAudio]' in line or '[Merger]' in line or '[VideoConvertor]' in line
+
+
+def output_file(line):
+    """Path of a file yt-dlp announces it writes (destinations, merge target), else None."""
+    # [download] Destination: D:\...\file.f137.mp4
+    if line.startswith('[download] Destination:'):
+        return line[len('[download] Destination:'):].strip()
+    # [download] D:\...\file.mp4 has already been downloaded
+    if line.startswith('[download]') and line.endswith('has already been downloaded'):
+        return line[len('[download]'):-len('has already been downloaded')].strip()
+    # [Merger] Merging formats into "D:\...\file.mp4"
+    if line.startswith('[Merger] Merging formats into'):
+        start, end = line.find('"'), line.rfind('"')
+        return line[start + 1:end] if start < end else None
+    return None
+
+
+def last_error(stderr):
+    """yt-dlp's last 'ERROR:' line, without the prefix."""
+    errors = [l for l in (stderr or '').splitlines() if l.startswith('ERROR:')]
+    return errors[-1][len('ERROR:'):].strip() if errors else None
+
+
+class StderrTail:
+    """
+    Bounded buffer for a child's stderr: keeps only the last max_chars (in
+    whole lines) plus the last 'ERROR:' line, so memory stays constant no
+    matter how many warnings yt-dlp prints.
+    """
+
+    def __init__(self, max_chars=STDERR_TAIL_CHARS):
+        self.max_chars = max_chars
+        self.total = 0  # Characters seen
+        self._lines = collections.deque()
+        self._size = 0
+        self._partial = ''
+        self._error = None
+        self._lock = threading.Lock()
+
+    def feed(self, chunk):
+        with self._lock:
+            self.total += len(chunk)
+            lines = (self._partial + chunk).split('\n')
+            # An endless line without newlines is truncated to its tail
+            self._partial = lines.pop()[-self.max_chars:]
+            for line in lines:
+                self._add(line.rstrip('\r'))
+
+    def close(self):
+        with self._lock:
+            if self._partial:
+                self._add(self._partial)
+                self._partial = ''
+
+    def text(self):
+        with self._lock:
+            return '\n'.join(list(self._lines) + ([self._partial] if self._partial else []))
+
+    def last_error(self):
+        """yt-dlp's last 'ERROR:' line, without the prefix."""
+        return self._error[len('ERROR:'):].strip() if self._error else None
+
+    def _add(self, line):
+        line = line[:self.max_chars]
+        if line.startswith('ERROR:'):
+            self._error = line
+        self._lines.append(line)
+        self._size += len(line) + 1
+        while self._size > self.max_chars and len(self._lines) > 1:
+            self._size -= len(self._lines.popleft()) + 1
+
+
+def drain(stream, tail):
+    """Reads a text stream to EOF into tail (run on its own thread)."""
+    # read1 on the byte buffer returns whatever arrived: a text read(n) waits for n
+    # characters, and ffmpeg's progress stats are short lines without newlines
+    decoder = codecs.getincrementaldecoder(stream.encoding or 'utf-8')(errors='replace')
+    try:
+        for chunk in iter(lambda: stream.buffer.read1(STDERR_CHUNK), b''):
+            tail.feed(decoder.decode(chunk))
+    except (OSError, ValueError):
+        pass  # Pipe closed under us (process killed)
+    tail.feed(decoder.decode(b'', final=True))
+    tail.close()
+
+
+async def drain_async(stream, tail):
+    """Reads an asyncio StreamReader to EOF into tail."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        chunk = await stream.read(STDERR_CHUNK)
+        if not chunk:
+            break
+        tail.feed(decoder.decode(chunk))
+    tail.feed(decoder.decode(b'', final=True))
+    tail.close()
+
+
+@contextlib.contextmanager
+def session_ytdlp(ytdlp, session):
+    """Yields `ytdlp` plus the session's --cache-dir / --cookies options (merged back on exit)."""
+    if session is None:
+        yield ytdlp
+        return
+    with session.process_args() as args:
+        yield ytdlp + args
+
+
+@contextlib.asynccontextmanager
+async def session_ytdlp_async(ytdlp, session):
+    """
+    session_ytdlp for coroutines: the session's lock, cookie copy and merge run
+    in a worker thread, so a process holding the session never stalls the loop.
+    """
+    manager = session_ytdlp(ytdlp, session)
+    entering = asyncio.ensure_future(asyncio.to_thread(manager.__enter__))
+    try:
+        args = await asyncio.shield(entering)
+    except asyncio.CancelledError:
+        # The thread still enters: let it finish, then release what it took
+        await asyncio.wait([entering])
+        if not entering.cancelled() and entering.exception() is None:
+            await asyncio.to_thread(manager.__exit__, None, None, None)
+        raise
+    try:
+        yield args
+    except BaseException as e:
+        if not await asyncio.to_thread(manager.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await asyncio.to_thread(manager.__exit__, None, None, None)
+
+
+class StallWatchdog:
+    """
+    Kills a download process that shows no activity for `timeout` seconds
+    (e.g. a dead CDN edge: yt-dlp blocks on the socket and prints nothing,
+    so the stdout loop would wait forever). Call activity() on progress.
+    If `tail` (the process's StderrTail) is given, stderr output counts as activity too.
+    """
+
+    def __init__(self, process, timeout, tail=None):
+        self.process = process
+        self.timeout = timeout
+        self.tail = tail
+        self._tail_seen = 0
+        self.stalled = False
+        self._last = time.monotonic()
+        self._paused = False
+        self._done = threading.Event()
+
+    def start(self):
+        if self.timeout:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def activity(self):
+        self._last = time.monotonic()
+
+    def pause(self):
+        """Stops watching (post-processing prints nothing while it works)."""
+        self._paused = True
+
+    def stop(self):
+        self._done.set()
+
+    def _run(self):
+        while not self._done.wait(min(1.0, self.timeout / 4)):
+            if self.tail is not None and self.tail.total != self._tail_seen:
+                self._tail_seen = self.tail.total
+                self.activity()
+            if not self._paused and time.monotonic() - self._last > self.timeout:
+                logger.warning(f"No progress for {self.timeout:g}s, killing stalled process")
+                self.stalled = True
+                try:
+                    self.process.kill()
+                except OSError:
+                    pass
+                return
+
+
+class MetadataCache:
+    """Info dicts keyed by canonical URL (see urlnorm), with a TTL."""
+
+    def __init__(self, ttl=300, metrics=None):
+        self.ttl = ttl
+        self.metrics = metrics or REGISTRY
+        self._entries = {}  # canonical key -> (timestamp, info_dict)
+
+    def get(self, url, no_playlist=False):
+        cached = self._entries.get(urlnorm.cache_key(url, no_playlist))
+        if cached:
+            timestamp, info = cached
+            if time.time() - timestamp < self.ttl:
+                self.metrics.inc('cache_hits_total')
+                return info
+        self.metrics.inc('cache_misses_total')
+        return None
+
+    def peek(self, url, no_playlist=False):
+        """Like get, without counting a hit or miss (lookups that are not metadata requests)."""
+        cached = self._entries.get(urlnorm.cache_key(url, no_playlist))
+        if cached and time.time() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+
+    def put(self, url, info, no_playlist=False):
+        self._entries[urlnorm.cache_key(url, no_playlist)] = (time.time(), info)
+
+
+# --- Jobs (shared by both services) ---
+
+class DownloadJob:
+    """
+    One download request as both services run it. The yt-dlp command, the
+    work dir / in-flight key and the dedup key are all derived here, so an
+    option added to downloads reaches both services and every key at once.
+
+    The options are keyword-only; the services, DownloadTask and
+    DownloadManager.submit pass them through as **options, so this is the
+    one list of them:
+    rate_limit: max bytes/s for this download (None = unlimited)
+    template: output_paths.TEMPLATES key or yt-dlp output template (may contain subfolders)
+    fields: values yt-dlp cannot know for this item, e.g. playlist_index / playlist_title
+    sections: section specs (sections.parse); only those time ranges / chapters are fetched,
+              one file per section
+    normalize: audio batch mode; the best audio stream is downloaded as is, then normalized to the
+               target loudness and encoded to `codec` by the normalizer (ignored without one)
+    format_id: explicit formats planned for this quality (format_plan.plan), instead of
+               yt-dlp evaluating the quality selector again
+    transcode: "max quality" mode; the best streams are fetched whatever their codec and
+               re-encoded to `codec` when the container cannot hold them. By default the
+               presets prefer streams that are only remuxed
+    staged: download and merge in the staging scratch dir, then move the files to output_path
+            in the background (slow destinations, see storage.preflight; ignored without staging)
+    """
+
+    def __init__(self, url, output_path, quality, codec, is_audio, *, rate_limit=None, template=None, fields=None,
+                 sections=None, normalize=False, format_id=None, transcode=False, staged=False):
+        self.url = url
+        self.output_path = output_path
+        self.quality = quality
+        self.codec = codec
+        self.is_audio = is_audio
+        self.rate_limit = rate_limit
+        self.sections = tuple(sections or ())
+        self.normalize = normalize
+        self.format_id = format_id
+        self.transcode = transcode
+        self.staged = staged  # Work dir in the service's scratch dir (same files, so not part of the key)
+        self.out_tmpl = output_paths.prefill(template, fields)
+        if self.sections:
+            self.out_tmpl = section_template(self.out_tmpl)
+        url_key = urlnorm.cache_key(url, no_playlist=True)
+        # Same key, same files: such jobs share one process and one work dir
+        self.key = (url_key, os.path.abspath(output_path), quality, codec, is_audio, self.out_tmpl, self.sections,
+                    normalize, transcode)
+        self.dedup_key = dedup.job_key(url_key, quality, codec, is_audio, self.sections, normalize, transcode)
+
+    def cmd(self, work_dir, ytdlp=None):
+        """yt-dlp command writing this job into work_dir."""
+        return download_cmd(self.url, work_dir, self.quality, self.codec, self.is_audio, rate_limit=self.rate_limit,
+                            template=self.out_tmpl, ytdlp=ytdlp, sections=self.sections, normalize=self.normalize,
+                            format_id=self.format_id, transcode=self.transcode)
+
+    def describe(self):
+        return f"{self.url} -> {self.output_path}" + (f" (sections {', '.join(self.sections)})" if self.sections else "")
+
+
+class ConversionReport:
+    """How a job's output was made, from yt-dlp's post-processing lines (see format_plan.conversion_event)."""
+
+    def __init__(self):
+        self.kind = None  # 'remux' / 'transcode' once a post-processor reported
+        self._source = None  # Last file downloaded
+
+    def feed(self, line, path):
+        event = conversion_event(line, self._source)
+        if event and self.kind != 'transcode':
+            self.kind = event  # One encoded stream makes the job a transcode
+        if path and line.startswith('[download]'):
+            self._source = path
+
+    def result(self, normalize=False):
+        """'direct' (kept as downloaded), 'remux' or 'transcode'; the normalizer always encodes."""
+        return 'transcode' if normalize else self.kind or 'direct'
+
+
+class _BaseService:
+    """Job bookkeeping shared by YtDlpService and AsyncYtDlpService (attributes set by their __init__)."""
+
+    def _new_job(self, url, output_path, quality, codec, is_audio, **options):
+        """DownloadJob for a request; normalize only applies to audio, with a normalizer."""
+        options['normalize'] = bool(options.get('normalize') and is_audio and self.normalizer is not None)
+        return DownloadJob(url, output_path, quality, codec, is_audio, **options)
+
+    def _report_host(self, url, output, success):
+        if self.host_limiter.report(url, output, success):
+            self.metrics.inc('throttled_total')
+
+    def _ytdlp(self):
+        """with self._ytdlp() as ytdlp: command prefix for one process, with the shared session."""
+        return session_ytdlp(self.ytdlp_cmd, self.session)
+
+    def _work_dir(self, job):
+        """Work dir of a job: in the destination, or in the scratch dir if the job is staged."""
+        staged = job.staged and self.staging is not None
+        return output_paths.job_dir(self.staging.scratch_dir if staged else job.output_path, job.key)
+
+    def _finish_job(self, job, work_dir, report):
+        """
+        Promotes and indexes a finished job's files (a staged job is handed to the background mover,
+        an audio batch job to the normalizer, which encodes and then promotes it).
+        Returns how the output was made (ConversionReport.result).
+        """
+        record = None if self.dedup is None else lambda files: self.dedup.record(job.dedup_key, files, job.output_path)
+        if job.normalize:
+            self.normalizer.submit(work_dir, job.output_path, job.codec, job.quality, on_done=record)
+            logger.info(f"Audio downloaded, queued loudness normalization ({job.codec})")
+        elif job.staged and self.staging is not None:
+            self.staging.submit(work_dir, job.output_path, on_done=record)
+            logger.info(f"Download finished in scratch, queued move to {job.output_path}")
+        else:
+            files = output_paths.promote_job(work_dir, job.output_path)
+            logger.info(f"Download finished successfully: {files}")
+            if record:
+                record(files)
+        conversion = report.result(job.normalize)
+        self.metrics.inc('conversions_total', kind=conversion)
+        logger.info(f"Output {conversion}: {job.url}")
+        return conversion
+
+    def _reuse(self, job):
+        """
+        True if the file of an identical earlier download was placed in the job's destination
+        instead, or the destination already holds the file this job would write.
+        """
+        if self.dedup is None or not self.dedup.reuse(job.dedup_key, job.output_path):
+            existing = self._existing_file(job)
+            if existing is None:
+                return False
+            logger.info(f"Already in the destination: {existing}")
+            if self.dedup is not None:
+                # Named after this video's id: seeds the index (file saved before it existed)
+                self.dedup.record(job.dedup_key, [existing], job.output_path)
+        self.metrics.inc('dedup_hits_total')
+        self.metrics.inc('downloads_total', 1, result='reused')
+        return True
+
+    def _existing_file(self, job):
+        """
+        The file this job would write, if it is already in the destination (needs cached metadata).
+        Only names that carry the video id count: under a title-only template the file may be
+        another video with the same title, which must get its own download (and "_2" name).
+        """
+        if job.sections:
+            return None  # One file per section, named by yt-dlp while cutting
+        info = self.cache.peek(job.url, no_playlist=True) or self.cache.peek(job.url)
+        if not info or not info.get('id') or '%(id)' not in job.out_tmpl:
+            return None
+        path = output_paths.expected_path(job.output_path, job.out_tmpl, info, job.codec)
+        if not path or output_paths.safe_name(info['id']) not in os.path.basename(path):
+            return None
+        return path if os.path.isfile(path) else None
+
+
+# --- Thread-based service ---
+
+class YtDlpService(_BaseService):
+    def __init__(self, cache=None, metrics=None, ytdlp_cmd=None, stall_timeout=STALL_TIMEOUT,
+                 max_restarts=MAX_STALL_RESTARTS, host_limiter=None, session=None, staging=None, dedup=None,
+                 normalizer=None):
+        """
+        cache: MetadataCache (a new one by default)
+        metrics: MetricsRegistry receiving timings and counters (metrics.REGISTRY by default)
+        ytdlp_cmd: command prefix that runs yt-dlp (see default_ytdlp_cmd), e.g. a fake for tests
+        stall_timeout: seconds without progress before a download is killed and resumed (0 = never)
+        max_restarts: resumes after a stall before the download fails
+        host_limiter: HostLimiter shared by every process this service starts
+        session: SessionStore whose cookies and yt-dlp cache every process shares (None = each starts cold)
+        staging: storage.Staging; a job submitted with staged=True downloads into its scratch dir (others
+                 write to their destination, as without staging)
+        dedup: dedup.DedupIndex; a download already done (same video and format) is reused, not repeated
+        normalizer: loudnorm.Normalizer; encodes audio downloads requested with normalize=True
+        """
+        self.ytdlp_cmd = list(ytdlp_cmd or default_ytdlp_cmd())
+        self.host_limiter = host_limiter or HostLimiter()
+        self.session = session
+        self.staging = staging
+        self.dedup = dedup
+        self.normalizer = normalizer
+        self.stall_timeout = stall_timeout
+        self.max_restarts = max_restarts
+        self.metrics = metrics or REGISTRY
+        self.cache = cache or MetadataCache(metrics=self.metrics)
+        self._info_flight = SingleFlight()  # One fetch per canonical URL at a time
+        self._download_flight = SingleFlight()  # One download per (video, destination, format)
+        self._download_hooks = {}  # Download key -> [(progress_hook, cancel_event)] of every caller sharing it
+        self._hooks_lock = threading.Lock()
+        self._active_downloads = {}  # Track active downloads: {cancel_event: process}
+        self._active_lock = threading.Lock()
+
+    def cancel(self):
+        """Cancels every running download (and callers waiting on a shared one)."""
+        with self._hooks_lock:
+            waiting = [event for callers in self._download_hooks.values() for _, event in callers]
+        with self._active_lock:
+            events = list(self._active_downloads)
+        for event in waiting + events:
+            self.terminate(event)
+
+    def terminate(self, cancel_event):
+        """Cancels the download started with `cancel_event`."""
+        cancel_event.set()
+        with self._active_lock:
+            proc = self._active_downloads.get(cancel_event)
+        if proc and proc.poll() is None:  # Process still running
+            try:
+                logger.info("Attempting to kill process...")
+                proc.terminate()
+                logger.info("Process termination signal sent.")
+            except Exception as e:
+                logger.error(f"Error killing process: {e}")
+
+    def get_cached(self, url, no_playlist=False):
+        """Returns cached metadata for url (or an equivalent URL) if still fresh, else None."""
+        return self.cache.get(url, no_playlist)
+
+    def get_info_cached(self, url, use_cache=True):
+        """Fetches metadata with caching support."""
+        if use_cache:
+            cached_info = self.get_cached(url)
+            if cached_info is not None:
+                logger.debug(f"Using cached info for: {url}")
+                return cached_info
+        return self.get_info(url)
+
+    def get_info(self, url):
+        """Fetches metadata using subprocess. Supports single videos and playlists."""
+        return self.fetch_info(url)[0]
+
+    def fetch_info(self, url):
+        """
+        Like get_info, but returns (info, error message) and caches the result.
+        Concurrent calls for equivalent URLs share one yt-dlp process.
+        """
+        result, shared = self._info_flight.do(urlnorm.cache_key(url), lambda: self._fetch_info(url))
+        if shared:
+            logger.info(f"Shared in-flight info fetch for: {url}")
+        return result
+
+    def _wait_for_host(self, url, connection=False, cancel_event=None):
+        """Waits for url's host (rate limit / backoff, plus a connection slot for downloads)."""
+        start = time.monotonic()
+        acquired = self.host_limiter.acquire(url, connection, cancel_event)
+        self.metrics.observe('host_wait_seconds', time.monotonic() - start)
+        return acquired
+
+    def _fetch_info(self, url):
+        logger.info(f"Fetching info for: {url}")
+        process = None
+        self._wait_for_host(url)
+        start = time.monotonic()
+        try:
+            with self._ytdlp() as ytdlp:
+                process = subprocess.Popen(
+                    info_cmd(url, ytdlp),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    creationflags=CREATION_FLAGS
+                )
+                stdout, stderr = process.communicate(timeout=INFO_TIMEOUT)
+            self.metrics.observe('info_seconds', time.monotonic() - start)
+            self._report_host(url, stderr, process.returncode == 0)
+            return self._parse_info(url, process.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            logger.error("Timeout expired while fetching info.")
+            process.kill()
+            return None, "Tempo esgotado ao buscar informações"
+        except Exception as e:
+            logger.error(f"Exception in get_info: {e}")
+            logger.error(traceback.format_exc())
+            return None, str(e)
+
+    def _parse_info(self, url, returncode, stdout, stderr):
+        if returncode != 0:
+            # Common error: not a valid URL or private video
+            logger.error(f"yt-dlp failed with code {returncode}")
+            logger.error(f"Stderr: {stderr}")
+            return None, last_error(stderr) or f"yt-dlp falhou (código {returncode})"
+
+        info = json.loads(stdout)
+        if 'title' not in info and 'id' not in info and '_type' not in info:
+            logger.warning(f"Unexpected info format: {info.keys()}")
+        logger.info(f"Info extracted: {info.get('title', 'Unknown')} | Type: {info.get('_type', 'video')}")
+        self.cache.put(url, info)
+        return info, None
+
+    def get_info_batch(self, urls):
+        """
+        Fetches full metadata for several videos with a single yt-dlp process.
+        Results are stored in the metadata cache. Returns {url: info}; URLs
+        that failed are missing from the result.
+        """
+        logger.info(f"Fetching info batch ({len(urls)} items)")
+        results = {}
+        process = None
+        self._wait_for_host(urls[0])
+        try:
+            with self._ytdlp() as ytdlp:
+                process = subprocess.Popen(
+                    batch_info_cmd(urls, ytdlp),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    creationflags=CREATION_FLAGS
+                )
+                stdout, stderr = process.communicate(timeout=60 + 30 * len(urls))
+            self._report_host(urls[0], stderr, bool(stdout.strip()))
+        except subprocess.TimeoutExpired:
+            logger.error("Timeout expired while fetching info batch.")
+            process.kill()
+            return results
+        except Exception as e:
+            logger.error(f"Exception in get_info_batch: {e}")
+            return results
+
+        # Map results back to the requested URLs (by original_url, then canonical key)
+        by_key = {}
+        for line in stdout.splitlines():
+            try:
+                info = json.loads(line)
+            except ValueError:
+                continue
+            if info.get('original_url') in urls:
+                results[info['original_url']] = info
+            if info.get('id') and info.get('extractor_key'):
+                by_key[f"{info['extractor_key'].lower()}:{info['id']}"] = info
+        for url in urls:
+            if url not in results:
+                match = by_key.get(urlnorm.cache_key(url, no_playlist=True))
+                if match:
+                    results[url] = match
+
+        for url, info in results.items():
+            self.cache.put(url, info, no_playlist=True)
+
+        if len(results) < len(urls):
+            logger.error(f"Info batch resolved {len(results)}/{len(urls)} items. Stderr: {stderr[-2000:]}")
+        return results
+
+    def download(self, url, output_path, quality, codec, is_audio, progress_hook, cancel_event=None, **options):
+        """
+        Downloads using subprocess and parses progress.
+        cancel_event: threading.Event that cancels this download (see terminate)
+        options: keyword options of DownloadJob (rate_limit, template, fields, sections, normalize,
+                 format_id, transcode, staged)
+
+        progress_hook gets yt-dlp's progress and, once the job is done,
+        {'status': 'processing', 'conversion': 'remux' | 'transcode' | 'direct'}
+        (direct: the downloaded file was kept as is).
+
+        Concurrent requests for the same video, destination and format
+        (even through different URL spellings) share one process; every
+        caller receives its progress and result.
+        """
+        if cancel_event is None:
+            cancel_event = threading.Event()
+        job = self._new_job(url, output_path, quality, codec, is_audio, **options)
+        key = job.key
+        work_dir = self._work_dir(job)
+
+        with self._hooks_lock:
+            callers = self._download_hooks.setdefault(key, [])
+            callers.append((progress_hook, cancel_event))
+
+        def fan_out(data):
+            with self._hooks_lock:
+                hooks = [hook for hook, _ in callers]
+            for hook in hooks:
+                hook(data)
+
+        try:
+            while True:
+                result, shared = self._download_flight.do(
+                    key,
+                    lambda: self._download(job, fan_out, cancel_event, work_dir),
+                    cancel_event
+                )
+                if not shared:
+                    return result
+                if cancel_event.is_set():
+                    return False, CANCELLED
+                if result == (False, CANCELLED):
+                    continue  # The other caller cancelled; run it ourselves
+                logger.info(f"Shared in-flight download for: {url}")
+                return result
+        finally:
+            with self._hooks_lock:
+                callers.remove((progress_hook, cancel_event))
+                if not callers:
+                    self._download_hooks.pop(key, None)
+
+    def _download(self, job, progress_hook, cancel_event, work_dir):
+        url = job.url
+        logger.info(f"Starting download: {job.describe()}")
+        if self._reuse(job):
+            return True, ALREADY_DOWNLOADED
+
+        # Everything yt-dlp writes (.part, .ytdl, .fNNN formats) stays in the work dir, deleted unless promoted
+        output_paths.claim_job(work_dir, url=url, output_path=os.path.abspath(job.output_path))
+        timer = DownloadTimer(self.metrics)
+        report = ConversionReport()
+        result = 'failed'
+        done = False  # yt-dlp succeeded: the work dir holds finished files
+        restarts = 0
+
+        try:
+            while True:
+                if not self._wait_for_host(url, connection=True, cancel_event=cancel_event):
+                    return False, CANCELLED
+                try:
+                    with self._ytdlp() as ytdlp:
+                        # Written inside the job's work dir; promoted to output_path once finished
+                        returncode, stalled, stderr_tail = self._run_download(job.cmd(work_dir, ytdlp), progress_hook,
+                                                                              cancel_event, timer, report)
+                finally:
+                    self.host_limiter.release(url)
+                if cancel_event.is_set():
+                    return False, CANCELLED
+                if not stalled:
+                    # 429/403: later starts on this host back off (this failure is retried by the queue)
+                    self._report_host(url, stderr_tail.text(), returncode == 0)
+                    break
+                self.metrics.inc('stalls_total')
+                if restarts >= self.max_restarts:
+                    logger.error(f"Download stalled {restarts + 1} time(s), giving up: {url}")
+                    return False, f"Download travado (sem progresso por {self.stall_timeout:g}s)"
+                restarts += 1
+                self.metrics.inc('restarts_total')
+                logger.warning(f"Restarting stalled download ({restarts}/{self.max_restarts}), resuming from .part: {url}")
+
+            if returncode == 0:
+                done = True
+                conversion = self._finish_job(job, work_dir, report)
+                result = 'success'
+                progress_hook({'status': 'processing', 'conversion': conversion})
+                return True, "Download Completo"
+            logger.error(f"Download failed: {stderr_tail.text()}")
+            # Surface yt-dlp's last error line so callers can decide on retries
+            error = stderr_tail.last_error()
+            if error:
+                return False, f"Erro no download: {error}"
+            return False, "Erro no download (Ver log)"
+
+        except Exception as e:
+            logger.error(f"Exception during download: {e}")
+            return False, str(e)
+        finally:
+            if cancel_event.is_set():
+                result = 'cancelled'
+            output_paths.release_job(work_dir, keep=done)
+            timer.finish(result)
+
+    def _run_download(self, cmd, progress_hook, cancel_event, timer, report):
+        """
+        Runs one yt-dlp process to completion, cancel or stall; post-processing lines go to report.
+        Returns (returncode, stalled, stderr tail); returncode is None if cancelled.
+        """
+        last_update = 0  # Progress throttling (per download)
+        last_progress = None
+        stderr_tail = StderrTail()
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            creationflags=CREATION_FLAGS,
+            bufsize=1,  # Line buffered
+        )
+        # Sections are fetched by ffmpeg, which reports its progress on stderr only
+        watchdog = StallWatchdog(process, self.stall_timeout, stderr_tail if '--download-sections' in cmd else None)
+        try:
+            with self._active_lock:
+                self._active_downloads[cancel_event] = process
+            # Drain stderr concurrently: if it is only read after wait(), a
+            # child printing many warnings fills the pipe and blocks forever
+            stderr_thread = threading.Thread(target=drain, args=(process.stderr, stderr_tail), daemon=True)
+            stderr_thread.start()
+            watchdog.start()
+
+            # Read stdout line by line
+            for line in process.stdout:
+                line = line.strip()
+                if not line: continue
+
+                if cancel_event.is_set():
+                    process.terminate()
+                    try:
+                        process.wait(timeout=2)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                    return None, False, stderr_tail
+
+                path = output_file(line)
+                data = parse_progress(line)
+                processing = is_processing(line)
+                timer.on_line(data, path, processing)
+                report.feed(line, path)
+                if processing:
+                    watchdog.pause()  # ffmpeg may stay silent for minutes
+                if data is None:
+                    watchdog.activity()
+                elif (data.get('_percent_str'), data.get('_total_bytes_str')) != last_progress:
+                    # Only a moving byte counter counts as progress
+                    last_progress = (data.get('_percent_str'), data.get('_total_bytes_str'))
+                    watchdog.activity()
+
+                if data:
+                    # Throttle updates: max 2 per second
+                    current_time = time.time()
+                    if current_time - last_update < PROGRESS_INTERVAL:
+                        continue
+                    last_update = current_time
+                    progress_hook(data)
+
+                if processing:
+                    progress_hook({'status': 'processing'})
+
+            process.wait()
+            stderr_thread.join(timeout=5)
+            return process.returncode, watchdog.stalled, stderr_tail
+        finally:
+            watchdog.stop()
+            with self._active_lock:
+                self._active_downloads.pop(cancel_event, None)
+
+
+# --- Asyncio service ---
+
+class AsyncYtDlpService(_BaseService):
+    def __init__(self, max_concurrency=4, cache=None, metrics=None, ytdlp_cmd=None, stall_timeout=STALL_TIMEOUT,
+                 max_restarts=MAX_STALL_RESTARTS, host_limiter=None, session=None, staging=None, dedup=None,
+                 normalizer=None):
+        """
+        max_concurrency: max yt-dlp processes running at once (others wait on the semaphore)
+        cache: MetadataCache, e.g. shared with a YtDlpService
+        metrics: MetricsRegistry (metrics.REGISTRY by default)
+        ytdlp_cmd: command prefix that runs yt-dlp (see default_ytdlp_cmd)
+        stall_timeout / max_restarts: as in YtDlpService
+        host_limiter: HostLimiter, e.g. shared with a YtDlpService
+        session: SessionStore, e.g. shared with a YtDlpService
+        staging: storage.Staging, e.g. shared with a YtDlpService
+        dedup: dedup.DedupIndex, e.g. shared with a YtDlpService
+        normalizer: loudnorm.Normalizer, e.g. shared with a YtDlpService
+        """
+        self.ytdlp_cmd = list(ytdlp_cmd or default_ytdlp_cmd())
+        self.host_limiter = host_limiter or HostLimiter()
+        self.session = session
+        self.staging = staging
+        self.dedup = dedup
+        self.normalizer = normalizer
+        self.stall_timeout = stall_timeout
+        self.max_restarts = max_restarts
+        self.metrics = metrics or REGISTRY
+        self.cache = cache or MetadataCache(metrics=self.metrics)
+        self.max_concurrency = max_concurrency
+        self._semaphore = None  # Created lazily, inside the running loop
+        self._info_tasks = {}  # canonical key -> Task fetching it (single-flight)
+
+    def _ytdlp_async(self):
+        """async with self._ytdlp_async() as ytdlp: _ytdlp without blocking the event loop."""
+        return session_ytdlp_async(self.ytdlp_cmd, self.session)
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def fetch_info(self, url, use_cache=True):
+        """Returns (info, error message). Concurrent calls for equivalent URLs share one process."""
+        if use_cache:
+            cached = self.cache.get(url)
+            if cached is not None:
+                return cached, None
+        key = urlnorm.cache_key(url)
+        task = self._info_tasks.get(key)
+        if task is None:
+            task = self._info_tasks[key] = asyncio.ensure_future(self._fetch_info(url))
+            task.add_done_callback(lambda _: self._info_tasks.pop(key, None))
+        # Shielded: one caller giving up does not cancel the others' fetch
+        return await asyncio.shield(task)
+
+    async def get_info(self, url):
+        return (await self.fetch_info(url))[0]
+
+    async def _wait_for_host(self, url, connection=False):
+        """Async counterpart of YtDlpService._wait_for_host (polls, never blocks the loop)."""
+        start = time.monotonic()
+        while True:
+            acquired, wait = self.host_limiter.try_acquire(url, connection)
+            if acquired:
+                break
+            await asyncio.sleep(min(wait, POLL_INTERVAL))
+        self.metrics.observe('host_wait_seconds', time.monotonic() - start)
+
+    async def _fetch_info(self, url):
+        logger.info(f"Fetching info for: {url} (async)")
+        async with self.semaphore:
+            await self._wait_for_host(url)
+            start = time.monotonic()
+            async with self._ytdlp_async() as ytdlp:
+                process = await asyncio.create_subprocess_exec(
+                    *info_cmd(url, ytdlp),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    creationflags=CREATION_FLAGS
+                )
+                try:
+                    stdout, stderr = await asyncio.wait_for(process.communicate(), INFO_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.error("Timeout expired while fetching info.")
+                    process.kill()
+                    await process.wait()
+                    return None, "Tempo esgotado ao buscar informações"
+                except asyncio.CancelledError:
+                    process.kill()
+                    await process.wait()
+                    raise
+            self.metrics.observe('info_seconds', time.monotonic() - start)
+
+        stdout = stdout.decode('utf-8', errors='replace')
+        stderr = stderr.decode('utf-8', errors='replace')
+        self._report_host(url, stderr, process.returncode == 0)
+        if process.returncode != 0:
+            logger.error(f"yt-dlp failed with code {process.returncode}")
+            logger.error(f"Stderr: {stderr}")
+            return None, last_error(stderr) or f"yt-dlp falhou (código {process.returncode})"
+        try:
+            info = json.loads(stdout)
+        except ValueError as e:
+            return None, str(e)
+        self.cache.put(url, info)
+        return info, None
+
+    async def progress(self, url, output_path, quality, codec, is_audio, **options):
+        """
+        Async iterator of progress events for one download (options: keyword options of DownloadJob):
+        {'status': 'queued'} while waiting for a slot, then 'downloading'
+        (throttled) and 'processing' events, the conversion report of a
+        finished job ({'status': 'processing', 'conversion': ...}), and finally
+        {'status': 'finished', 'success': bool, 'message': str}.
+        Cancelling the consuming task kills the process and removes partial files.
+        """
+        yield {'status': 'queued'}
+        job = self._new_job(url, output_path, quality, codec, is_audio, **options)
+        sections = job.sections
+        if await asyncio.to_thread(self._reuse, job):
+            yield {'status': 'finished', 'success': True, 'message': ALREADY_DOWNLOADED}
+            return
+        async with self.semaphore:
+            logger.info(f"Starting download: {job.describe()} (async)")
+            work_dir = self._work_dir(job)
+            # File work (sweep of the folder's work dirs, promotion, hashing) runs off the event loop
+            await asyncio.to_thread(output_paths.claim_job, work_dir, url=url, output_path=os.path.abspath(output_path))
+            last_update = 0
+            result = None  # Set once the run ends; None in the finally block means cancelled
+            timer = DownloadTimer(self.metrics)
+            report = ConversionReport()
+            restarts = 0
+            process = stderr_task = None
+            holding_host = False
+            try:
+                while True:
+                    await self._wait_for_host(url, connection=True)
+                    holding_host = True
+                    async with self._ytdlp_async() as ytdlp:
+                        process = await asyncio.create_subprocess_exec(
+                            *job.cmd(work_dir, ytdlp),
+                            stdout=asyncio.subprocess.PIPE,
+                            stderr=asyncio.subprocess.PIPE,
+                            creationflags=CREATION_FLAGS
+                        )
+                        # Drain stderr concurrently so a chatty child never blocks on a full pipe
+                        stderr_tail = StderrTail()
+                        stderr_task = asyncio.ensure_future(drain_async(process.stderr, stderr_tail))
+                        stalled = processing_started = False
+                        last_progress = None
+                        last_activity = time.monotonic()
+                        stderr_seen = 0
+                        while True:
+                            # No deadline while post-processing: ffmpeg may stay silent for minutes
+                            timeout = None if processing_started or not self.stall_timeout else \
+                                max(0.0, last_activity + self.stall_timeout - time.monotonic())
+                            try:
+                                raw = await asyncio.wait_for(process.stdout.readline(), timeout)
+                            except asyncio.TimeoutError:
+                                if sections and stderr_tail.total != stderr_seen:
+                                    # Sections are fetched by ffmpeg, which reports its progress on stderr only
+                                    stderr_seen = stderr_tail.total
+                                    last_activity = time.monotonic()
+                                    continue
+                                stalled = True
+                                logger.warning(f"No progress for {self.stall_timeout:g}s, killing stalled process")
+                                process.kill()
+                                break
+                            if not raw:
+                                break
+                            line = raw.decode('utf-8', errors='replace').strip()
+                            if not line:
+                                continue
+                            path = output_file(line)
+                            data = parse_progress(line)
+                            processing = is_processing(line)
+                            processing_started = processing_started or processing
+                            timer.on_line(data, path, processing)
+                            report.feed(line, path)
+                            progress_key = data and (data.get('_percent_str'), data.get('_total_bytes_str'))
+                            if data is None or progress_key != last_progress:
+                                last_progress = progress_key or last_progress
+                                last_activity = time.monotonic()
+                            if data:
+                                now = time.monotonic()
+                                if now - last_update >= PROGRESS_INTERVAL:
+                                    last_update = now
+                                    yield data
+                            if processing:
+                                yield {'status': 'processing'}
+
+                        await process.wait()
+                        await stderr_task
+                    self.host_limiter.release(url)
+                    holding_host = False
+                    if not stalled:
+                        self._report_host(url, stderr_tail.text(), process.returncode == 0)
+                        break
+                    self.metrics.inc('stalls_total')
+                    if restarts >= self.max_restarts:
+                        result = 'failed'
+                        timer.finish(result)
+                        yield {'status': 'finished', 'success': False,
+                               'message': f"Download travado (sem progresso por {self.stall_timeout:g}s)"}
+                        return
+                    restarts += 1
+                    self.metrics.inc('restarts_total')
+                    logger.warning(f"Restarting stalled download ({restarts}/{self.max_restarts}), resuming from .part: {url}")
+
+                result = 'success' if process.returncode == 0 else 'failed'
+                timer.finish(result)
+                if process.returncode == 0:
+                    conversion = await asyncio.to_thread(self._finish_job, job, work_dir, report)
+                    yield {'status': 'processing', 'conversion': conversion}
+                    yield {'status': 'finished', 'success': True, 'message': "Download Completo"}
+                else:
+                    logger.error(f"Download failed: {stderr_tail.text()}")
+                    error = stderr_tail.last_error()
+                    message = f"Erro no download: {error}" if error else "Erro no download (Ver log)"
+                    yield {'status': 'finished', 'success': False, 'message': message}
+            finally:
+                if result is None:
+                    # Cancelled (task cancel or consumer closed the iterator)
+                    if process and process.returncode is None:
+                        process.terminate()
+                        try:
+                            await asyncio.wait_for(process.wait(), 2)
+                        except asyncio.TimeoutError:
+                            process.kill()
+                            await process.wait()
+                    if stderr_task:
+                        stderr_task.cancel()
+                    timer.finish('cancelled')
+                await asyncio.to_thread(output_paths.release_job, work_dir, keep=result == 'success')
+                if holding_host:
+                    self.host_limiter.release(url)
+
+    async def download(self, url, output_path, quality, codec, is_audio, progress_hook=None, **options):
+        """Awaitable counterpart of YtDlpService.download. Returns (success, message)."""
+        async for event in self.progress(url, output_path, quality, codec, is_audio, **options):
+            if event['status'] == 'finished':
+                return event['success'], event['message']
+            if progress_hook and event['status'] != 'queued':
+                progress_hook(event)
+        return False, CANCELLED